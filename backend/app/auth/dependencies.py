@@ -1,11 +1,21 @@
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordBearer
 from app.auth.jwt import decode_token
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/signin")
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
+def _authenticate(token: str, request: Request = None) -> str:
 	payload = decode_token(token, expected_type="access")
 	if not payload:
 		raise HTTPException(status_code=401, detail="Invalid token")
-	return payload["sub"]
\ No newline at end of file
+	if request is not None:
+		# get_read_db lo usa para elegir réplica o primario sin volver a decodificar el token
+		request.state.user = payload["sub"]
+	return payload["sub"]
+
+def get_current_user(token: str = Depends(oauth2_scheme), request: Request = None):
+	return _authenticate(token, request)
+
+async def get_current_user_async(token: str = Depends(oauth2_scheme), request: Request = None):
+	# Variante async: los endpoints async def no pasan por el threadpool para autenticar
+	return _authenticate(token, request)
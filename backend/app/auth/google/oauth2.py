@@ -1,15 +1,12 @@
 from authlib.integrations.starlette_client import OAuth
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
+from app.config import get_setting
 
 oauth = OAuth()
 
 oauth.register(
 	name="google",
-	client_id=os.getenv("GOOGLE_CLIENT_ID"),
-	client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
+	client_id=get_setting("GOOGLE_CLIENT_ID"),
+	client_secret=get_setting("GOOGLE_CLIENT_SECRET"),
 	server_metadata_url="https://accounts.google.com/.well-known/openid-configuration",
 	client_kwargs={"scope": "openid email profile"},
 )
\ No newline at end of file
@@ -2,16 +2,15 @@
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Literal, Callable, Dict, Any
 from jose import JWTError, jwt
-import os
-from dotenv import load_dotenv
 import uuid
 import logging
 
-load_dotenv()
+from app.config import get_setting
+
 logger = logging.getLogger(__name__)
 
 # Config
-SECRET_KEY = os.getenv("SECRET_KEY")
+SECRET_KEY = get_setting("SECRET_KEY")
 if not SECRET_KEY:
 	raise RuntimeError("SECRET_KEY no definido. Configure una clave segura en el entorno (ej. desde Vault).")
 
@@ -23,21 +22,30 @@ REFRESH_TOKEN_EXPIRE_DAYS = 7
 DEFAULT_AUDIENCE = "yourapp-client"
 ISSUER = "yourapp.example.com"  # fija el issuer de forma explícita
 
-# Hooks que debes implementar con tu storage (ej. Redis/DB)
+# Revocación por jti en app/auth/revocation.py (lista de revocados, no de emitidos)
 # signature: (jti: str) -> None
 def register_jti_in_store(jti: str, expires_at: datetime, token_type: str):
 	"""
-	Guarda jti con expiración; implementación depende de tu storage.
-	Ejemplo: Redis SET jti -> token metadata EX seconds
+	Emitir no escribe nada: solo se guardan los jti revocados, que son muchos menos.
 	"""
-	raise NotImplementedError
+	return None
 
 # signature: (jti: str) -> bool
 def is_jti_revoked(jti: str) -> bool:
 	"""
 	Comprueba si el jti ha sido revocado (devuelve True si revocado).
+	Casi siempre se responde con el filtro de Bloom en memoria, sin consultar el almacén.
+	"""
+	# Import diferido: app.auth.revocation arrastra los modelos y la capa de BD
+	from app.auth.revocation import get_revocation_store
+	return get_revocation_store().is_revoked(jti)
+
+def revoke_token(payload: Dict[str, Any]):
+	"""
+	Revoca el token ya decodificado hasta su exp.
 	"""
-	raise NotImplementedError
+	from app.auth.revocation import get_revocation_store
+	get_revocation_store().revoke(payload["jti"], float(payload["exp"]))
 
 def _now_utc() -> datetime:
 	return datetime.now(timezone.utc)
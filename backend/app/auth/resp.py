@@ -0,0 +1,233 @@
+import argparse
+import socket
+import socketserver
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.engine.url import make_url
+
+# Cliente mínimo del protocolo de Redis (RESP2) y un servidor local que entiende los
+# comandos que usa la lista de revocación, para desarrollo y tests sin instalar Redis:
+#
+#	python -m app.auth.resp --port 6380
+
+class RespError(Exception):
+	pass
+
+def encode_command(*args) -> bytes:
+	parts = [b"*%d\r\n" % len(args)]
+	for arg in args:
+		data = arg if isinstance(arg, bytes) else str(arg).encode()
+		parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+	return b"".join(parts)
+
+def read_reply(stream):
+	line = stream.readline()
+	if not line:
+		raise ConnectionError("Conexión RESP cerrada")
+	kind, rest = line[:1], line[1:-2]
+	if kind == b"+":
+		return rest.decode()
+	if kind == b"-":
+		raise RespError(rest.decode())
+	if kind == b":":
+		return int(rest)
+	if kind == b"$":
+		length = int(rest)
+		if length < 0:
+			return None
+		data = stream.read(length + 2)
+		return data[:-2].decode()
+	if kind == b"*":
+		length = int(rest)
+		if length < 0:
+			return None
+		return [read_reply(stream) for _ in range(length)]
+	raise RespError(f"Respuesta RESP no válida: {line!r}")
+
+class RespClient:
+	"""
+	Una conexión por cliente, serializada con un lock; reconecta una vez si se cae.
+	URL: redis://[:contraseña@]host:puerto[/db] (resp:// es equivalente).
+	"""
+	def __init__(self, url: str, timeout: float = 5.0):
+		parsed = make_url(url)
+		self.host = parsed.host or "127.0.0.1"
+		self.port = parsed.port or 6379
+		self.password = parsed.password
+		self.db = parsed.database
+		self.timeout = timeout
+		self._lock = threading.Lock()
+		self._sock = None
+		self._stream = None
+
+	def _connect(self):
+		self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+		self._stream = self._sock.makefile("rb")
+		if self.password:
+			self._call("AUTH", self.password)
+		if self.db:
+			self._call("SELECT", self.db)
+
+	def _call(self, *args):
+		self._sock.sendall(encode_command(*args))
+		return read_reply(self._stream)
+
+	def execute(self, *args):
+		with self._lock:
+			for attempt in (0, 1):
+				try:
+					if self._sock is None:
+						self._connect()
+					return self._call(*args)
+				except (OSError, ConnectionError):
+					self._close()
+					if attempt:
+						raise
+
+	def _close(self):
+		if self._sock is not None:
+			self._stream.close()
+			self._sock.close()
+		self._sock = self._stream = None
+
+	def close(self):
+		with self._lock:
+			self._close()
+
+class RespStandIn:
+	"""
+	Estado del servidor local: cadenas con caducidad (SET ... EX/EXAT, GET, EXISTS, DEL,
+	INCR) y conjuntos ordenados (ZADD, ZRANGEBYSCORE, ZREM). No persiste nada.
+	"""
+	def __init__(self, clock=time.time):
+		self.clock = clock
+		self._lock = threading.Lock()
+		self._strings: Dict[str, Tuple[str, Optional[float]]] = {}
+		self._zsets: Dict[str, Dict[str, float]] = {}
+
+	def _get(self, key: str) -> Optional[str]:
+		item = self._strings.get(key)
+		if item is None:
+			return None
+		value, expires_at = item
+		if expires_at is not None and expires_at <= self.clock():
+			del self._strings[key]
+			return None
+		return value
+
+	@staticmethod
+	def _bound(text: str) -> Tuple[float, bool]:
+		# "(5" excluye el 5; -inf y +inf como en Redis
+		exclusive = text.startswith("(")
+		return float(text[1:] if exclusive else text), exclusive
+
+	def execute(self, command: str, args: List[str]):
+		command = command.upper()
+		with self._lock:
+			if command == "PING":
+				return "PONG"
+			if command in ("AUTH", "SELECT"):
+				return "OK"
+			if command == "SET":
+				key, value, options = args[0], args[1], [arg.upper() for arg in args[2:]]
+				expires_at = None
+				if "EX" in options:
+					expires_at = self.clock() + float(args[2 + options.index("EX") + 1])
+				elif "EXAT" in options:
+					expires_at = float(args[2 + options.index("EXAT") + 1])
+				self._strings[key] = (value, expires_at)
+				return "OK"
+			if command == "GET":
+				return self._get(args[0])
+			if command == "EXISTS":
+				return sum(1 for key in args if self._get(key) is not None or key in self._zsets)
+			if command == "DEL":
+				return sum(1 for key in args if self._strings.pop(key, None) is not None or self._zsets.pop(key, None) is not None)
+			if command == "INCR":
+				value = int(self._get(args[0]) or 0) + 1
+				self._strings[args[0]] = (str(value), self._strings.get(args[0], (None, None))[1])
+				return value
+			if command == "ZADD":
+				zset = self._zsets.setdefault(args[0], {})
+				added = 0
+				for score, member in zip(args[1::2], args[2::2]):
+					added += member not in zset
+					zset[member] = float(score)
+				return added
+			if command == "ZREM":
+				zset = self._zsets.get(args[0], {})
+				return sum(1 for member in args[1:] if zset.pop(member, None) is not None)
+			if command == "ZRANGEBYSCORE":
+				(low, low_open), (high, high_open) = self._bound(args[1]), self._bound(args[2])
+				with_scores = any(arg.upper() == "WITHSCORES" for arg in args[3:])
+				members = sorted(self._zsets.get(args[0], {}).items(), key=lambda item: (item[1], item[0]))
+				reply = []
+				for member, score in members:
+					if (score > low if low_open else score >= low) and (score < high if high_open else score <= high):
+						reply.append(member)
+						if with_scores:
+							reply.append(repr(score) if score != int(score) else str(int(score)))
+				return reply
+		raise RespError(f"ERR unknown command '{command}'")
+
+def _encode_reply(value) -> bytes:
+	if isinstance(value, RespError):
+		return b"-%s\r\n" % str(value).encode()
+	if value is None:
+		return b"$-1\r\n"
+	if isinstance(value, bool) or isinstance(value, int):
+		return b":%d\r\n" % int(value)
+	if isinstance(value, list):
+		return b"*%d\r\n" % len(value) + b"".join(_encode_reply(item) for item in value)
+	if value in ("OK", "PONG"):
+		return b"+%s\r\n" % value.encode()
+	data = value.encode()
+	return b"$%d\r\n%s\r\n" % (len(data), data)
+
+class _Handler(socketserver.StreamRequestHandler):
+	def handle(self):
+		while True:
+			try:
+				request = read_reply(self.rfile)
+			except (ConnectionError, OSError):
+				return
+			try:
+				reply = self.server.state.execute(request[0], request[1:])
+			except RespError as e:
+				reply = e
+			except (IndexError, ValueError) as e:
+				reply = RespError(f"ERR {e}")
+			self.wfile.write(_encode_reply(reply))
+
+class RespServer(socketserver.ThreadingTCPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+	def __init__(self, host: str = "127.0.0.1", port: int = 6380, state: Optional[RespStandIn] = None):
+		super().__init__((host, port), _Handler)
+		self.state = state or RespStandIn()
+
+	@property
+	def url(self) -> str:
+		host, port = self.server_address[:2]
+		return f"redis://{host}:{port}"
+
+	def start(self) -> threading.Thread:
+		thread = threading.Thread(target=self.serve_forever, name="resp-stand-in", daemon=True)
+		thread.start()
+		return thread
+
+	def stop(self):
+		self.shutdown()
+		self.server_close()
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Servidor RESP local para la lista de revocación")
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=6380)
+	args = parser.parse_args()
+	server = RespServer(args.host, args.port)
+	print(f"✅ Servidor RESP escuchando en {server.url}")
+	server.serve_forever()
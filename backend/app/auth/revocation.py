@@ -0,0 +1,289 @@
+import abc
+import hashlib
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+
+from app.auth.resp import RespClient
+from app.config import get_setting
+from app.db.db import SessionLocal
+from app.model.models import RevokedToken
+
+logger = logging.getLogger(__name__)
+
+# Lista de revocación de JWT por jti. Cada entrada caduca con el exp del token: pasado ese
+# momento el propio JWT ya no vale y la entrada sobra. Cada worker comprueba los tokens
+# contra un filtro de Bloom y una copia en memoria que un hilo de fondo mantiene al día;
+# ninguna comprobación sale del proceso. JWT_REVOCATION_STORE elige el almacén: memory
+# (un worker), sql (tabla revoked_tokens) o resp (Redis u otro servidor con su protocolo,
+# ver app/auth/resp.py).
+
+SYNC_SECONDS = float(get_setting("JWT_REVOCATION_SYNC_SECONDS", "1"))
+BLOOM_CAPACITY = int(get_setting("JWT_REVOCATION_BLOOM_CAPACITY", "100000"))
+REBUILD_SECONDS = 3600
+# Espera máxima al hilo de sincronización al cerrar
+CLOSE_TIMEOUT_SECONDS = 5.0
+
+class BloomFilter:
+	"""
+	Bits en un bytearray y k posiciones por elemento a partir de un solo blake2b (doble
+	hashing). "No está" es exacto; "está" falla con probabilidad error_rate si no se pasa
+	de capacity elementos.
+	"""
+	def __init__(self, capacity: int, error_rate: float = 0.001):
+		self.capacity = max(capacity, 1)
+		self.size = max(64, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+		self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+		self.count = 0
+		self._bits = bytearray((self.size + 7) // 8)
+
+	def _positions(self, item: str):
+		digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+		first = int.from_bytes(digest[:8], "little")
+		step = int.from_bytes(digest[8:], "little") | 1
+		return ((first + i * step) % self.size for i in range(self.hashes))
+
+	def add(self, item: str):
+		bits = self._bits
+		for position in self._positions(item):
+			bits[position >> 3] |= 1 << (position & 7)
+		self.count += 1
+
+	def __contains__(self, item: str) -> bool:
+		bits = self._bits
+		for position in self._positions(item):
+			if not bits[position >> 3] & (1 << (position & 7)):
+				return False
+		return True
+
+class RevocationStore(abc.ABC):
+	"""
+	Filtro de Bloom y copia en memoria (jti -> exp) de los revocados vigentes. is_revoked
+	solo lee esas dos estructuras; el almacén lo consultan revoke y sync, que un hilo de
+	fondo (start) ejecuta cada sync_seconds: añade lo revocado desde otros workers y, cada
+	rebuild_seconds o al llenarse el filtro, borra del almacén lo caducado y rehace el
+	filtro, que no admite borrados. Las subclases implementan _store, _changes_since y _rebuild.
+	"""
+	def __init__(self, capacity: int = BLOOM_CAPACITY, sync_seconds: float = SYNC_SECONDS, rebuild_seconds: float = REBUILD_SECONDS, clock=time.time):
+		self.capacity = capacity
+		self.sync_seconds = sync_seconds
+		self.rebuild_seconds = rebuild_seconds
+		self.clock = clock
+		self._lock = threading.Lock()
+		self._bloom = BloomFilter(capacity)
+		self._revoked: Dict[str, float] = {}
+		self._synced = False
+		self._rebuilt_at = 0.0
+		# Se relee desde el cursor de la sincronización anterior: en Postgres o Redis un
+		# id menor puede hacerse visible después de uno mayor
+		self._cursors = (0, 0)
+		self._stopping = threading.Event()
+		self._thread: Optional[threading.Thread] = None
+
+	def revoke(self, jti: str, expires_at: float):
+		if expires_at <= self.clock():
+			return
+		with self._lock:
+			self._store(jti, expires_at)
+			self._remember(jti, expires_at)
+
+	def _remember(self, jti: str, expires_at: float):
+		self._revoked[jti] = expires_at
+		self._bloom.add(jti)
+
+	def is_revoked(self, jti: str) -> bool:
+		# Sin E/S: apto para el event loop (get_current_user_async)
+		if jti not in self._bloom:
+			return False
+		expires_at = self._revoked.get(jti)
+		return expires_at is not None and expires_at > self.clock()
+
+	def sync(self):
+		now = self.clock()
+		with self._lock:
+			if not self._synced or now - self._rebuilt_at >= self.rebuild_seconds or self._bloom.count >= self._bloom.capacity:
+				active, cursor = self._rebuild(now)
+				bloom = BloomFilter(max(self.capacity, 2 * len(active)))
+				for jti in active:
+					bloom.add(jti)
+				# Primero el filtro nuevo: una lectura intermedia solo puede dar un falso positivo
+				self._bloom = bloom
+				self._revoked = dict(active)
+				self._cursors = (cursor, cursor)
+				self._rebuilt_at = now
+				self._synced = True
+			else:
+				entries, cursor = self._changes_since(self._cursors[0])
+				for jti, expires_at in entries:
+					self._remember(jti, expires_at)
+				self._cursors = (self._cursors[1], max(cursor, self._cursors[1]))
+
+	def start(self):
+		"""
+		Primera carga (en el hilo que llama) y sincronización periódica en segundo plano.
+		"""
+		self.sync()
+		if self._thread is None:
+			self._stopping.clear()
+			self._thread = threading.Thread(target=self._run, name="jwt-revocation-sync", daemon=True)
+			self._thread.start()
+
+	def _run(self):
+		while not self._stopping.wait(self.sync_seconds):
+			try:
+				self.sync()
+			except Exception:
+				logger.exception("No se pudo sincronizar la lista de revocación")
+
+	def close(self, timeout: float = CLOSE_TIMEOUT_SECONDS):
+		"""
+		Para el hilo de fondo sin esperarlo más de timeout: una sincronización colgada
+		en el almacén no bloquea el apagado (el hilo es daemon).
+		"""
+		self._stopping.set()
+		if self._thread is not None:
+			self._thread.join(timeout)
+			if self._thread.is_alive():
+				logger.warning("El hilo de sincronización de revocados no terminó en %.1f s", timeout)
+			self._thread = None
+
+	@abc.abstractmethod
+	def _store(self, jti: str, expires_at: float):
+		...
+
+	@abc.abstractmethod
+	def _changes_since(self, cursor: int) -> Tuple[Iterable[Tuple[str, float]], int]:
+		...
+
+	@abc.abstractmethod
+	def _rebuild(self, now: float) -> Tuple[Dict[str, float], int]:
+		# Borra los caducados y devuelve los vigentes (jti -> exp) y el cursor desde el que seguir
+		...
+
+class MemoryRevocationStore(RevocationStore):
+	"""
+	Solo la copia en memoria del propio proceso: sirve con un worker.
+	"""
+	def _store(self, jti, expires_at):
+		pass
+
+	def _changes_since(self, cursor):
+		return (), cursor
+
+	def _rebuild(self, now):
+		return {jti: expires_at for jti, expires_at in self._revoked.items() if expires_at > now}, 0
+
+def _utc(timestamp: float) -> datetime:
+	# La tabla guarda UTC sin zona, como el resto de columnas DateTime
+	return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+
+def _timestamp(value: datetime) -> float:
+	return value.replace(tzinfo=timezone.utc).timestamp()
+
+class SqlRevocationStore(RevocationStore):
+	"""
+	Tabla revoked_tokens (SQLite o Postgres); el id autoincremental es el cursor.
+	"""
+	def __init__(self, session_factory=SessionLocal, **kwargs):
+		super().__init__(**kwargs)
+		self.session_factory = session_factory
+
+	def _store(self, jti, expires_at):
+		with self.session_factory() as db:
+			db.add(RevokedToken(jti=jti, expires_at=_utc(expires_at)))
+			try:
+				db.commit()
+			except IntegrityError:
+				# Ya estaba revocado
+				db.rollback()
+
+	def _changes_since(self, cursor):
+		columns = (RevokedToken.id, RevokedToken.jti, RevokedToken.expires_at)
+		with self.session_factory() as db:
+			rows = db.execute(select(*columns).where(RevokedToken.id > cursor).order_by(RevokedToken.id)).all()
+		return [(jti, _timestamp(expires_at)) for _, jti, expires_at in rows], rows[-1][0] if rows else cursor
+
+	def _rebuild(self, now):
+		with self.session_factory() as db:
+			db.execute(delete(RevokedToken).where(RevokedToken.expires_at <= _utc(now)))
+			db.commit()
+			rows = db.execute(select(RevokedToken.id, RevokedToken.jti, RevokedToken.expires_at)).all()
+		active = {jti: _timestamp(expires_at) for _, jti, expires_at in rows}
+		return active, max((row_id for row_id, _, _ in rows), default=self._cursors[1])
+
+class RespRevocationStore(RevocationStore):
+	"""
+	Protocolo de Redis. jwt:revoked:<jti> caduca sola con EXAT (exp del token); el conjunto
+	ordenado jwt:revoked ("<exp>:<jti>" por número de secuencia) sirve para sincronizar.
+	"""
+	KEY = "jwt:revoked"
+
+	def __init__(self, url: str, **kwargs):
+		super().__init__(**kwargs)
+		self.client = RespClient(url)
+
+	def _store(self, jti, expires_at):
+		self.client.execute("SET", f"{self.KEY}:{jti}", "1", "EXAT", math.ceil(expires_at))
+		sequence = self.client.execute("INCR", f"{self.KEY}:seq")
+		self.client.execute("ZADD", self.KEY, sequence, f"{math.ceil(expires_at)}:{jti}")
+
+	def _entries(self, low: str) -> List[Tuple[int, str, int]]:
+		reply = self.client.execute("ZRANGEBYSCORE", self.KEY, low, "+inf", "WITHSCORES")
+		entries = []
+		for member, score in zip(reply[::2], reply[1::2]):
+			expires_at, _, jti = member.partition(":")
+			entries.append((int(expires_at), jti, int(float(score))))
+		return entries
+
+	def _changes_since(self, cursor):
+		entries = self._entries(f"({cursor}")
+		return [(jti, float(expires_at)) for expires_at, jti, _ in entries], max((sequence for _, _, sequence in entries), default=cursor)
+
+	def _rebuild(self, now):
+		entries = self._entries("-inf")
+		expired = [f"{expires_at}:{jti}" for expires_at, jti, _ in entries if expires_at <= now]
+		if expired:
+			self.client.execute("ZREM", self.KEY, *expired)
+		active = {jti: float(expires_at) for expires_at, jti, _ in entries if expires_at > now}
+		return active, max((sequence for _, _, sequence in entries), default=self._cursors[1])
+
+	def close(self, timeout: float = CLOSE_TIMEOUT_SECONDS):
+		super().close(timeout)
+		self.client.close()
+
+_revocation_store: Optional[RevocationStore] = None
+_revocation_lock = threading.Lock()
+
+def get_revocation_store() -> RevocationStore:
+	"""
+	JWT_REVOCATION_STORE=memory (por defecto) para un worker; sql o resp para varios
+	(JWT_REVOCATION_URL=redis://host:puerto para resp).
+	"""
+	global _revocation_store
+	# Ya creado: sin lock, is_jti_revoked lo llama en cada petición
+	store = _revocation_store
+	if store is not None:
+		return store
+	with _revocation_lock:
+		if _revocation_store is None:
+			backend = get_setting("JWT_REVOCATION_STORE", "memory").lower()
+			if backend == "sql":
+				_revocation_store = SqlRevocationStore()
+			elif backend == "resp":
+				_revocation_store = RespRevocationStore(get_setting("JWT_REVOCATION_URL", "redis://127.0.0.1:6380"))
+			else:
+				_revocation_store = MemoryRevocationStore()
+		return _revocation_store
+
+def close_revocation_store():
+	global _revocation_store
+	with _revocation_lock:
+		if _revocation_store is not None:
+			_revocation_store.close()
+			_revocation_store = None
@@ -0,0 +1,15 @@
+import os
+from functools import lru_cache
+from typing import Optional
+
+from dotenv import load_dotenv
+
+# Único punto de carga del .env: el resto de módulos lee la configuración
+# con get_setting en vez de llamar a load_dotenv por su cuenta
+@lru_cache(maxsize=None)
+def load_config() -> None:
+	load_dotenv()
+
+def get_setting(name: str, default: Optional[str] = None) -> Optional[str]:
+	load_config()
+	return os.getenv(name, default)
@@ -0,0 +1,46 @@
+import hashlib
+import hmac
+import re
+import unicodedata
+from functools import lru_cache
+from typing import List
+
+from app.config import get_setting
+
+# Índice ciego para buscar palabras en mensajes cifrados: se guarda HMAC(clave de la
+# conversación, palabra normalizada), nunca la palabra. Quien lea la tabla ve qué mensajes
+# de una misma conversación comparten palabras, pero no cuáles son ni puede cruzar conversaciones.
+
+MIN_KEYWORD_LENGTH = 2
+MAX_KEYWORDS_PER_MESSAGE = 64
+TOKEN_HEX_LENGTH = 32
+_WORD = re.compile(r"\w+")
+
+def message_search_enabled() -> bool:
+	"""
+	MESSAGE_SEARCH=true indexa los mensajes nuevos y activa los endpoints de búsqueda.
+	"""
+	return get_setting("MESSAGE_SEARCH", "false").lower() == "true"
+
+@lru_cache(maxsize=1)
+def _master_key() -> bytes:
+	# MESSAGE_SEARCH_SECRET permite separarla de APP_SECRET; cambiarla deja inservible el índice existente
+	secret = get_setting("MESSAGE_SEARCH_SECRET") or get_setting("APP_SECRET")
+	return hmac.new(secret.encode(), b"blind-index", hashlib.sha256).digest()
+
+@lru_cache(maxsize=4096)
+def _conversation_key(conversation: str) -> bytes:
+	return hmac.new(_master_key(), conversation.encode(), hashlib.sha256).digest()
+
+def normalize_keywords(text: str) -> List[str]:
+	"""
+	Palabras en minúsculas y sin tildes, sin repetir, en orden de aparición.
+	"""
+	text = unicodedata.normalize("NFKD", text.lower())
+	text = "".join(char for char in text if not unicodedata.combining(char))
+	words = dict.fromkeys(word for word in _WORD.findall(text) if len(word) >= MIN_KEYWORD_LENGTH)
+	return list(words)[:MAX_KEYWORDS_PER_MESSAGE]
+
+def keyword_tokens(conversation: str, text: str) -> List[str]:
+	key = _conversation_key(conversation)
+	return [hmac.new(key, word.encode(), hashlib.sha256).hexdigest()[:TOKEN_HEX_LENGTH] for word in normalize_keywords(text)]
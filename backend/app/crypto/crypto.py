@@ -1,66 +1,54 @@
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.backends import default_backend
-from cryptography.fernet import Fernet
-
-from Crypto.Cipher import AES, PKCS1_OAEP
-from Crypto.PublicKey import RSA, ECC
 from Crypto.Random import get_random_bytes
 
-from dotenv import load_dotenv
-import hashlib
 import base64
 import json
-import os
-
-from cryptography.hazmat.backends import default_backend
-
-load_dotenv()
-APP_SECRET = os.getenv("APP_SECRET")
+from functools import partial
+from typing import List, Tuple
 
-def generate_key() -> bytes:
-	hash_digest = hashlib.sha256(APP_SECRET.encode()).digest()
-	return base64.urlsafe_b64encode(hash_digest)
+from app.crypto.keyring import get_keyring
+from app.crypto.registry import provider
 
 def encrypt_bytes(data: bytes) -> bytes:
-	key = generate_key()
-	fernet = Fernet(key)
-	encrypted = fernet.encrypt(data)
-	return encrypted
+	# Versión primaria del keyring (app/crypto/keyring.py)
+	return get_keyring().encrypt(data)
 
 def decrypt_bytes(data: bytes) -> bytes:
-	key = generate_key()
-	fernet = Fernet(key)
-	decrypted = fernet.decrypt(data)
-	return decrypted
+	# Cualquier versión activa del keyring, según el prefijo del texto cifrado
+	return get_keyring().decrypt(data)
 
 def generate_rsa_keys():
-	key = RSA.generate(2048)
-	private_pem = key.export_key()
-	public_pem = key.publickey().export_key()
+	private_pem, public_pem = provider("rsa_keygen").generate_rsa()
 	return str_to_bytes(private_pem), str_to_bytes(public_pem)
 
 def generate_ecc_keys():
-	key = ECC.generate(curve='P-256')
-	private_pem = key.export_key(format='DER')
-	public_pem = key.public_key().export_key(format='DER')
+	private_pem, public_pem = provider("ecc_keygen").generate_ecc()
 	return str_to_bytes(private_pem), str_to_bytes(public_pem)
 
 def cifrar_mensaje_individual(mensaje: str, clave_publica_rsa_pem: bytes) -> str:
+	return cifrar_mensajes_individuales([mensaje], clave_publica_rsa_pem)[0]
+
+def cifrar_mensajes_individuales(mensajes: List[str], clave_publica_rsa_pem: bytes) -> List[str]:
+	# La clave RSA se importa una vez para todo el lote; cada mensaje lleva su propia clave AES
+	rsa = provider("rsa_oaep")
+	cifrar_rsa = partial(rsa.rsa_oaep_encrypt, rsa.rsa_public_key(clave_publica_rsa_pem))
+	return [_cifrar_individual(mensaje, cifrar_rsa) for mensaje in mensajes]
+
+def _cifrar_aes(mensaje: str):
 	# Genera clave AES-256 aleatoria
 	clave_aes = get_random_bytes(32)
 	iv = get_random_bytes(16)
 
 	# Cifra mensaje con AES-256-GCM
-	cipher_aes = AES.new(clave_aes, AES.MODE_GCM, iv)
 	padding_len = 16 - len(mensaje.encode()) % 16
 	mensaje_padded = mensaje + chr(padding_len) * padding_len
-	mensaje_cifrado = cipher_aes.encrypt(mensaje_padded.encode())
+	mensaje_cifrado = provider("gcm_stream").gcm_stream(clave_aes, iv, mensaje_padded.encode())
+	return clave_aes, iv, mensaje_cifrado
+
+def _cifrar_individual(mensaje: str, cifrar_rsa) -> str:
+	clave_aes, iv, mensaje_cifrado = _cifrar_aes(mensaje)
 
 	# Cifra clave AES con clave pública RSA
-	rsa_key = RSA.import_key(clave_publica_rsa_pem)
-	cipher_rsa = PKCS1_OAEP.new(rsa_key)
-	clave_aes_cifrada = cipher_rsa.encrypt(clave_aes)
+	clave_aes_cifrada = cifrar_rsa(clave_aes)
 
 	data = {
 		'mensaje': base64.b64encode(mensaje_cifrado).decode(),
@@ -69,6 +57,28 @@ def cifrar_mensaje_individual(mensaje: str, clave_publica_rsa_pem: bytes) -> str
 	}
 	return json.dumps(data)
 
+def cifrar_mensaje_difusion(mensaje: str, claves_publicas_rsa_pem: List[bytes]) -> Tuple[str, List[str]]:
+	"""
+	Un solo cifrado AES para varios destinatarios. Devuelve la parte común
+	{"mensaje", "iv"} y, por destinatario, {"clave_aes"} envuelta con su RSA.
+	unir_sobre_difusion(común, clave) es el mismo sobre que cifrar_mensaje_individual.
+	"""
+	clave_aes, iv, mensaje_cifrado = _cifrar_aes(mensaje)
+	rsa = provider("rsa_oaep")
+	comun = json.dumps({
+		'mensaje': base64.b64encode(mensaje_cifrado).decode(),
+		'iv': base64.b64encode(iv).decode()
+	})
+	claves = [
+		json.dumps({'clave_aes': base64.b64encode(rsa.rsa_oaep_encrypt(rsa.rsa_public_key(clave_publica), clave_aes)).decode()})
+		for clave_publica in claves_publicas_rsa_pem
+	]
+	return comun, claves
+
+def unir_sobre_difusion(comun: str, clave: str) -> str:
+	data = json.loads(comun)
+	return json.dumps({'mensaje': data['mensaje'], 'clave_aes': json.loads(clave)['clave_aes'], 'iv': data['iv']})
+
 def descifrar_mensaje_individual(data_str: str, clave_privada_rsa_pem: bytes) -> str:
 	try:
 		data = json.loads(data_str)
@@ -77,13 +87,11 @@ def descifrar_mensaje_individual(data_str: str, clave_privada_rsa_pem: bytes) ->
 		iv = base64.b64decode(data['iv'])
 
 		# Descifra clave AES
-		rsa_key = RSA.import_key(clave_privada_rsa_pem)
-		cipher_rsa = PKCS1_OAEP.new(rsa_key)
-		clave_aes = cipher_rsa.decrypt(clave_aes_cifrada)
+		rsa = provider("rsa_oaep")
+		clave_aes = rsa.rsa_oaep_decrypt(rsa.rsa_private_key(clave_privada_rsa_pem), clave_aes_cifrada)
 
 		# Descifra mensaje
-		cipher_aes = AES.new(clave_aes, AES.MODE_GCM, iv)
-		mensaje_padded = cipher_aes.decrypt(mensaje_cifrado)
+		mensaje_padded = provider("gcm_stream").gcm_stream(clave_aes, iv, mensaje_cifrado)
 		padding_len = mensaje_padded[-1]
 		return mensaje_padded[:-padding_len].decode()
 	except Exception as e:
@@ -91,9 +99,15 @@ def descifrar_mensaje_individual(data_str: str, clave_privada_rsa_pem: bytes) ->
 		return data_str
 
 def cifrar_mensaje_grupal(mensaje: str, clave_simetrica: bytes) -> str:
-	aesgcm = AESGCM(clave_simetrica)
+	return cifrar_mensajes_grupales([mensaje], clave_simetrica)[0]
+
+def cifrar_mensajes_grupales(mensajes: List[str], clave_simetrica: bytes) -> List[str]:
+	aead = provider("aead")
+	return [_cifrar_grupal(mensaje, clave_simetrica, aead) for mensaje in mensajes]
+
+def _cifrar_grupal(mensaje: str, clave_simetrica: bytes, aead) -> str:
 	nonce = get_random_bytes(12)
-	mensaje_cifrado = aesgcm.encrypt(nonce, mensaje.encode(), None)
+	mensaje_cifrado = aead.aead_encrypt(clave_simetrica, nonce, mensaje.encode())
 	data = {
 		'mensaje': base64.b64encode(mensaje_cifrado).decode(),
 		'nonce': base64.b64encode(nonce).decode()
@@ -103,10 +117,9 @@ def cifrar_mensaje_grupal(mensaje: str, clave_simetrica: bytes) -> str:
 def descifrar_mensaje_grupal(data_str: str, clave_simetrica: bytes) -> str:
 	try:
 		data = json.loads(data_str)
-		aesgcm = AESGCM(clave_simetrica)
 		nonce = base64.b64decode(data['nonce'])
 		mensaje_cifrado = base64.b64decode(data['mensaje'])
-		return aesgcm.decrypt(nonce, mensaje_cifrado, None).decode()
+		return provider("aead").aead_decrypt(clave_simetrica, nonce, mensaje_cifrado).decode()
 	except Exception as e:
 		print("\n"+"-"*20+"Decryption"+"-"*20+"\n"+str(e)+"\n"+"-"*50)
 		return data_str
@@ -0,0 +1,39 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Tuple
+
+from app.config import get_setting
+
+class GroupKeyCache:
+	"""
+	LRU de claves AES de grupo por (grupo, época). La clave de una época no cambia
+	nunca (rotar crea una época nueva), así que no hay TTL ni invalidación.
+	"""
+	def __init__(self, max_entries: int = 4096):
+		self.max_entries = max_entries
+		self._lock = threading.Lock()
+		self._keys: "OrderedDict[Tuple[str, int], bytes]" = OrderedDict()
+
+	def get_many(self, group_name: str, epochs: Iterable[int]) -> Dict[int, bytes]:
+		with self._lock:
+			found = {}
+			for epoch in epochs:
+				key = self._keys.get((group_name, epoch))
+				if key is not None:
+					self._keys.move_to_end((group_name, epoch))
+					found[epoch] = key
+			return found
+
+	def put(self, group_name: str, epoch: int, key: bytes):
+		with self._lock:
+			self._keys[(group_name, epoch)] = key
+			self._keys.move_to_end((group_name, epoch))
+			while len(self._keys) > self.max_entries:
+				self._keys.popitem(last=False)
+
+	def clear(self):
+		with self._lock:
+			self._keys.clear()
+
+# Por proceso; GROUP_KEY_CACHE_SIZE=0 lo desactiva
+group_key_cache = GroupKeyCache(max_entries=int(get_setting("GROUP_KEY_CACHE_SIZE", "4096")))
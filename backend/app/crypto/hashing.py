@@ -1,17 +1,10 @@
-# Importación de primitivas criptográficas y backend seguro
-from cryptography.hazmat.primitives import hashes, hmac
-from cryptography.hazmat.backends import default_backend
+# SHA-256 del proveedor elegido en el registro
+from .registry import provider
 
 # 🧮 Función para generar un hash SHA-256 de una cadena
 def generate_hash(data: str) -> str:
-    # Se crea un objeto Hash utilizando SHA-256 como algoritmo
-    digest = hashes.Hash(hashes.SHA256(), backend=default_backend())
-    
-    # Se alimenta el hash con el contenido de la cadena codificada en UTF-8
-    digest.update(data.encode('utf-8'))
-    
-    # Se obtiene el resultado final en formato hexadecimal
-    return digest.finalize().hex()
+    # Se calcula el hash de la cadena codificada en UTF-8 y se devuelve en hexadecimal
+    return provider("sha256").sha256(data.encode('utf-8')).hex()
 
 # ✅ Función para verificar si el hash de un dato coincide con un hash esperado
 def verify_hash(data: str, expected_hash: str) -> bool:
@@ -0,0 +1,81 @@
+import base64
+import hashlib
+import re
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from app.config import get_setting
+
+# Claves maestras con versión para cifrar en reposo las claves privadas de los usuarios.
+# La versión 0 es APP_SECRET (formato anterior, sin prefijo); APP_SECRET_KEYS añade
+# versiones "2:secreto-nuevo,1:secreto-anterior". Se cifra con la versión más alta y el
+# texto lleva delante b"v<versión>:"; un token Fernet empieza por "gAAAA", nunca por "v".
+
+_VERSION_PREFIX = re.compile(rb"^v(\d+):")
+
+def derive_fernet_key(secret: str) -> bytes:
+	# SHA-256 del secreto en base64 url-safe: los datos ya cifrados con APP_SECRET siguen valiendo
+	return base64.urlsafe_b64encode(hashlib.sha256(secret.encode()).digest())
+
+def parse_secrets(app_secret: Optional[str], extra: Optional[str]) -> Dict[int, str]:
+	secrets = {}
+	if app_secret:
+		secrets[0] = app_secret
+	for item in (extra or "").split(","):
+		if item.strip():
+			version, _, secret = item.strip().partition(":")
+			if not version.isdigit() or int(version) == 0 or not secret:
+				raise ValueError("APP_SECRET_KEYS espera entradas <versión>:<secreto> con versión >= 1")
+			secrets[int(version)] = secret
+	return secrets
+
+class Keyring:
+	"""
+	Como MultiFernet, pero cada texto dice con qué versión se cifró: descifrar no
+	prueba todas las claves y la rotación sabe qué filas le faltan sin descifrarlas.
+	"""
+	def __init__(self, secrets: Dict[int, str]):
+		if not secrets:
+			raise ValueError("Keyring sin claves: falta APP_SECRET")
+		self.secrets = dict(secrets)
+		self.primary = max(secrets)
+		self._fernets = {version: Fernet(derive_fernet_key(secret)) for version, secret in secrets.items()}
+
+	@staticmethod
+	def version_of(data: bytes) -> int:
+		match = _VERSION_PREFIX.match(data)
+		return int(match.group(1)) if match else 0
+
+	def _split(self, data: bytes) -> Tuple[int, bytes]:
+		match = _VERSION_PREFIX.match(data)
+		if match is None:
+			return 0, data
+		return int(match.group(1)), data[match.end():]
+
+	def encrypt(self, data: bytes) -> bytes:
+		token = self._fernets[self.primary].encrypt(data)
+		if self.primary == 0:
+			return token
+		return b"v%d:" % self.primary + token
+
+	def decrypt(self, data: bytes) -> bytes:
+		version, token = self._split(data)
+		fernet = self._fernets.get(version)
+		if fernet is None:
+			raise InvalidToken(f"Versión de clave desconocida: {version}")
+		return fernet.decrypt(token)
+
+	def needs_rotation(self, data: bytes) -> bool:
+		return self.version_of(data) != self.primary
+
+	def rotate(self, data: bytes) -> bytes:
+		# Vuelve a cifrar con la versión primaria; lo que ya la usa no se toca
+		if not self.needs_rotation(data):
+			return data
+		return self.encrypt(self.decrypt(data))
+
+@lru_cache(maxsize=1)
+def get_keyring() -> Keyring:
+	return Keyring(parse_secrets(get_setting("APP_SECRET"), get_setting("APP_SECRET_KEYS")))
@@ -0,0 +1,255 @@
+import ctypes
+import ctypes.util
+import logging
+import mmap
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, NamedTuple, Optional, Set, Tuple
+
+from app.config import get_setting
+
+logger = logging.getLogger(__name__)
+
+# Tamaños de hueco del arena: potencias de dos entre 64 B y 16 KiB
+MIN_SLOT = 64
+CHUNK_SIZE = 16 * 1024
+
+_libc = None
+
+def _get_libc():
+	global _libc
+	if _libc is None:
+		_libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+	return _libc
+
+def _slot_size(length: int) -> int:
+	size = MIN_SLOT
+	while size < length:
+		size *= 2
+	return size
+
+class LockedArena:
+	"""
+	Memoria anónima fija para texto descifrado: mlock (no va a swap), excluida de
+	los core dumps y puesta a cero al liberar cada hueco.
+	Se reparte en bloques de CHUNK_SIZE; cada bloque sirve huecos de un solo tamaño.
+	Si el sistema no permite mlock (RLIMIT_MEMLOCK) se usa igualmente sin bloquear.
+	"""
+	def __init__(self, capacity: int):
+		chunks = max(1, capacity // CHUNK_SIZE)
+		self.capacity = chunks * CHUNK_SIZE
+		self._mm = mmap.mmap(-1, self.capacity, flags=mmap.MAP_PRIVATE | mmap.MAP_ANONYMOUS)
+		self._buffer = ctypes.c_char.from_buffer(self._mm)
+		self._address = ctypes.addressof(self._buffer)
+		self.locked = self._lock_pages()
+		if hasattr(mmap, "MADV_DONTDUMP"):
+			self._mm.madvise(mmap.MADV_DONTDUMP)
+		self._free_chunks = list(range(chunks - 1, -1, -1))
+		self._chunk_used: Dict[int, int] = {}
+		self._free_slots: Dict[int, Set[int]] = {}
+
+	def _lock_pages(self) -> bool:
+		try:
+			libc = _get_libc()
+			if libc.mlock(ctypes.c_void_p(self._address), ctypes.c_size_t(self.capacity)) == 0:
+				return True
+			logger.warning("mlock del caché de mensajes falló (errno %d); se usa sin bloquear", ctypes.get_errno())
+		except (OSError, AttributeError):
+			logger.warning("mlock no disponible; el caché de mensajes se usa sin bloquear")
+		return False
+
+	def alloc(self, length: int) -> Optional[Tuple[int, int]]:
+		"""
+		Devuelve (offset, tamaño del hueco) o None si no queda sitio para ese tamaño.
+		"""
+		size = _slot_size(length)
+		if size > CHUNK_SIZE:
+			return None
+		free = self._free_slots.setdefault(size, set())
+		if not free:
+			if not self._free_chunks:
+				return None
+			chunk = self._free_chunks.pop()
+			self._chunk_used[chunk] = 0
+			start = chunk * CHUNK_SIZE
+			free.update(range(start, start + CHUNK_SIZE, size))
+		offset = free.pop()
+		self._chunk_used[offset // CHUNK_SIZE] += 1
+		return offset, size
+
+	def free(self, offset: int, size: int):
+		ctypes.memset(self._address + offset, 0, size)
+		chunk = offset // CHUNK_SIZE
+		self._free_slots[size].add(offset)
+		self._chunk_used[chunk] -= 1
+		if self._chunk_used[chunk] == 0:
+			# Bloque vacío: vuelve a estar disponible para cualquier tamaño
+			start = chunk * CHUNK_SIZE
+			self._free_slots[size].difference_update(range(start, start + CHUNK_SIZE, size))
+			del self._chunk_used[chunk]
+			self._free_chunks.append(chunk)
+
+	def write(self, offset: int, data: bytes):
+		self._mm[offset:offset + len(data)] = data
+
+	def read(self, offset: int, length: int) -> bytes:
+		return self._mm[offset:offset + length]
+
+	def close(self):
+		ctypes.memset(self._address, 0, self.capacity)
+		if self.locked:
+			_get_libc().munlock(ctypes.c_void_p(self._address), ctypes.c_size_t(self.capacity))
+		del self._buffer
+		self._mm.close()
+
+class _Entry(NamedTuple):
+	offset: int
+	length: int
+	size: int
+	signature: Optional[str]
+	scope: str
+	expires: float
+
+class DecryptedMessageCache:
+	"""
+	LRU con TTL de mensajes ya descifrados, indexado por (tabla, id, lector).
+	El texto vive en un LockedArena de `max_bytes`; al expulsar una entrada
+	su hueco se pone a cero. Cada entrada pertenece a un ámbito (la clave con la
+	que se descifró) para invalidarla cuando esa clave rota.
+	"""
+	def __init__(self, max_bytes: int = 4 * 1024 * 1024, ttl: float = 300.0, clock=time.monotonic):
+		self.ttl = ttl
+		self.clock = clock
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self._lock = threading.Lock()
+		self._arena = LockedArena(max_bytes)
+		self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+		self._by_size: Dict[int, "OrderedDict[Hashable, None]"] = {}
+		self._scopes: Dict[str, Set[Hashable]] = {}
+
+	def get(self, key: Hashable) -> Optional[Tuple[str, Optional[str]]]:
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is None:
+				self.misses += 1
+				return None
+			if entry.expires <= self.clock():
+				self._remove(key)
+				self.misses += 1
+				return None
+			self._entries.move_to_end(key)
+			self._by_size[entry.size].move_to_end(key)
+			self.hits += 1
+			return self._arena.read(entry.offset, entry.length).decode("utf-8"), entry.signature
+
+	def put(self, key: Hashable, message: str, signature: Optional[str], scope: str):
+		data = message.encode("utf-8")
+		with self._lock:
+			if key in self._entries:
+				self._remove(key)
+			slot = self._arena.alloc(len(data))
+			while slot is None and self._entries:
+				# Sin sitio: se expulsa la entrada menos usada de ese mismo tamaño, que
+				# libera justo el hueco necesario; si no hay, la menos usada en general
+				same_size = self._by_size.get(_slot_size(len(data)))
+				self._remove(next(iter(same_size)) if same_size else next(iter(self._entries)))
+				self.evictions += 1
+				slot = self._arena.alloc(len(data))
+			if slot is None:
+				# Mensaje mayor que un bloque del arena: no se cachea
+				return
+			offset, size = slot
+			self._arena.write(offset, data)
+			self._entries[key] = _Entry(offset, len(data), size, signature, scope, self.clock() + self.ttl)
+			self._scopes.setdefault(scope, set()).add(key)
+			self._by_size.setdefault(size, OrderedDict())[key] = None
+
+	def _remove(self, key: Hashable):
+		entry = self._entries.pop(key)
+		self._arena.free(entry.offset, entry.size)
+		same_size = self._by_size[entry.size]
+		del same_size[key]
+		if not same_size:
+			del self._by_size[entry.size]
+		keys = self._scopes[entry.scope]
+		keys.discard(key)
+		if not keys:
+			del self._scopes[entry.scope]
+
+	def invalidate(self, scope: str) -> int:
+		with self._lock:
+			keys = list(self._scopes.get(scope, ()))
+			for key in keys:
+				self._remove(key)
+			return len(keys)
+
+	def clear(self):
+		with self._lock:
+			for key in list(self._entries):
+				self._remove(key)
+
+	def stats(self) -> dict:
+		with self._lock:
+			return {
+				"enabled": True,
+				"hits": self.hits,
+				"misses": self.misses,
+				"evictions": self.evictions,
+				"entries": len(self._entries),
+				"bytes": sum(entry.size for entry in self._entries.values()),
+				"capacity": self._arena.capacity,
+				"locked": self._arena.locked,
+			}
+
+	def close(self):
+		with self._lock:
+			self._entries.clear()
+			self._by_size.clear()
+			self._scopes.clear()
+			self._arena.close()
+
+def group_key_scope(group_name: str) -> str:
+	return f"group:{group_name}"
+
+def user_key_scope(user_id: int) -> str:
+	# Mensajes P2P descifrados con la clave privada RSA de ese usuario
+	return f"user:{user_id}"
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_message_cache() -> Optional[DecryptedMessageCache]:
+	"""
+	MESSAGE_CACHE=true activa el caché (desactivado por defecto).
+	MESSAGE_CACHE_MAX_MB y MESSAGE_CACHE_TTL_SECONDS ajustan su tamaño y caducidad.
+	"""
+	global _cache
+	if get_setting("MESSAGE_CACHE", "false").lower() != "true":
+		return None
+	with _cache_lock:
+		if _cache is None:
+			_cache = DecryptedMessageCache(
+				max_bytes=int(float(get_setting("MESSAGE_CACHE_MAX_MB", "4")) * 1024 * 1024),
+				ttl=float(get_setting("MESSAGE_CACHE_TTL_SECONDS", "300")),
+			)
+		return _cache
+
+def invalidate_group_key(group_name: str):
+	cache = get_message_cache()
+	if cache is not None:
+		cache.invalidate(group_key_scope(group_name))
+
+def invalidate_user_key(user_id: int):
+	cache = get_message_cache()
+	if cache is not None:
+		cache.invalidate(user_key_scope(user_id))
+
+def close_message_cache():
+	global _cache
+	with _cache_lock:
+		if _cache is not None:
+			_cache.close()
+			_cache = None
@@ -0,0 +1,215 @@
+from typing import Tuple, Union
+
+from Crypto.Cipher import AES, PKCS1_OAEP
+from Crypto.Hash import SHA256
+from Crypto.PublicKey import ECC, RSA
+from Crypto.Signature import DSS, pkcs1_15
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature, encode_dss_signature
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+# Las mismas primitivas sobre pycryptodome y sobre cryptography (OpenSSL). Los formatos son
+# idénticos en las dos: AES-GCM con tag al final, el GCM sin tag de los sobres P2P,
+# RSA-OAEP con SHA-1, firmas ECDSA P-256 como r||s y claves PEM (RSA) y DER (ECC).
+# Qué implementación usa cada primitiva lo decide app/crypto/registry.py.
+
+KeyData = Union[bytes, str]
+
+def _key_bytes(key: KeyData) -> bytes:
+	return key.encode() if isinstance(key, str) else key
+
+class CryptoProvider:
+	"""
+	Interfaz común. Las funciones *_key importan una clave y devuelven un objeto propio
+	del proveedor, que solo sirve para las operaciones de ese mismo proveedor.
+	Las verificaciones lanzan ValueError si la firma no es válida.
+	"""
+	name = ""
+
+	def aead_encrypt(self, key: bytes, nonce: bytes, data: bytes) -> bytes:
+		raise NotImplementedError
+
+	def aead_decrypt(self, key: bytes, nonce: bytes, data: bytes) -> bytes:
+		raise NotImplementedError
+
+	def gcm_stream(self, key: bytes, iv: bytes, data: bytes) -> bytes:
+		# GCM sin tag (sobres P2P): cifrar y descifrar son la misma operación
+		raise NotImplementedError
+
+	def rsa_public_key(self, pem: KeyData):
+		raise NotImplementedError
+
+	def rsa_private_key(self, pem: KeyData):
+		raise NotImplementedError
+
+	def rsa_oaep_encrypt(self, public_key, data: bytes) -> bytes:
+		raise NotImplementedError
+
+	def rsa_oaep_decrypt(self, private_key, data: bytes) -> bytes:
+		raise NotImplementedError
+
+	def rsa_sign(self, private_key, data: bytes) -> bytes:
+		raise NotImplementedError
+
+	def rsa_verify(self, public_key, data: bytes, signature: bytes):
+		raise NotImplementedError
+
+	def ecc_public_key(self, key: KeyData):
+		raise NotImplementedError
+
+	def ecc_private_key(self, key: KeyData):
+		raise NotImplementedError
+
+	def ecdsa_sign(self, private_key, data: bytes) -> bytes:
+		raise NotImplementedError
+
+	def ecdsa_verify(self, public_key, data: bytes, signature: bytes):
+		raise NotImplementedError
+
+	def generate_rsa(self) -> Tuple[bytes, bytes]:
+		# (privada PEM PKCS#1, pública PEM SubjectPublicKeyInfo), RSA-2048
+		raise NotImplementedError
+
+	def generate_ecc(self) -> Tuple[bytes, bytes]:
+		# (privada DER PKCS#8, pública DER SubjectPublicKeyInfo), P-256
+		raise NotImplementedError
+
+	def sha256(self, data: bytes) -> bytes:
+		raise NotImplementedError
+
+class PycryptodomeProvider(CryptoProvider):
+	name = "pycryptodome"
+
+	def aead_encrypt(self, key, nonce, data):
+		ciphertext, tag = AES.new(key, AES.MODE_GCM, nonce=nonce).encrypt_and_digest(data)
+		return ciphertext + tag
+
+	def aead_decrypt(self, key, nonce, data):
+		return AES.new(key, AES.MODE_GCM, nonce=nonce).decrypt_and_verify(data[:-16], data[-16:])
+
+	def gcm_stream(self, key, iv, data):
+		return AES.new(key, AES.MODE_GCM, iv).encrypt(data)
+
+	def rsa_public_key(self, pem):
+		return RSA.import_key(pem)
+
+	rsa_private_key = rsa_public_key
+
+	def rsa_oaep_encrypt(self, public_key, data):
+		return PKCS1_OAEP.new(public_key).encrypt(data)
+
+	def rsa_oaep_decrypt(self, private_key, data):
+		return PKCS1_OAEP.new(private_key).decrypt(data)
+
+	def rsa_sign(self, private_key, data):
+		return pkcs1_15.new(private_key).sign(SHA256.new(data))
+
+	def rsa_verify(self, public_key, data, signature):
+		pkcs1_15.new(public_key).verify(SHA256.new(data), signature)
+
+	def ecc_public_key(self, key):
+		return ECC.import_key(key)
+
+	ecc_private_key = ecc_public_key
+
+	def ecdsa_sign(self, private_key, data):
+		return DSS.new(private_key, 'fips-186-3').sign(SHA256.new(data))
+
+	def ecdsa_verify(self, public_key, data, signature):
+		DSS.new(public_key, 'fips-186-3').verify(SHA256.new(data), signature)
+
+	def generate_rsa(self):
+		key = RSA.generate(2048)
+		return key.export_key(), key.publickey().export_key()
+
+	def generate_ecc(self):
+		key = ECC.generate(curve='P-256')
+		return key.export_key(format='DER'), key.public_key().export_key(format='DER')
+
+	def sha256(self, data):
+		return SHA256.new(data).digest()
+
+class CryptographyProvider(CryptoProvider):
+	name = "cryptography"
+
+	_OAEP = padding.OAEP(mgf=padding.MGF1(hashes.SHA1()), algorithm=hashes.SHA1(), label=None)
+	_ECDSA = ec.ECDSA(hashes.SHA256())
+
+	def aead_encrypt(self, key, nonce, data):
+		return AESGCM(key).encrypt(nonce, data, None)
+
+	def aead_decrypt(self, key, nonce, data):
+		return AESGCM(key).decrypt(nonce, data, None)
+
+	def gcm_stream(self, key, iv, data):
+		# update() sin finalize: el keystream de GCM sin calcular ni comprobar el tag
+		return Cipher(algorithms.AES(key), modes.GCM(iv)).encryptor().update(data)
+
+	@staticmethod
+	def _load(key: KeyData, private: bool):
+		data = _key_bytes(key)
+		if data.lstrip().startswith(b"-----"):
+			return serialization.load_pem_private_key(data, None) if private else serialization.load_pem_public_key(data)
+		return serialization.load_der_private_key(data, None) if private else serialization.load_der_public_key(data)
+
+	def rsa_public_key(self, pem):
+		return self._load(pem, private=False)
+
+	def rsa_private_key(self, pem):
+		return self._load(pem, private=True)
+
+	def rsa_oaep_encrypt(self, public_key, data):
+		return public_key.encrypt(data, self._OAEP)
+
+	def rsa_oaep_decrypt(self, private_key, data):
+		return private_key.decrypt(data, self._OAEP)
+
+	def rsa_sign(self, private_key, data):
+		return private_key.sign(data, padding.PKCS1v15(), hashes.SHA256())
+
+	def rsa_verify(self, public_key, data, signature):
+		try:
+			public_key.verify(signature, data, padding.PKCS1v15(), hashes.SHA256())
+		except InvalidSignature:
+			raise ValueError("Invalid signature")
+
+	def ecc_public_key(self, key):
+		return self._load(key, private=False)
+
+	def ecc_private_key(self, key):
+		return self._load(key, private=True)
+
+	def ecdsa_sign(self, private_key, data):
+		r, s = decode_dss_signature(private_key.sign(data, self._ECDSA))
+		return r.to_bytes(32, "big") + s.to_bytes(32, "big")
+
+	def ecdsa_verify(self, public_key, data, signature):
+		if len(signature) != 64:
+			raise ValueError("The signature is not authentic (length)")
+		der = encode_dss_signature(int.from_bytes(signature[:32], "big"), int.from_bytes(signature[32:], "big"))
+		try:
+			public_key.verify(der, data, self._ECDSA)
+		except InvalidSignature:
+			raise ValueError("The signature is not authentic")
+
+	def generate_rsa(self):
+		key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+		# Sin el salto de línea final, igual que RSA.export_key de pycryptodome
+		private_pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL, serialization.NoEncryption())
+		public_pem = key.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+		return private_pem.rstrip(b"\n"), public_pem.rstrip(b"\n")
+
+	def generate_ecc(self):
+		key = ec.generate_private_key(ec.SECP256R1())
+		private_der = key.private_bytes(serialization.Encoding.DER, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+		public_der = key.public_key().public_bytes(serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+		return private_der, public_der
+
+	def sha256(self, data):
+		digest = hashes.Hash(hashes.SHA256())
+		digest.update(data)
+		return digest.finalize()
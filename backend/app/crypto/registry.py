@@ -0,0 +1,137 @@
+import logging
+import os
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+from app.config import get_setting
+from app.crypto.providers import CryptographyProvider, CryptoProvider, PycryptodomeProvider
+
+logger = logging.getLogger(__name__)
+
+# Qué proveedor atiende cada primitiva. Por defecto, el reparto fijo de abajo (el más
+# rápido de cada una medido con benchmark() en x86-64, con la importación de la clave
+# incluida); CRYPTO_PROVIDER=auto vuelve a medir al arrancar. Los formatos no cambian:
+# mezclar es seguro.
+DEFAULT_PROVIDERS = {
+	"aead": "cryptography",
+	"gcm_stream": "cryptography",
+	# cryptography valida la clave privada RSA al cargarla: más del doble de lento por llamada
+	"rsa_oaep": "pycryptodome",
+	"rsa_sign": "pycryptodome",
+	# Unas 8 veces más rápido en cryptography (clave incluida)
+	"ecdsa": "cryptography",
+	# Una clave RSA de 2048 bits: ~1 s con pycryptodome, ~80 ms con cryptography
+	"rsa_keygen": "cryptography",
+	"ecc_keygen": "cryptography",
+	"sha256": "cryptography",
+}
+PRIMITIVES = tuple(DEFAULT_PROVIDERS)
+# La generación de claves no se mide al arrancar: una clave RSA de pycryptodome tarda
+# cientos de ms y el tiempo varía mucho de una a otra, así que una muestra no decide nada
+STARTUP_BENCHMARK = tuple(primitive for primitive in PRIMITIVES if not primitive.endswith("_keygen"))
+
+BENCHMARK_SECONDS = 0.05
+_PAYLOAD = os.urandom(256)
+
+def _benchmarks(provider: CryptoProvider, fixtures: Dict[str, bytes]) -> Dict[str, Callable[[], object]]:
+	# Cada operación como en el camino real: las claves de usuario se importan en cada llamada
+	key, nonce, iv = fixtures["aes_key"], fixtures["nonce"], fixtures["iv"]
+	sealed = provider.aead_encrypt(key, nonce, _PAYLOAD)
+	return {
+		"aead": lambda: provider.aead_decrypt(key, nonce, provider.aead_encrypt(key, nonce, _PAYLOAD)),
+		"gcm_stream": lambda: provider.gcm_stream(key, iv, _PAYLOAD),
+		"rsa_oaep": lambda: provider.rsa_oaep_decrypt(
+			provider.rsa_private_key(fixtures["rsa_private"]),
+			provider.rsa_oaep_encrypt(provider.rsa_public_key(fixtures["rsa_public"]), key),
+		),
+		"rsa_sign": lambda: provider.rsa_sign(provider.rsa_private_key(fixtures["rsa_private"]), sealed),
+		"ecdsa": lambda: provider.ecdsa_verify(
+			provider.ecc_public_key(fixtures["ecc_public"]), sealed,
+			provider.ecdsa_sign(provider.ecc_private_key(fixtures["ecc_private"]), sealed),
+		),
+		"rsa_keygen": provider.generate_rsa,
+		"ecc_keygen": provider.generate_ecc,
+		"sha256": lambda: provider.sha256(sealed),
+	}
+
+def _time_per_call(operation: Callable[[], object], seconds: float) -> float:
+	# Al menos una llamada; después, las que quepan en el presupuesto
+	calls = 0
+	started = time.perf_counter()
+	elapsed = 0.0
+	while calls == 0 or elapsed < seconds:
+		operation()
+		calls += 1
+		elapsed = time.perf_counter() - started
+	return elapsed / calls
+
+class ProviderRegistry:
+	"""
+	Proveedor elegido por primitiva. get() es una lectura de diccionario: las funciones
+	de crypto.py y signing.py la llaman en cada operación.
+	"""
+	def __init__(self, providers: Iterable[CryptoProvider], defaults: Dict[str, str]):
+		self.providers = {provider.name: provider for provider in providers}
+		self._selected = dict(defaults)
+		self.timings: Dict[str, Dict[str, float]] = {}
+
+	def get(self, primitive: str) -> CryptoProvider:
+		return self.providers[self._selected[primitive]]
+
+	def selection(self) -> Dict[str, str]:
+		return dict(self._selected)
+
+	def use(self, name: str, primitives: Optional[Iterable[str]] = None):
+		if name not in self.providers:
+			raise ValueError(f"Proveedor criptográfico desconocido: {name}")
+		selected = dict(self._selected)
+		for primitive in primitives or PRIMITIVES:
+			if primitive not in selected:
+				raise ValueError(f"Primitiva desconocida: {primitive}")
+			selected[primitive] = name
+		self._selected = selected
+
+	def benchmark(self, primitives: Optional[Iterable[str]] = None, seconds: float = BENCHMARK_SECONDS) -> Dict[str, Dict[str, float]]:
+		"""
+		Segundos por operación de cada proveedor en cada primitiva.
+		"""
+		rsa_private, rsa_public = self.get("rsa_keygen").generate_rsa()
+		ecc_private, ecc_public = self.get("ecc_keygen").generate_ecc()
+		fixtures = {
+			"aes_key": os.urandom(32), "nonce": os.urandom(12), "iv": os.urandom(16),
+			"rsa_private": rsa_private, "rsa_public": rsa_public,
+			"ecc_private": ecc_private, "ecc_public": ecc_public,
+		}
+		operations = {name: _benchmarks(provider, fixtures) for name, provider in self.providers.items()}
+		timings = {}
+		for primitive in primitives or PRIMITIVES:
+			timings[primitive] = {name: _time_per_call(ops[primitive], seconds) for name, ops in operations.items()}
+		return timings
+
+	def select_fastest(self, primitives: Optional[Iterable[str]] = None, seconds: float = BENCHMARK_SECONDS) -> Dict[str, str]:
+		timings = self.benchmark(primitives, seconds)
+		selected = dict(self._selected)
+		for primitive, by_provider in timings.items():
+			selected[primitive] = min(by_provider, key=by_provider.get)
+		self.timings.update(timings)
+		self._selected = selected
+		return self.selection()
+
+registry = ProviderRegistry([PycryptodomeProvider(), CryptographyProvider()], DEFAULT_PROVIDERS)
+
+def provider(primitive: str) -> CryptoProvider:
+	return registry.get(primitive)
+
+def configure_crypto_providers() -> Dict[str, str]:
+	"""
+	CRYPTO_PROVIDER=default (por defecto) deja DEFAULT_PROVIDERS sin medir nada; auto mide
+	ambos proveedores (salvo la generación de claves) y elige el más rápido por primitiva;
+	pycryptodome o cryptography los fija para todo.
+	"""
+	mode = get_setting("CRYPTO_PROVIDER", "default").lower()
+	if mode == "auto":
+		registry.select_fastest(STARTUP_BENCHMARK)
+	elif mode != "default":
+		registry.use(mode)
+	logger.info("Proveedores criptográficos: %s", registry.selection())
+	return registry.selection()
@@ -1,22 +1,20 @@
-# Importación de llaves y algoritmos de firma
-from Crypto.PublicKey import RSA, ECC
-from Crypto.Signature import pkcs1_15, DSS
-from Crypto.Hash import SHA256
+# Firmas a través del registro de proveedores (pycryptodome o cryptography, el más rápido)
 import base64
 
+from .registry import provider
+
 # Importación de funciones auxiliares para codificación
 from .crypto import str_to_bytes, bytes_to_str
 
 # 🖊️ Firmar datos usando RSA y SHA-256
 def sign_data(data: str, private_key_pem: bytes) -> str:
+    rsa = provider("rsa_sign")
+
     # Importa la clave privada RSA desde formato PEM
-    private_key = RSA.import_key(private_key_pem)
-    
-    # Crea un hash del mensaje a firmar
-    hash_obj = SHA256.new(data.encode('utf-8'))
+    private_key = rsa.rsa_private_key(private_key_pem)
     
-    # Genera la firma con PKCS#1 v1.5
-    signature = pkcs1_15.new(private_key).sign(hash_obj)
+    # Genera la firma con PKCS#1 v1.5 sobre SHA-256 del mensaje
+    signature = rsa.rsa_sign(private_key, data.encode('utf-8'))
     
     # Devuelve la firma codificada en base64 (como string)
     return base64.b64encode(signature).decode('utf-8')
@@ -24,17 +22,16 @@ def sign_data(data: str, private_key_pem: bytes) -> str:
 # ✅ Verificar firma RSA
 def verify_signature(data: str, signature_b64: str, public_key_pem: bytes) -> bool:
     try:
+        rsa = provider("rsa_sign")
+
         # Importa la clave pública RSA
-        public_key = RSA.import_key(public_key_pem)
-        
-        # Calcula el hash del mensaje original
-        hash_obj = SHA256.new(data.encode('utf-8'))
+        public_key = rsa.rsa_public_key(public_key_pem)
         
         # Decodifica la firma desde base64
         signature = base64.b64decode(signature_b64)
         
         # Verifica que la firma coincida con el mensaje
-        pkcs1_15.new(public_key).verify(hash_obj, signature)
+        rsa.rsa_verify(public_key, data.encode('utf-8'), signature)
         return True
     except Exception as e:
         # Si falla la verificación, imprime el error y devuelve False
@@ -48,34 +45,37 @@ def sign_data_ecdsa(data: str, private_key_pem) -> str:
     if isinstance(private_key_pem, bytes):
         private_key_pem = str_to_bytes(private_key_pem)
 
-    private_key = ECC.import_key(private_key_pem)
+    ecdsa = provider("ecdsa")
+    private_key = ecdsa.ecc_private_key(private_key_pem)
 
     # Se usa el mismo hash que RSA: SHA-256
     # El data es texto plano, se codifica a UTF-8, no es base64
-    hash_obj = SHA256.new(data.encode('utf-8'))
+    # Firma según el estándar FIPS 186-3 (r||s) y la retorna en base64
+    signature = ecdsa.ecdsa_sign(private_key, data.encode('utf-8'))
+    return bytes_to_str(signature)
 
-    # Crea el firmador según el estándar FIPS 186-3
-    signer = DSS.new(private_key, 'fips-186-3')
+# 🖊️ Firmar varios datos con la misma clave ECDSA: se importa la clave una sola vez
+def sign_data_ecdsa_batch(items: list, private_key_pem) -> list:
+    if isinstance(private_key_pem, bytes):
+        private_key_pem = str_to_bytes(private_key_pem)
 
-    # Firma el hash y lo retorna en base64
-    signature = signer.sign(hash_obj)
-    return bytes_to_str(signature)
+    ecdsa = provider("ecdsa")
+    private_key = ecdsa.ecc_private_key(private_key_pem)
+    return [bytes_to_str(ecdsa.ecdsa_sign(private_key, data.encode('utf-8'))) for data in items]
 
 # ✅ Verificar firma con ECDSA (clave pública)
 def verify_signature_ecdsa(data: str, signature_b64: str, public_key_pem: str) -> bool:
     try:
+        ecdsa = provider("ecdsa")
+
         # Importa la clave pública ECC
-        public_key = ECC.import_key(public_key_pem)
-        
-        # Hash del mensaje original
-        hash_obj = SHA256.new(data.encode('utf-8'))
+        public_key = ecdsa.ecc_public_key(public_key_pem)
         
         # Decodifica la firma desde base64
         signature = str_to_bytes(signature_b64)
         
-        # Verifica si la firma es válida
-        verifier = DSS.new(public_key, 'fips-186-3')
-        verifier.verify(hash_obj, signature)
+        # Verifica si la firma es válida (SHA-256 del mensaje original)
+        ecdsa.ecdsa_verify(public_key, data.encode('utf-8'), signature)
         return True
     except Exception as e:
         # Imprime error y devuelve False si no pasa la verificación
@@ -0,0 +1,159 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.config import get_setting
+from app.db.db import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+class WriteCoalescer:
+	"""
+	Group commit de los envíos: las peticiones encolan su escritura y un único
+	hilo escritor las aplica en una transacción cada `max_delay` segundos o cada
+	`max_batch` escrituras, lo que ocurra antes. Un commit (un fsync) cubre todo
+	el lote a cambio de hasta `max_delay` de latencia extra por envío.
+	Quien espera un resultado no pasa de `result_timeout` segundos.
+	"""
+	def __init__(self, session_factory=SessionLocal, max_batch: int = 100, max_delay: float = 0.005, result_timeout: float = 10.0):
+		self.session_factory = session_factory
+		self.max_batch = max_batch
+		self.max_delay = max_delay
+		self.result_timeout = result_timeout
+		# submit y close se excluyen: nada entra en la cola detrás de la marca de parada
+		self._lock = threading.Lock()
+		self._closed = False
+		self._queue: "queue.Queue[Optional[Tuple[Callable, Optional[Callable], Future]]]" = queue.Queue()
+		self._writer = threading.Thread(target=self._run, name="write-coalescer", daemon=True)
+		self._writer.start()
+
+	def submit(self, write: Callable[[Session], object], finalize: Optional[Callable[[Session, list], None]] = None) -> Future:
+		"""
+		write(session) hace flush de sus filas y devuelve el resultado.
+		finalize(session, resultados) se llama una vez por lote, antes del commit,
+		con los resultados de todas las escrituras que lo comparten (p. ej. para
+		agregar actualizaciones que varios envíos harían por separado).
+		El futuro se resuelve tras el commit del lote, con las filas ya
+		separadas de la sesión y sus ids asignados.
+		"""
+		future: Future = Future()
+		with self._lock:
+			if self._closed or not self._writer.is_alive():
+				future.set_exception(RuntimeError("WriteCoalescer cerrado"))
+				return future
+			self._queue.put((write, finalize, future))
+		return future
+
+	def _run(self):
+		while True:
+			item = self._queue.get()
+			if item is None:
+				return
+			batch = [item]
+			stopping = False
+			deadline = time.monotonic() + self.max_delay
+			while len(batch) < self.max_batch:
+				timeout = deadline - time.monotonic()
+				if timeout <= 0:
+					break
+				try:
+					item = self._queue.get(timeout=timeout)
+				except queue.Empty:
+					break
+				if item is None:
+					stopping = True
+					break
+				batch.append(item)
+			self._flush(batch)
+			if stopping:
+				return
+
+	def _flush(self, batch: List[Tuple[Callable, Optional[Callable], Future]]):
+		done = []
+		try:
+			with self.session_factory() as session:
+				pending: Dict[Callable, list] = {}
+				for write, finalize, future in batch:
+					if not future.set_running_or_notify_cancel():
+						continue
+					# Savepoint por envío: uno que falla no tumba al resto del lote
+					try:
+						with session.begin_nested():
+							result = write(session)
+					except Exception as e:
+						future.set_exception(e)
+						continue
+					done.append((future, result))
+					if finalize is not None:
+						pending.setdefault(finalize, []).append(result)
+				for finalize, results in pending.items():
+					finalize(session, results)
+				session.flush()
+				session.expunge_all()
+				session.commit()
+		except Exception as e:
+			logger.exception("Falló el commit de un lote de %d escrituras", len(done))
+			for future, _ in done:
+				future.set_exception(e)
+			return
+		for future, result in done:
+			future.set_result(result)
+
+	def close(self, timeout: float = 5.0):
+		# Lo ya encolado se escribe antes de parar
+		with self._lock:
+			if self._closed:
+				return
+			self._closed = True
+			self._queue.put(None)
+		self._writer.join(timeout)
+		# Lo que el escritor no llegó a tomar (se agotó el plazo o murió) falla en vez de
+		# quedar pendiente para siempre
+		leftover = 0
+		while True:
+			try:
+				item = self._queue.get_nowait()
+			except queue.Empty:
+				break
+			if item is None:
+				continue
+			leftover += 1
+			future = item[2]
+			if future.set_running_or_notify_cancel():
+				future.set_exception(RuntimeError("WriteCoalescer cerrado antes de escribir"))
+		if leftover:
+			logger.warning("WriteCoalescer cerrado con %d escrituras sin aplicar", leftover)
+		if self._writer.is_alive():
+			# La marca de parada pudo salir con el resto: el escritor termina tras su lote
+			self._queue.put(None)
+
+_coalescer = None
+_coalescer_lock = threading.Lock()
+
+def get_write_coalescer() -> Optional[WriteCoalescer]:
+	"""
+	WRITE_COALESCER=true activa el group commit de los envíos (desactivado por defecto).
+	WRITE_COALESCE_MAX_BATCH y WRITE_COALESCE_MAX_DELAY_MS ajustan el tamaño y la espera del lote.
+	"""
+	global _coalescer
+	if get_setting("WRITE_COALESCER", "false").lower() != "true":
+		return None
+	with _coalescer_lock:
+		if _coalescer is None:
+			_coalescer = WriteCoalescer(
+				max_batch=int(get_setting("WRITE_COALESCE_MAX_BATCH", "100")),
+				max_delay=float(get_setting("WRITE_COALESCE_MAX_DELAY_MS", "5")) / 1000,
+			)
+		return _coalescer
+
+def close_write_coalescer():
+	global _coalescer
+	with _coalescer_lock:
+		if _coalescer is not None:
+			_coalescer.close()
+			_coalescer = None
@@ -1,23 +1,34 @@
 import sqlalchemy
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.engine.url import make_url
-from dotenv import load_dotenv
-import os
+from starlette.requests import Request
+import hashlib
+import hmac
+import itertools
+import threading
+import time
+from typing import Optional
 
-# Cargar variables de entorno
-load_dotenv()
+from app.config import get_setting
 
-# Obtener URL de la base de datos
-DATABASE_URL = os.getenv("DATABASE_URL")
+# Nada de este módulo abre conexiones al importarse: los engines se crean en el
+# primer uso y el esquema se prepara en init_database (lifespan de la app)
+def get_database_url():
+	return get_setting("DATABASE_URL")
 
 def create_database_if_not_exists():
 	# Parse the URL
-	url = make_url(DATABASE_URL)
+	url = make_url(get_database_url())
 	target_db = url.database
 
+	# Solo Postgres necesita crear la base de datos por adelantado
+	if url.get_backend_name() != "postgresql":
+		return
+
 	# Modify URL to connect to 'postgres' database instead
 	url = url.set(database="postgres")
 
@@ -39,10 +50,32 @@ def create_database_if_not_exists():
 	engine.dispose()
 
 # Crear engine con manejo de excepciones
-def create_engine_with_error_handling():
+def create_engine_with_error_handling(database_url: Optional[str] = None):
 	try:
 		return sqlalchemy.create_engine(
-			DATABASE_URL,
+			database_url or get_database_url(),
+			pool_size=10,
+			max_overflow=20,
+			pool_timeout=30,
+			pool_recycle=3600,
+		)
+	except SQLAlchemyError as e:
+		print(f"Error al conectar a la base de datos: {e}")
+		raise
+
+# URL equivalente con driver async (asyncpg / aiosqlite)
+def async_database_url(database_url: str):
+	url = make_url(database_url)
+	if url.get_backend_name() == "postgresql":
+		return url.set(drivername="postgresql+asyncpg")
+	if url.get_backend_name() == "sqlite":
+		return url.set(drivername="sqlite+aiosqlite")
+	return url
+
+def create_async_engine_with_error_handling(database_url: Optional[str] = None):
+	try:
+		return create_async_engine(
+			async_database_url(database_url or get_database_url()),
 			pool_size=10,
 			max_overflow=20,
 			pool_timeout=30,
@@ -52,20 +85,154 @@ def create_engine_with_error_handling():
 		print(f"Error al conectar a la base de datos: {e}")
 		raise
 
-create_database_if_not_exists()
+_engine = None
+_async_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+	global _engine
+	if _engine is None:
+		with _engine_lock:
+			if _engine is None:
+				_engine = create_engine_with_error_handling()
+	return _engine
+
+def get_async_engine():
+	global _async_engine
+	if _async_engine is None:
+		with _engine_lock:
+			if _async_engine is None:
+				_async_engine = create_async_engine_with_error_handling()
+	return _async_engine
+
+# Réplicas de lectura: DATABASE_REPLICA_URLS=url1,url2 (vacío = todo va al primario)
+def get_replica_urls():
+	urls = get_setting("DATABASE_REPLICA_URLS", "")
+	return [url.strip() for url in urls.split(",") if url.strip()]
+
+_replica_engines = None
+_async_replica_engines = None
+_replica_counter = itertools.count()
+
+def get_replica_engines():
+	global _replica_engines
+	if _replica_engines is None:
+		with _engine_lock:
+			if _replica_engines is None:
+				_replica_engines = [create_engine_with_error_handling(url) for url in get_replica_urls()]
+	return _replica_engines
+
+def get_async_replica_engines():
+	global _async_replica_engines
+	if _async_replica_engines is None:
+		with _engine_lock:
+			if _async_replica_engines is None:
+				_async_replica_engines = [create_async_engine_with_error_handling(url) for url in get_replica_urls()]
+	return _async_replica_engines
+
+# Cookie en la que el cliente lleva su marca de escritura a cualquier worker
+READ_YOUR_WRITES_COOKIE = "rw_until"
+
+class RecentWrites:
+	"""
+	Usuarios que escribieron hace menos de `window` segundos.
+	Sus lecturas van al primario para que vean lo que acaban de enviar
+	aunque la réplica vaya con retraso. El registro en memoria es por worker;
+	con varios workers vale la marca firmada que el cliente devuelve en la
+	cookie READ_YOUR_WRITES_COOKIE (ver ReadYourWritesMiddleware).
+	"""
+	def __init__(self, window: float, max_entries: int = 10_000):
+		self.window = window
+		self.max_entries = max_entries
+		self._lock = threading.Lock()
+		self._until = {}
+
+	def mark(self, user: str, request: Optional[Request] = None):
+		now = time.monotonic()
+		with self._lock:
+			if len(self._until) >= self.max_entries:
+				self._until = {key: until for key, until in self._until.items() if until > now}
+			self._until[user] = now + self.window
+		if request is not None:
+			# El middleware la devuelve al cliente como cookie
+			request.state.read_your_writes = self.marker(user)
+
+	def _sign(self, user: str, until: str) -> str:
+		secret = (get_setting("SECRET_KEY") or "").encode()
+		return hmac.new(secret, f"{user}:{until}".encode(), hashlib.sha256).hexdigest()
 
-# Crear el engine y verificar la conexión
-engine = create_engine_with_error_handling()
+	def marker(self, user: str) -> str:
+		# Reloj de pared: la marca se comprueba en otros workers y máquinas
+		until = str(int(time.time() + self.window))
+		return f"{until}.{self._sign(user, until)}"
+
+	def is_marked(self, user: str, marker: Optional[str]) -> bool:
+		until, _, signature = (marker or "").partition(".")
+		if not until.isdigit() or int(until) < time.time():
+			return False
+		return hmac.compare_digest(signature, self._sign(user, until))
+
+	def is_recent(self, user: str) -> bool:
+		with self._lock:
+			until = self._until.get(user)
+			if until is None:
+				return False
+			if until <= time.monotonic():
+				del self._until[user]
+				return False
+			return True
+
+recent_writes = RecentWrites(float(get_setting("READ_YOUR_WRITES_SECONDS", "5")))
+
+def _pick_read_engine(replicas, primary_getter, user: Optional[str], marker: Optional[str] = None):
+	if not replicas or (user and (recent_writes.is_recent(user) or recent_writes.is_marked(user, marker))):
+		return primary_getter()
+	# Round-robin entre réplicas
+	return replicas[next(_replica_counter) % len(replicas)]
+
+def get_read_engine(user: Optional[str] = None, marker: Optional[str] = None):
+	return _pick_read_engine(get_replica_engines(), get_engine, user, marker)
+
+def get_async_read_engine(user: Optional[str] = None, marker: Optional[str] = None):
+	return _pick_read_engine(get_async_replica_engines(), get_async_engine, user, marker)
+
+class _LazySessionmaker(sessionmaker):
+	"""
+	sessionmaker que resuelve el engine al abrir la primera sesión.
+	Respeta un bind explícito (configure o argumento), p. ej. en tests.
+	"""
+	def __init__(self, engine_getter, **kw):
+		super().__init__(**kw)
+		self._engine_getter = engine_getter
+
+	def __call__(self, **local_kw):
+		if local_kw.get("bind") is None and self.kw.get("bind") is None:
+			local_kw["bind"] = self._engine_getter()
+		return super().__call__(**local_kw)
+
+class _LazyAsyncSessionmaker(async_sessionmaker):
+	def __init__(self, engine_getter, **kw):
+		super().__init__(**kw)
+		self._engine_getter = engine_getter
+
+	def __call__(self, **local_kw):
+		if local_kw.get("bind") is None and self.kw.get("bind") is None:
+			local_kw["bind"] = self._engine_getter()
+		return super().__call__(**local_kw)
 
 # Crear session
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = _LazySessionmaker(get_engine, autocommit=False, autoflush=False)
+
+# Engine y sesiones async para los endpoints async def: la concurrencia queda
+# limitada por el pool de conexiones y no por el threadpool de Starlette
+AsyncSessionLocal = _LazyAsyncSessionmaker(get_async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 # Base para los modelos
 Base = declarative_base()
 
 # Crear tablas si no existen
 def create_tables():
-	Base.metadata.create_all(bind=engine)
+	Base.metadata.create_all(bind=get_engine())
 
 # Verificar conexión a la base de datos
 def check_connection(engine):
@@ -76,9 +243,25 @@ def check_connection(engine):
 	except SQLAlchemyError as e:
 		print(f"Error al conectar a la base de datos: {e}")
 
-# Llamar a la función para crear tablas y verificar la conexión
-create_tables()
-check_connection(engine)
+# Preparar la base de datos; se llama desde el lifespan de FastAPI
+def init_database():
+	create_database_if_not_exists()
+	create_tables()
+	check_connection(get_engine())
+
+# Cerrar los pools al apagar el worker
+async def dispose_engines():
+	global _engine, _async_engine, _replica_engines, _async_replica_engines
+	with _engine_lock:
+		engines = [_engine] + (_replica_engines or [])
+		async_engines = [_async_engine] + (_async_replica_engines or [])
+		_engine = _async_engine = _replica_engines = _async_replica_engines = None
+	for engine in engines:
+		if engine is not None:
+			engine.dispose()
+	for async_engine in async_engines:
+		if async_engine is not None:
+			await async_engine.dispose()
 
 # Función para obtener la base de datos
 def get_db():
@@ -89,4 +272,36 @@ def get_db():
 		db.rollback()  # Deshacer cualquier cambio en caso de error
 		raise e
 	finally:
-		db.close()
\ No newline at end of file
+		db.close()
+
+async def get_async_db():
+	async with AsyncSessionLocal() as db:
+		try:
+			yield db
+		except Exception as e:
+			await db.rollback()
+			raise e
+
+def _request_user(request) -> Optional[str]:
+	# Lo deja get_current_user(_async), que el endpoint declara antes de la sesión
+	# (FastAPI resuelve las dependencias en ese orden); sin autenticar no hay usuario
+	return getattr(request.state, "user", None)
+
+# Lecturas sobre réplica; el usuario autenticado se fija al primario tras escribir
+def get_read_db(request: Request):
+	db = SessionLocal(bind=get_read_engine(_request_user(request), request.cookies.get(READ_YOUR_WRITES_COOKIE)))
+	try:
+		yield db
+	except Exception as e:
+		db.rollback()
+		raise e
+	finally:
+		db.close()
+
+async def get_async_read_db(request: Request):
+	async with AsyncSessionLocal(bind=get_async_read_engine(_request_user(request), request.cookies.get(READ_YOUR_WRITES_COOKIE))) as db:
+		try:
+			yield db
+		except Exception as e:
+			await db.rollback()
+			raise e
@@ -1,17 +1,22 @@
 from fastapi import APIRouter, Depends, Request
-from dotenv import load_dotenv
 from typing import List
 import json
 import hashlib
 
-from sqlalchemy.orm import Session
+from sqlalchemy import text
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends
-from app.db.db import get_db
+from app.db.db import get_db, get_async_read_db
 from app.model.models import Block, BlockMessage, PeerMessage,GroupMessage
 
 from app.utils.limiter import limiter
+from app.utils.executor import run_crypto
 
-load_dotenv()
+# Mensajes por bloque
+BLOCK_SIZE = 4
+# Clave del advisory lock de Postgres que serializa la creación de bloques
+CHAIN_LOCK_KEY = 0x636861696E
 
 class BlockchainManager:
 	def __init__(self, db_session):
@@ -20,9 +25,10 @@ class BlockchainManager:
 	def get_last_block(self):
 		return self.db.query(Block).order_by(Block.id.desc()).first()
 
-	def create_block(self, messages: List[BlockMessage]):
-		last_block = self.get_last_block()
-		previous_hash = last_block.hash if last_block else "0"
+	def create_block(self, messages: List[BlockMessage], previous_hash: str = None):
+		if previous_hash is None:
+			last_block = self.get_last_block()
+			previous_hash = last_block.hash if last_block else "0"
 
 		# Simple hash based on message content
 		message_data = []
@@ -38,46 +44,81 @@ class BlockchainManager:
 			messages=messages,
 			block_string=block_string
 		)
+		# La relación messages asigna block_id a los mensajes al hacer flush
 		self.db.add(new_block)
-		self.db.commit()
 		return new_block
 
-	def add_message(self, is_p2p, message_id):
-		if is_p2p:
-			db_message = self.db.query(PeerMessage).filter(PeerMessage.id == message_id).first()
-		else:
-			db_message = self.db.query(GroupMessage).filter(GroupMessage.id == message_id).first()
-
-		new_msg = BlockMessage(
-			is_p2p=is_p2p,
-			message_id=message_id,
-			message_str=json.loads(db_message.message)["mensaje"],
-			message_hash=db_message.hash
-		)
-		self.db.add(new_msg)
-		self.db.commit()
-
-		# Check if a new block should be created
+	def add_message(self, is_p2p, message):
+		"""
+		Añade el mensaje a la cadena sin hacer commit: el llamador confirma
+		mensaje y entrada de la cadena en la misma transacción.
+		Acepta el mensaje ya cargado o su id.
+		"""
+		if isinstance(message, int):
+			model = PeerMessage if is_p2p else GroupMessage
+			message = self.db.query(model).filter(model.id == message).first()
+		self.add_messages(is_p2p, [message])
+
+	def _lock_chain(self):
+		"""
+		Serializa la cadena hasta el fin de la transacción: sin esto dos envíos
+		concurrentes leen las mismas entradas sin bloque y el mismo último bloque.
+		"""
+		connection = self.db.connection()
+		if connection.dialect.name == "postgresql":
+			connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": CHAIN_LOCK_KEY})
+		elif connection.dialect.name == "sqlite" and not connection.connection.driver_connection.in_transaction:
+			# pysqlite abre la transacción en el primer INSERT, que ya toma el bloqueo
+			# de escritura; si aún no la hay se toma ahora
+			connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+	def add_messages(self, is_p2p, messages: list):
+		"""
+		Añade varios mensajes ya insertados a la cadena: un INSERT multi-fila para
+		las entradas y todos los bloques completos que resulten, sin hacer commit.
+		"""
+		self._lock_chain()
+		self.db.add_all([
+			BlockMessage(
+				is_p2p=is_p2p,
+				message_id=message.id,
+				# envelope: en una difusión P2P une la parte común con la clave del destinatario
+				message_str=json.loads(message.envelope)["mensaje"],
+				message_hash=message.hash
+			)
+			for message in messages
+		])
+		self.db.flush()
+
+		# Check if new blocks should be created
 		unassigned = (
 			self.db.query(BlockMessage)
 			.filter(BlockMessage.block_id == None)
-			.limit(4)
+			.order_by(BlockMessage.id)
 			.all()
 		)
+		complete = len(unassigned) - len(unassigned) % BLOCK_SIZE
+		if not complete:
+			return
 
-		if len(unassigned) == 4:
-			self.create_block(unassigned)
-			for m in unassigned:
-				m.block_id = self.get_last_block().id
-			self.db.commit()
+		last_block = self.get_last_block()
+		previous_hash = last_block.hash if last_block else "0"
+		for start in range(0, complete, BLOCK_SIZE):
+			previous_hash = self.create_block(unassigned[start:start + BLOCK_SIZE], previous_hash).hash
+		self.db.flush()
 
-	def get_all_blocks(self):
-		blocks: List[Block] = (
+	def load_blocks(self) -> List[Block]:
+		# Mensajes de todos los bloques en una consulta extra, no una por bloque
+		return (
 			self.db.query(Block)
+			.options(selectinload(Block.messages))
 			.order_by(Block.id.asc())
 			.all()
 		)
 
+	def get_all_blocks(self):
+		blocks = self.load_blocks()
+
 		result = []
 		for block in blocks:
 			block_info = {
@@ -102,8 +143,10 @@ class BlockchainManager:
 		return result
 
 	def verify_blockchain(self):
-		blocks: List[Block] = self.db.query(Block).order_by(Block.id.asc()).all()
+		return self.verify_blocks(self.load_blocks())
 
+	@staticmethod
+	def verify_blocks(blocks: List[Block]):
 		if not blocks:
 			return True, "No blocks found. Blockchain is empty."
 
@@ -131,12 +174,12 @@ router = APIRouter(prefix="", tags=["chat"])
 
 @router.get("/transactions")
 @limiter.limit("1/5seconds")
-def get_transactions(request: Request, db: Session = Depends(get_db)):
-	manager = BlockchainManager(db)
-	return manager.get_all_blocks()
+async def get_transactions(request: Request, db: AsyncSession = Depends(get_async_read_db)):
+	return await db.run_sync(lambda session: BlockchainManager(session).get_all_blocks())
 
 @router.get("/verify-transactions")
 @limiter.limit("1/5seconds")
-def get_transactions(request: Request, db: Session = Depends(get_db)):
-	manager = BlockchainManager(db)
-	return manager.verify_blockchain()
\ No newline at end of file
+async def get_transactions(request: Request, db: AsyncSession = Depends(get_async_read_db)):
+	blocks = await db.run_sync(lambda session: BlockchainManager(session).load_blocks())
+	# Recalcular los hashes de toda la cadena es CPU: fuera del event loop
+	return await run_crypto(BlockchainManager.verify_blocks, blocks)
\ No newline at end of file
@@ -1,23 +1,95 @@
-from fastapi import APIRouter, Depends, Request
-from dotenv import load_dotenv
-from typing import List
-
-from app.auth.dependencies import get_current_user
-
+from fastapi import APIRouter, Depends, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from typing import Callable, List, Optional, Union
+from collections import OrderedDict
+from datetime import datetime
+import asyncio
+import base64
+import binascii
+import hashlib
+import logging
+import threading
+
+from app.auth.dependencies import get_current_user, get_current_user_async
+from app.auth.jwt import decode_token
+
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends, HTTPException
-from app.db.db import get_db
+from app.db.db import get_db, get_read_db, get_async_read_db, recent_writes, SessionLocal
+from app.db.coalescer import get_write_coalescer
+from app.crypto.message_cache import get_message_cache
+from app.crypto.blind_index import message_search_enabled
 import app.model.models as mdls
+from app.model.identity import public_keys
+from app.model.search import SEARCH_MAX_RESULTS, search_groups, search_users
 from app.utils.sanitize import sanitize_for_output
 
 from .chain import BlockchainManager
 from app.utils.limiter import limiter
+from app.realtime.bus import get_bus, group_channel, user_channel
+
+logger = logging.getLogger(__name__)
 
-load_dotenv()
 USER_NOT_FOUND = HTTPException(status_code=404, detail="User not found")
 
 router = APIRouter(prefix="", tags=["chat"])
 
+# Historial descifrado o, con ?raw=true, los sobres tal como están guardados
+HistoryResponse = Union[List[mdls.MessageResponse], List[mdls.RawMessageResponse]]
+
+def _raw_response(messages: List[dict]) -> JSONResponse:
+	# Los sobres ya son texto y tienen la forma de RawMessageResponse: se devuelven sin revalidar
+	return JSONResponse(jsonable_encoder(messages))
+
+def _encode_cursor(value: str) -> str:
+	return base64.urlsafe_b64encode(value.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> str:
+	try:
+		return base64.b64decode(cursor + "=" * (-len(cursor) % 4), altchars=b"-_", validate=True).decode()
+	except (binascii.Error, UnicodeDecodeError):
+		raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# Primeras páginas por (directorios, versiones, limit): se invalidan solas al subir la versión
+FIRST_PAGE_CACHE_SIZE = 256
+_first_pages: "OrderedDict[tuple, tuple]" = OrderedDict()
+_first_pages_lock = threading.Lock()
+
+def _directory_response(request: Request, db: Session, directories: List[str], load: Callable, limit: int, after: Optional[str], shape: Callable) -> Response:
+	"""
+	Página de un directorio con ETag versionado. El cursor de la siguiente página va
+	en la cabecera X-Next-Cursor (ausente en la última) y se pasa como ?after=.
+	"""
+	versions = mdls.get_directory_versions(db, directories)
+	etag = f'W/"{".".join(str(versions[name]) for name in directories)}-{limit}-{after or ""}"'
+	if etag in {tag.strip() for tag in request.headers.get("if-none-match", "").split(",")}:
+		return Response(status_code=304, headers={"ETag": etag})
+
+	key = (tuple(directories), tuple(versions.values()), limit)
+	page = None
+	if after is None:
+		with _first_pages_lock:
+			page = _first_pages.get(key)
+			if page is not None:
+				_first_pages.move_to_end(key)
+	if page is None:
+		page = load(db, limit, None if after is None else _decode_cursor(after))
+		if after is None:
+			with _first_pages_lock:
+				_first_pages[key] = page
+				while len(_first_pages) > FIRST_PAGE_CACHE_SIZE:
+					_first_pages.popitem(last=False)
+
+	items, last = page
+	headers = {"ETag": etag}
+	if last is not None:
+		headers["X-Next-Cursor"] = _encode_cursor(last)
+	return JSONResponse(shape(items), headers=headers)
+
 @router.get("/user")
 @limiter.limit("1/second")
 def api_get_users(request: Request, username: str = Depends(get_current_user)):
@@ -25,10 +97,54 @@ def api_get_users(request: Request, username: str = Depends(get_current_user)):
 
 @router.get("/users")
 @limiter.limit("1/second")
-def api_get_users(request: Request, username: str = Depends(get_current_user), db: Session = Depends(get_db)):
-	users = db.query(mdls.User).all()
-	emails = [{"id": user.email} for user in users]
-	return emails
+def api_get_users(request: Request, limit: int = Query(mdls.DIRECTORY_PAGE_SIZE, ge=1, le=mdls.DIRECTORY_MAX_PAGE), after: Optional[str] = None, username: str = Depends(get_current_user), db: Session = Depends(get_read_db)):
+	return _directory_response(
+		request, db, [mdls.DIRECTORY_USERS], mdls.list_user_emails, limit, after,
+		lambda emails: [{"id": email} for email in emails],
+	)
+
+@router.get("/search/users")
+@limiter.limit("1/second")
+def api_search_users(request: Request, q: str = Query(..., min_length=1, max_length=100), limit: int = Query(20, ge=1, le=SEARCH_MAX_RESULTS), not_in_group: Optional[str] = None, username: str = Depends(get_current_user), db: Session = Depends(get_read_db)):
+	"""
+	Emails que coinciden con q (prefijo o palabra interna), ordenados por relevancia.
+	not_in_group=<grupo> deja fuera al dueño y a los miembros; solo para el dueño del grupo.
+	"""
+	if not_in_group is not None:
+		owner = mdls.get_group_owner_email(db, not_in_group)
+		if owner != username:
+			raise HTTPException(status_code=403, detail=f"You are not the owner, this is: {sanitize_for_output(owner)}")
+	return search_users(db, q.strip(), limit, not_in_group)
+
+@router.get("/search/groups")
+@limiter.limit("1/second")
+def api_search_groups(request: Request, q: str = Query(..., min_length=1, max_length=100), limit: int = Query(20, ge=1, le=SEARCH_MAX_RESULTS), username: str = Depends(get_current_user), db: Session = Depends(get_read_db)):
+	return search_groups(db, q.strip(), limit)
+
+@router.get("/users/keys", response_model=mdls.KeyDirectoryResponse)
+@limiter.limit("1/second")
+def api_get_public_keys(request: Request, users: List[str] = Query(..., max_length=mdls.KEY_BATCH_MAX), username: str = Depends(get_current_user), db: Session = Depends(get_read_db)):
+	"""
+	Claves públicas (RSA, ECC) con su huella SHA-256 de varios usuarios en una sola petición:
+	?users=a@x.com&users=b@x.com. El ETag depende de las huellas, así que un cliente que
+	revalida con If-None-Match recibe 304 mientras ninguna clave cambie.
+	"""
+	wanted = sorted({user.strip() for user in users})
+	identities = mdls.get_identities_by_emails(db, wanted)
+	keys = {email: public_keys(identities[email]) for email in wanted if email in identities}
+	missing = [email for email in wanted if email not in identities]
+
+	digest = hashlib.sha256()
+	for email in wanted:
+		for kind, entry in sorted(keys.get(email, {}).items()):
+			digest.update(f"{email}\0{kind}\0{entry['fingerprint']}\n".encode())
+		digest.update(f"{email}\n".encode())
+	etag = f'W/"{digest.hexdigest()[:32]}"'
+	# no-cache: el cliente guarda la respuesta pero revalida siempre (barato con 304)
+	headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+	if etag in {tag.strip() for tag in request.headers.get("if-none-match", "").split(",")}:
+		return Response(status_code=304, headers=headers)
+	return JSONResponse({"keys": keys, "missing": missing}, headers=headers)
 
 @router.get("/users/{user}/key")
 @limiter.limit("1/second")
@@ -40,21 +156,53 @@ def api_get_public_key(request: Request, username: str = Depends(get_current_use
 @limiter.limit("1/second")
 def api_get_users(request: Request, user: str, username: str = Depends(get_current_user), db: Session = Depends(get_db)):
 	user_sender = mdls.get_user_id_by_email(db, user)
-	db_groups = mdls.get_user_groups(db, user_sender)
-	groups = [{"id": group.id} for group in db_groups]
+	groups = [{"id": group_name} for group_name in mdls.get_user_groups(db, user_sender)]
 	return groups
 
 @router.get("/group-messages/{group_name}/key")
 @limiter.limit("1/second")
-def api_get_group_messages(request: Request, group_name: str, username: str = Depends(get_current_user), db: Session = Depends(get_db)):
-	group = db.query(mdls.Group).filter(mdls.Group.id == group_name.strip()).first()
-	return group.shared_aes_key
+def api_get_group_messages(request: Request, group_name: str, epoch: Optional[int] = Query(None, ge=0), username: str = Depends(get_current_user), db: Session = Depends(get_db)):
+	"""
+	Clave AES vigente del grupo o, con ?epoch=N, la de esa época (sobres raw con key_epoch=N).
+	Solo para el dueño y los miembros.
+	"""
+	group_name = group_name.strip()
+	user_id = mdls.get_user_id_by_email(db, username)
+	if not user_id or not mdls.is_group_member(db, user_id, group_name):
+		raise HTTPException(status_code=403, detail="Not a member of this group")
+
+	if epoch is None:
+		group = db.query(mdls.Group).filter(mdls.Group.id == group_name).first()
+		_, aes_key = mdls.current_group_key(db, group)
+	else:
+		aes_key = mdls.get_group_keys(db, group_name, [epoch]).get(epoch)
+		if aes_key is None:
+			raise HTTPException(status_code=404, detail="Key epoch not found")
+	return mdls.bytes_to_str(aes_key)
+
+@router.post("/group-messages/{group_name}/rotate-key")
+@limiter.limit("1/second")
+def api_rotate_group_key(request: Request, group_name: str, username: str = Depends(get_current_user), db: Session = Depends(get_db)):
+	"""
+	Nueva época de clave para el grupo (p. ej. tras la salida de un miembro); los mensajes
+	nuevos se cifran con ella y el historial no se toca. Solo el dueño.
+	"""
+	owner = mdls.get_group_owner_email(db, group_name)
+	if owner != username:
+		raise HTTPException(status_code=403, detail=f"You are not the owner, this is: {sanitize_for_output(owner)}")
+	try:
+		epoch = mdls.rotate_group_key(db, group_name)
+	except IntegrityError:
+		raise HTTPException(status_code=409, detail="The key is being rotated concurrently")
+	recent_writes.mark(username, request)
+	return {"epoch": epoch}
 
 @router.post("/group-messages/create")
 @limiter.limit("1/second")
 def api_create_group(request: Request, group_name: mdls.CreateGroupPayload, username: str = Depends(get_current_user), db: Session = Depends(get_db)):
 	user_id = mdls.get_user_id_by_email(db, username)
 	group = mdls.create_group(db, group_name.name, user_id)
+	recent_writes.mark(username, request)
 	return group.id
 
 @router.post("/group-messages/{group_name}/add")
@@ -62,6 +210,7 @@ def api_create_group(request: Request, group_name: mdls.CreateGroupPayload, user
 def api_add_to_group(request: Request, group_name: str, user_destino: mdls.CreateGroupPayload, username: str = Depends(get_current_user), db: Session = Depends(get_db)):
 	user_receiver = mdls.get_user_id_by_email(db, user_destino.name)
 	group_user = mdls.add_user_to_group(db, user_receiver, group_name)
+	recent_writes.mark(username, request)
 	return group_user
 
 @router.get("/group-messages/{group_name}/owner")
@@ -74,62 +223,244 @@ def api_add_to_group(request: Request, group_name: str, username: str = Depends(
 
 @router.get("/group-messages/{group_name}/users")
 @limiter.limit("1/second")
-def api_add_to_group(request: Request, group_name: str, username: str = Depends(get_current_user), db: Session = Depends(get_db)):
+def api_add_to_group(request: Request, group_name: str, limit: int = Query(mdls.DIRECTORY_PAGE_SIZE, ge=1, le=mdls.DIRECTORY_MAX_PAGE), after: Optional[str] = None, username: str = Depends(get_current_user), db: Session = Depends(get_db)):
 	owner = mdls.get_group_owner_email(db, group_name)
 	if owner != username:
 		raise HTTPException(status_code=403, detail=f"You are not the owner, this is: {sanitize_for_output(owner)}")
-	non_member_list = mdls.get_group_non_participants(db, group_name)
-	return non_member_list
+	return _directory_response(
+		request, db, [mdls.DIRECTORY_USERS, mdls.group_members_directory(group_name)],
+		lambda db, limit, after: mdls.get_group_non_participants(db, group_name, limit, after), limit, after,
+		lambda emails: [{"email": email} for email in emails],
+	)
+
+@router.get("/group-messages/{group_name}/head", response_model=mdls.ConversationHeadResponse)
+@limiter.limit("1/second")
+async def api_get_group_head(request: Request, group_name: str, since_id: int = 0, username: str = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_read_db)):
+	last_id = await mdls.get_group_last_message_id_async(db, group_name)
+	return {"last_id": last_id, "changed": last_id > since_id}
 
-@router.get("/group-messages/{group_name}", response_model=List[mdls.MessageResponse])
+@router.get("/group-messages/{group_name}", response_model=HistoryResponse)
 @limiter.limit("1/second")
-def api_get_group_messages(request: Request, group_name: str, username: str = Depends(get_current_user), db: Session = Depends(get_db)):
-	user_sender = mdls.get_user_id_by_email(db, username)
+async def api_get_group_messages(request: Request, group_name: str, since_id: Optional[int] = None, since_timestamp: Optional[datetime] = None, raw: bool = False, username: str = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_read_db)):
+	"""
+	Con ?raw=true devuelve los sobres cifrados (RawMessageResponse) para descifrar en el cliente.
+	"""
+	user_sender = await mdls.get_user_id_by_email_async(db, username)
 	if not user_sender:
 		raise USER_NOT_FOUND
 
-	messages = mdls.get_group_messages(db, group_name)
+	if raw:
+		return _raw_response(await mdls.get_group_messages_raw_async(db, group_name, since_id, since_timestamp))
+	messages = await mdls.get_group_messages_async(db, group_name, since_id, since_timestamp, reader_id=user_sender)
 	return messages
 
+def _require_message_search():
+	if not message_search_enabled():
+		raise HTTPException(status_code=404, detail="Message search is disabled")
+
+@router.get("/group-messages/{group_name}/search", response_model=List[mdls.MessageResponse])
+@limiter.limit("1/second")
+async def api_search_group_messages(request: Request, group_name: str, q: str = Query(..., min_length=1, max_length=200), limit: int = Query(mdls.SEARCH_MESSAGES_LIMIT, ge=1, le=100), username: str = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_read_db)):
+	"""
+	Mensajes del grupo que contienen todas las palabras de q (índice ciego, solo coincidencias exactas).
+	Solo se descifran los mensajes que coinciden.
+	"""
+	_require_message_search()
+	user_id = await mdls.get_user_id_by_email_async(db, username)
+	if not user_id:
+		raise USER_NOT_FOUND
+	if not await db.run_sync(mdls.is_group_member, user_id, group_name):
+		raise HTTPException(status_code=403, detail="Not a member of this group")
+
+	return await mdls.search_group_messages_async(db, group_name, q, limit, reader_id=user_id)
+
+def _pending_response(pending: mdls.PendingWrite) -> JSONResponse:
+	# 202: el group commit aún puede confirmar el mensaje; el cliente no debe reintentar
+	# y lo reconoce por el hash cuando aparezca en el historial
+	return JSONResponse(status_code=202, content={"status": "pending", "hash": pending.hash})
+
 @router.post("/group-messages/{group_name}")
 @limiter.limit("1/second")
 def api_send_group_message(request: Request, group_name: str, payload: mdls.MessagePayload, username: str = Depends(get_current_user), db: Session = Depends(get_db)):
-	user_sender = mdls.get_user_id_by_email(db, username)
+	user_sender = mdls.get_users_by_emails(db, [username]).get(username)
 	if not user_sender:
 		raise USER_NOT_FOUND
 
-	msg = mdls.send_group_message(db, user_sender, group_name, payload)
-
-	manager = BlockchainManager(db)
-	manager.add_message(False, msg.id)
+	try:
+		msg = mdls.send_group_message(
+			db, user_sender, group_name, payload,
+			before_commit=lambda session, m: BlockchainManager(session).add_message(False, m),
+			coalescer=get_write_coalescer(),
+		)
+	except mdls.PendingWrite as pending:
+		recent_writes.mark(username, request)
+		return _pending_response(pending)
+	recent_writes.mark(username, request)
 
 	return msg
 
-@router.get("/messages/{user_origen}/{user_destino}", response_model=List[mdls.MessageResponse])
+@router.post("/group-messages/{group_name}/bulk", response_model=mdls.BulkSendResponse)
 @limiter.limit("1/second")
-def api_get_messages(request: Request, user_origen: str, user_destino: str, username: str = Depends(get_current_user), db: Session = Depends(get_db)):
-	user_sender = mdls.get_user_id_by_email(db, user_origen)
-	user_receiver = mdls.get_user_id_by_email(db, user_destino)
+def api_send_group_messages_bulk(request: Request, group_name: str, payload: mdls.BulkMessagePayload, username: str = Depends(get_current_user), db: Session = Depends(get_db)):
+	"""
+	Envía hasta BULK_MAX_MESSAGES mensajes al grupo en una sola transacción (importaciones, relays).
+	"""
+	user_sender = mdls.get_users_by_emails(db, [username]).get(username)
+	if not user_sender:
+		raise USER_NOT_FOUND
+	group = db.query(mdls.Group).filter_by(id=group_name).first()
+	if not group:
+		raise HTTPException(status_code=404, detail="Group not found")
+	if not mdls.is_group_member(db, user_sender.id, group_name):
+		raise HTTPException(status_code=403, detail="Not a member of this group")
+
+	messages = mdls.send_group_messages_bulk(
+		db, user_sender, group, payload.messages,
+		before_commit=lambda session, msgs: BlockchainManager(session).add_messages(False, msgs),
+	)
+	recent_writes.mark(username, request)
+	return {"ids": [msg.id for msg in messages]}
+
+@router.get("/conversations", response_model=List[mdls.ConversationSummaryResponse])
+@limiter.limit("1/second")
+async def api_get_conversations(request: Request, limit: int = Query(50, ge=1, le=200), username: str = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_read_db)):
+	user_id = await mdls.get_user_id_by_email_async(db, username)
+	if not user_id:
+		raise USER_NOT_FOUND
+
+	return await mdls.get_conversation_summaries_async(db, user_id, limit)
+
+@router.post("/conversations/read")
+@limiter.limit("1/second")
+def api_mark_conversation_read(request: Request, payload: mdls.ReadMarkerPayload, username: str = Depends(get_current_user), db: Session = Depends(get_db)):
+	user_id = mdls.get_user_id_by_email(db, username)
+	if not user_id:
+		raise USER_NOT_FOUND
+
+	unread_count = mdls.mark_conversation_read(db, user_id, payload.conversation, payload.last_read_id)
+	if unread_count is None:
+		raise HTTPException(status_code=404, detail="Conversation not found")
+	recent_writes.mark(username, request)
+	return {"conversation": payload.conversation, "unread_count": unread_count}
+
+@router.post("/sync", response_model=mdls.SyncResponse)
+@limiter.limit("1/second")
+async def api_sync(request: Request, payload: mdls.SyncPayload, username: str = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_read_db)):
+	"""
+	Una sola petición de sondeo para todas las conversaciones del usuario.
+	Devuelve solo las conversaciones con mensajes posteriores a su cursor.
+	"""
+	user_id = await mdls.get_user_id_by_email_async(db, username)
+	if not user_id:
+		raise USER_NOT_FOUND
+
+	return await mdls.sync_conversations_async(db, user_id, payload.cursors)
+
+@router.get("/messages/{user_origen}/{user_destino}/head", response_model=mdls.ConversationHeadResponse)
+@limiter.limit("1/second")
+async def api_get_messages_head(request: Request, user_origen: str, user_destino: str, since_id: int = 0, username: str = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_read_db)):
+	user_sender = await mdls.get_user_id_by_email_async(db, user_origen)
+	user_receiver = await mdls.get_user_id_by_email_async(db, user_destino)
+	if not user_sender or not user_receiver:
+		raise USER_NOT_FOUND
+
+	last_id = await mdls.get_p2p_last_message_id_async(db, user_sender, user_receiver)
+	return {"last_id": last_id, "changed": last_id > since_id}
+
+@router.get("/messages/{user_origen}/{user_destino}", response_model=HistoryResponse)
+@limiter.limit("1/second")
+async def api_get_messages(request: Request, user_origen: str, user_destino: str, since_id: Optional[int] = None, since_timestamp: Optional[datetime] = None, raw: bool = False, username: str = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_read_db)):
+	"""
+	Con ?raw=true devuelve los sobres cifrados (RawMessageResponse) sin descifrar.
+	"""
+	user_sender = await mdls.get_user_id_by_email_async(db, user_origen)
+	user_receiver = await mdls.get_user_id_by_email_async(db, user_destino)
 	if not user_sender or not user_receiver:
 		raise USER_NOT_FOUND
 
-	messages = mdls.get_p2p_messages_by_user(db, user_sender, user_receiver)
+	if raw:
+		return _raw_response(await mdls.get_p2p_messages_raw_async(db, user_sender, user_receiver, since_id, since_timestamp))
+
+	# El caché de descifrado se indexa por lector: solo si quien lee es uno de los extremos
+	reader_id = {user_origen: user_sender, user_destino: user_receiver}.get(username)
+	messages = await mdls.get_p2p_messages_by_user_async(db, user_sender, user_receiver, since_id, since_timestamp, reader_id=reader_id)
 	return messages
 
+@router.get("/messages/{user_origen}/{user_destino}/search", response_model=List[mdls.MessageResponse])
+@limiter.limit("1/second")
+async def api_search_messages(request: Request, user_origen: str, user_destino: str, q: str = Query(..., min_length=1, max_length=200), limit: int = Query(mdls.SEARCH_MESSAGES_LIMIT, ge=1, le=100), username: str = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_read_db)):
+	_require_message_search()
+	if username not in (user_origen, user_destino):
+		raise HTTPException(status_code=403, detail="Not a participant of this conversation")
+	user_sender = await mdls.get_user_id_by_email_async(db, user_origen)
+	user_receiver = await mdls.get_user_id_by_email_async(db, user_destino)
+	if not user_sender or not user_receiver:
+		raise USER_NOT_FOUND
+
+	reader_id = user_sender if username == user_origen else user_receiver
+	return await mdls.search_p2p_messages_async(db, user_sender, user_receiver, q, limit, reader_id=reader_id)
+
+@router.post("/messages/broadcast", response_model=mdls.BroadcastSendResponse)
+@limiter.limit("1/second")
+def api_send_broadcast(request: Request, payload: mdls.BroadcastPayload, username: str = Depends(get_current_user), db: Session = Depends(get_db)):
+	"""
+	El mismo mensaje privado a hasta BROADCAST_MAX_RECIPIENTS usuarios: se cifra y firma una
+	vez y cada destinatario lo recibe en su conversación con el remitente.
+	"""
+	recipients = list(dict.fromkeys(recipient.strip() for recipient in payload.recipients))
+	users = mdls.get_users_by_emails(db, [username, *recipients])
+	user_sender = users.get(username)
+	if not user_sender or any(recipient not in users for recipient in recipients):
+		raise USER_NOT_FOUND
+
+	messages = mdls.send_p2p_broadcast(
+		db, user_sender, [users[recipient] for recipient in recipients], payload,
+		before_commit=lambda session, msgs: BlockchainManager(session).add_messages(True, msgs),
+	)
+	recent_writes.mark(username, request)
+	return {"broadcast_id": messages[0].broadcast_id, "ids": [msg.id for msg in messages]}
+
 @router.post("/messages/{user_destino}")
 @limiter.limit("1/second")
 def api_send_message(request: Request, user_destino: str, payload: mdls.MessagePayload, username: str = Depends(get_current_user), db: Session = Depends(get_db)):
-	user_sender = mdls.get_user_id_by_email(db, username)
-	user_receiver = mdls.get_user_id_by_email(db, user_destino)
+	users = mdls.get_users_by_emails(db, [username, user_destino])
+	user_sender = users.get(username)
+	user_receiver = users.get(user_destino.strip())
 	if not user_sender or not user_receiver:
 		raise USER_NOT_FOUND
 
-	msg = mdls.send_p2p_message(db, user_sender, user_receiver, payload)
-	manager = BlockchainManager(db)
-	manager.add_message(True, msg.id)
+	try:
+		msg = mdls.send_p2p_message(
+			db, user_sender, user_receiver, payload,
+			before_commit=lambda session, m: BlockchainManager(session).add_message(True, m),
+			coalescer=get_write_coalescer(),
+		)
+	except mdls.PendingWrite as pending:
+		recent_writes.mark(username, request)
+		return _pending_response(pending)
+	recent_writes.mark(username, request)
 
 	return msg
 
+@router.post("/messages/{user_destino}/bulk", response_model=mdls.BulkSendResponse)
+@limiter.limit("1/second")
+def api_send_messages_bulk(request: Request, user_destino: str, payload: mdls.BulkMessagePayload, username: str = Depends(get_current_user), db: Session = Depends(get_db)):
+	"""
+	Envía hasta BULK_MAX_MESSAGES mensajes P2P en una sola transacción (importaciones, relays).
+	"""
+	users = mdls.get_users_by_emails(db, [username, user_destino])
+	user_sender = users.get(username)
+	user_receiver = users.get(user_destino.strip())
+	if not user_sender or not user_receiver:
+		raise USER_NOT_FOUND
+
+	messages = mdls.send_p2p_messages_bulk(
+		db, user_sender, user_receiver, payload.messages,
+		before_commit=lambda session, msgs: BlockchainManager(session).add_messages(True, msgs),
+	)
+	recent_writes.mark(username, request)
+	return {"ids": [msg.id for msg in messages]}
+
 @router.get("/messages/{user_origen}/{user_destino}/verify-hash")
 @limiter.limit("1/second")
 def api_verify_p2p_hash(request: Request, user_origen: str, user_destino: str, db: Session = Depends(get_db)):
@@ -165,14 +496,111 @@ def api_verify_group_hash(request: Request, group_name: str, db: Session = Depen
 
 @router.get("/groups/all")
 @limiter.limit("1/second")
-def api_get_all_groups(request: Request, db: Session = Depends(get_db)):
-	groups = db.query(mdls.Group).all()
-	names = [group.id for group in groups]
-	return names
+def api_get_all_groups(request: Request, limit: int = Query(mdls.DIRECTORY_PAGE_SIZE, ge=1, le=mdls.DIRECTORY_MAX_PAGE), after: Optional[str] = None, db: Session = Depends(get_read_db)):
+	return _directory_response(request, db, [mdls.DIRECTORY_GROUPS], mdls.list_group_names, limit, after, list)
 
 @router.get("/users/all")
 @limiter.limit("1/second")
-def api_get_all_users(request: Request, db: Session = Depends(get_db)):
-	users = db.query(mdls.User).all()
-	emails = [user.email for user in users]
-	return emails
+def api_get_all_users(request: Request, limit: int = Query(mdls.DIRECTORY_PAGE_SIZE, ge=1, le=mdls.DIRECTORY_MAX_PAGE), after: Optional[str] = None, db: Session = Depends(get_read_db)):
+	return _directory_response(request, db, [mdls.DIRECTORY_USERS], mdls.list_user_emails, limit, after, list)
+
+@router.get("/cache/messages/stats")
+@limiter.limit("1/second")
+def api_message_cache_stats(request: Request, username: str = Depends(get_current_user)):
+	cache = get_message_cache()
+	if cache is None:
+		return {"enabled": False}
+	return cache.stats()
+
+def _socket_open(username: str):
+	with SessionLocal() as db:
+		user_id = mdls.get_user_id_by_email(db, username)
+		if not user_id:
+			return None, {}
+		cursors = {}
+		for group_name in mdls.get_user_groups(db, user_id):
+			cursors[group_channel(group_name)] = mdls.get_group_last_message_id(db, group_name)
+		return user_id, cursors
+
+def _socket_join_group(user_id: int, group_name: str):
+	with SessionLocal() as db:
+		if not mdls.is_group_member(db, user_id, group_name):
+			return None
+		return mdls.get_group_last_message_id(db, group_name)
+
+def _socket_fetch(user_id: int, event: dict, cursors: dict):
+	"""
+	Descifra los mensajes posteriores al cursor de la conversación del evento.
+	El cursor se fija antes de leer: si la lectura falla, el siguiente evento la repite.
+	"""
+	with SessionLocal() as db:
+		if "group" in event:
+			key = group_channel(event["group"])
+			since_id = cursors.setdefault(key, event["message_id"] - 1)
+			messages = mdls.get_group_messages(db, event["group"], since_id=since_id, reader_id=user_id)
+			target = {"group": event["group"]}
+		else:
+			peer_id = event["receiver_id"] if event["sender_id"] == user_id else event["sender_id"]
+			key = mdls.p2p_conversation_key(user_id, peer_id)
+			since_id = cursors.setdefault(key, event["message_id"] - 1)
+			messages = mdls.get_p2p_messages_by_user(db, user_id, peer_id, since_id=since_id, reader_id=user_id)
+			target = {"peer": mdls.get_email_by_user_id(db, peer_id)}
+
+	if messages:
+		cursors[key] = max(message["id"] for message in messages)
+	return {"type": "messages", **target, "messages": messages}
+
+@router.websocket("/ws")
+async def api_chat_socket(websocket: WebSocket):
+	"""
+	Entrega en tiempo real los mensajes nuevos de los grupos y chats P2P del usuario.
+	El token de acceso se envía como query param (?token=) o en la cabecera Authorization.
+	El cliente puede enviar {"subscribe": "<grupo>"} tras unirse a un grupo nuevo.
+	"""
+	token = websocket.query_params.get("token")
+	authorization = websocket.headers.get("authorization", "")
+	if not token and authorization.lower().startswith("bearer "):
+		token = authorization[7:]
+	payload = decode_token(token, expected_type="access") if token else None
+	if not payload:
+		await websocket.close(code=1008)
+		return
+
+	user_id, cursors = await run_in_threadpool(_socket_open, payload["sub"])
+	if not user_id:
+		await websocket.close(code=1008)
+		return
+
+	await websocket.accept()
+	subscription = get_bus().subscribe([user_channel(user_id), *cursors.keys()])
+
+	async def pump():
+		while True:
+			event = await subscription.get()
+			try:
+				message = await run_in_threadpool(_socket_fetch, user_id, event, cursors)
+			except Exception:
+				# Un fallo de lectura no corta la entrega: el próximo evento recoge lo pendiente
+				logger.exception("No se pudieron leer los mensajes del evento %s", event)
+				continue
+			if message["messages"]:
+				await websocket.send_json(jsonable_encoder(message))
+
+	pump_task = asyncio.create_task(pump())
+	try:
+		while True:
+			data = await websocket.receive_json()
+			group_name = data.get("subscribe") if isinstance(data, dict) else None
+			if not isinstance(group_name, str):
+				continue
+			last_id = await run_in_threadpool(_socket_join_group, user_id, group_name)
+			if last_id is None:
+				await websocket.send_json({"type": "error", "detail": "Not a member of this group"})
+				continue
+			cursors.setdefault(group_channel(group_name), last_id)
+			subscription.add(group_channel(group_name))
+	except WebSocketDisconnect:
+		pass
+	finally:
+		pump_task.cancel()
+		subscription.close()
@@ -1,7 +1,8 @@
 import os
-from dotenv import load_dotenv
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.base import BaseHTTPMiddleware
@@ -12,15 +13,22 @@ from starlette.responses import Response
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 
+from app.config import get_setting
 from app.utils.limiter import limiter
 from app.routers import auth
 from app.middleware.logger import RequestLoggerMiddleware
+from app.middleware.read_your_writes import ReadYourWritesMiddleware
 from app.auth.google.routes import router as google_login_router
 from app.auth.google.callback import router as google_callback_router
 from app.endpoints.chat import router as chat_router
 from app.endpoints.chain import router as chain_router
-
-load_dotenv()
+from app.realtime.bus import close_bus
+from app.db.db import init_database, dispose_engines
+from app.db.coalescer import close_write_coalescer
+from app.crypto.message_cache import close_message_cache
+from app.crypto.registry import configure_crypto_providers
+from app.auth.revocation import close_revocation_store, get_revocation_store
+from app.model.models import warm_membership_index
 
 # Middleware de cabeceras de seguridad
 class SecurityHeadersMiddleware(BaseHTTPMiddleware):
@@ -75,7 +83,29 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
 		
 		return response
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+	# Engine, CREATE DATABASE y create_all fuera del import: solo al arrancar el worker
+	if get_setting("DB_INIT_ON_STARTUP", "true").lower() != "false":
+		await run_in_threadpool(init_database)
+		# Dueños y miembros de los grupos en memoria antes de la primera petición
+		await run_in_threadpool(warm_membership_index)
+	# Elige pycryptodome o cryptography por primitiva (CRYPTO_PROVIDER)
+	await run_in_threadpool(configure_crypto_providers)
+	# Tokens revocados cargados antes de la primera petición y sincronizados en segundo plano
+	await run_in_threadpool(get_revocation_store().start)
+	yield
+	# Cierra el listener de LISTEN/NOTIFY y las conexiones del bus de eventos
+	close_bus()
+	# Escribe los envíos pendientes del group commit antes de cerrar los pools
+	await run_in_threadpool(close_write_coalescer)
+	await dispose_engines()
+	# Pone a cero y libera la memoria bloqueada del caché de descifrado
+	close_message_cache()
+	# Espera al hilo de sincronización fuera del event loop
+	await run_in_threadpool(close_revocation_store)
+
+app = FastAPI(lifespan=lifespan)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
@@ -85,7 +115,7 @@ app.include_router(chat_router)
 app.include_router(chain_router)
 app.include_router(google_login_router)
 app.include_router(google_callback_router)
-app.add_middleware(SessionMiddleware, secret_key=os.getenv("SESSION_SECRET_KEY"))
+app.add_middleware(SessionMiddleware, secret_key=get_setting("SESSION_SECRET_KEY"))
 
 app.add_middleware(
 	CORSMiddleware,
@@ -93,9 +123,13 @@ app.add_middleware(
 	allow_credentials=True,
 	allow_methods=["*"],
 	allow_headers=["*"],
+	# Paginación de los directorios (/users, /users/all, /groups/all)
+	expose_headers=["ETag", "X-Next-Cursor"],
 )
 
 app.add_middleware(RequestLoggerMiddleware)
+# Marca de escritura reciente en cookie: read-your-writes con varios workers
+app.add_middleware(ReadYourWritesMiddleware)
 app.add_middleware(SecurityHeadersMiddleware)
 
 # Montar frontend build si existe
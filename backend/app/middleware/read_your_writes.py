@@ -0,0 +1,26 @@
+import math
+
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+
+from app.db import db as database
+
+class ReadYourWritesMiddleware(BaseHTTPMiddleware):
+	"""
+	Devuelve en una cookie la marca firmada que deja recent_writes.mark(usuario, request):
+	durante la ventana, cualquier worker que la reciba lee del primario, no solo el que
+	atendió la escritura.
+	"""
+	async def dispatch(self, request: Request, call_next):
+		response = await call_next(request)
+		marker = getattr(request.state, "read_your_writes", None)
+		if marker:
+			response.set_cookie(
+				database.READ_YOUR_WRITES_COOKIE,
+				marker,
+				max_age=math.ceil(database.recent_writes.window),
+				httponly=True,
+				samesite="lax",
+				secure=request.url.scheme == "https",
+			)
+		return response
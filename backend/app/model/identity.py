@@ -0,0 +1,120 @@
+import base64
+import binascii
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from app.config import get_setting
+
+class Identity(NamedTuple):
+	"""
+	Datos públicos de un usuario. Sirve donde solo se lee email y claves
+	públicas (p. ej. remitentes al materializar un historial).
+	"""
+	id: int
+	email: str
+	public_key: str
+	public_ecc_key: str
+
+# Claves públicas publicadas en el directorio: tipo -> campo de Identity.
+# Un tipo de clave nuevo solo necesita su entrada aquí
+PUBLIC_KEY_FIELDS = {"rsa": "public_key", "ecc": "public_ecc_key"}
+
+@lru_cache(maxsize=65536)
+def key_fingerprint(key: str) -> str:
+	"""
+	SHA-256 (hex) de la clave en DER; si no es base64 válido, del texto tal cual.
+	Es también la versión de la clave para los ETag.
+	"""
+	try:
+		data = base64.b64decode(key, validate=True)
+	except (binascii.Error, ValueError):
+		data = key.encode()
+	return hashlib.sha256(data).hexdigest()
+
+def public_keys(identity: Identity) -> Dict[str, dict]:
+	keys = {}
+	for kind, field in PUBLIC_KEY_FIELDS.items():
+		key = getattr(identity, field)
+		if key:
+			keys[kind] = {"key": key, "fingerprint": key_fingerprint(key)}
+	return keys
+
+class IdentityCache:
+	"""
+	LRU acotado con TTL: email -> id e id -> Identity.
+	Solo guarda usuarios que existen; un email desconocido siempre va a la base.
+	"""
+	def __init__(self, max_entries: int = 10000, ttl: float = 60.0, clock=time.monotonic):
+		self.max_entries = max_entries
+		self.ttl = ttl
+		self.clock = clock
+		self._lock = threading.Lock()
+		self._by_id: "OrderedDict[int, tuple]" = OrderedDict()
+		self._by_email: Dict[str, int] = {}
+
+	def _get(self, user_id: int) -> Optional[Identity]:
+		item = self._by_id.get(user_id)
+		if item is None:
+			return None
+		identity, expires = item
+		if expires <= self.clock():
+			self._drop(user_id)
+			return None
+		self._by_id.move_to_end(user_id)
+		return identity
+
+	def get(self, user_id: int) -> Optional[Identity]:
+		with self._lock:
+			return self._get(user_id)
+
+	def get_many(self, user_ids: Iterable[int]) -> Dict[int, Identity]:
+		with self._lock:
+			found = {}
+			for user_id in user_ids:
+				identity = self._get(user_id)
+				if identity is not None:
+					found[user_id] = identity
+			return found
+
+	def get_id(self, email: str) -> Optional[int]:
+		with self._lock:
+			user_id = self._by_email.get(email)
+			if user_id is None or self._get(user_id) is None:
+				return None
+			return user_id
+
+	def put(self, identity: Identity):
+		with self._lock:
+			if identity.id in self._by_id:
+				self._drop(identity.id)
+			self._by_id[identity.id] = (identity, self.clock() + self.ttl)
+			self._by_email[identity.email] = identity.id
+			while len(self._by_id) > self.max_entries:
+				self._drop(next(iter(self._by_id)))
+
+	def _drop(self, user_id: int):
+		identity, _ = self._by_id.pop(user_id)
+		if self._by_email.get(identity.email) == user_id:
+			del self._by_email[identity.email]
+
+	def invalidate(self, user_id: Optional[int] = None, email: Optional[str] = None):
+		with self._lock:
+			if email is not None and email in self._by_email:
+				self._drop(self._by_email[email])
+			if user_id is not None and user_id in self._by_id:
+				self._drop(user_id)
+
+	def clear(self):
+		with self._lock:
+			self._by_id.clear()
+			self._by_email.clear()
+
+# Por proceso; IDENTITY_CACHE_SIZE=0 lo desactiva
+identity_cache = IdentityCache(
+	max_entries=int(get_setting("IDENTITY_CACHE_SIZE", "10000")),
+	ttl=float(get_setting("IDENTITY_CACHE_TTL_SECONDS", "60")),
+)
@@ -0,0 +1,147 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session
+
+from app.config import get_setting
+from app.crypto.crypto import bytes_to_str, str_to_bytes
+from app.crypto.keyring import Keyring, get_keyring
+from app.crypto.message_cache import invalidate_user_key
+from app.db.db import SessionLocal
+import app.model.models as mdls
+
+# Trabajo reanudable que vuelve a cifrar private_key y private_ecc_key de todos los
+# usuarios con la versión primaria del keyring. Lee por páginas de id (WHERE id > último),
+# cifra cada lote repartido en un pool de procesos mientras lee el siguiente y escribe
+# cada lote en su propia transacción junto con el punto de reanudación.
+
+ROTATION_BATCH_SIZE = int(get_setting("KEY_ROTATION_BATCH_SIZE", "1000"))
+
+class RotationStats(NamedTuple):
+	scanned: int
+	rotated: int
+	skipped: int
+	seconds: float
+	finished: bool
+
+Row = Tuple[int, str, str]
+
+_worker_keyring: Optional[Keyring] = None
+
+def _init_worker(secrets: Dict[int, str]):
+	# Cada proceso del pool monta su propio keyring con las mismas versiones
+	global _worker_keyring
+	_worker_keyring = Keyring(secrets)
+
+def _rotate_field(keyring: Keyring, value: str) -> str:
+	return bytes_to_str(keyring.rotate(str_to_bytes(value)))
+
+def rotate_rows(rows: List[Row], keyring: Optional[Keyring] = None) -> List[dict]:
+	"""
+	Parámetros del UPDATE de las filas que no usan la versión primaria. Los valores
+	anteriores van en la condición: si el usuario cambió entretanto, la fila no se pisa.
+	"""
+	keyring = keyring or _worker_keyring
+	changed = []
+	for user_id, private_key, private_ecc_key in rows:
+		new_key = _rotate_field(keyring, private_key)
+		new_ecc_key = _rotate_field(keyring, private_ecc_key)
+		if new_key != private_key or new_ecc_key != private_ecc_key:
+			changed.append({
+				"b_id": user_id, "b_old_key": private_key, "b_old_ecc_key": private_ecc_key,
+				"b_key": new_key, "b_ecc_key": new_ecc_key,
+			})
+	return changed
+
+def _read_batch(db: Session, after_id: int, batch_size: int) -> List[Row]:
+	users = mdls.User.__table__
+	query = select(users.c.id, users.c.private_key, users.c.private_ecc_key).where(users.c.id > after_id).order_by(users.c.id).limit(batch_size)
+	return [tuple(row) for row in db.execute(query)]
+
+def _write_batch(db: Session, changed: List[dict]) -> int:
+	if not changed:
+		return 0
+	users = mdls.User.__table__
+	stmt = (
+		update(users)
+		.where(
+			users.c.id == bindparam("b_id"),
+			users.c.private_key == bindparam("b_old_key"),
+			users.c.private_ecc_key == bindparam("b_old_ecc_key"),
+		)
+		.values(private_key=bindparam("b_key"), private_ecc_key=bindparam("b_ecc_key"))
+	)
+	result = db.execute(stmt, changed)
+	if db.get_bind().dialect.supports_sane_multi_rowcount:
+		return result.rowcount
+	return len(changed)
+
+def _split(rows: List[Row], parts: int) -> List[List[Row]]:
+	size = -(-len(rows) // parts)
+	return [rows[i:i + size] for i in range(0, len(rows), size)]
+
+def rotate_user_keys(session_factory=SessionLocal, keyring: Optional[Keyring] = None, batch_size: int = ROTATION_BATCH_SIZE, workers: Optional[int] = None, max_batches: Optional[int] = None) -> RotationStats:
+	"""
+	Vuelve a cifrar las claves privadas con keyring.primary, retomando donde lo dejó
+	una ejecución anterior hacia la misma versión. workers=0 cifra en este proceso.
+	max_batches corta tras ese número de lotes (la siguiente llamada continúa).
+	"""
+	keyring = keyring or get_keyring()
+	job = f"users:v{keyring.primary}"
+	started = time.monotonic()
+	scanned = skipped = 0
+
+	with session_factory() as db:
+		progress = db.get(mdls.KeyRotationProgress, job)
+		if progress is None:
+			progress = mdls.KeyRotationProgress(job=job, last_id=0, rotated=0, finished=False)
+			db.add(progress)
+			db.commit()
+		last_id, rotated = progress.last_id, progress.rotated
+
+	if workers is None:
+		workers = os.cpu_count() or 1
+	pool = None
+	if workers > 0:
+		pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(keyring.secrets,))
+	try:
+		with session_factory() as db:
+			batch = _read_batch(db, last_id, batch_size)
+			batches = 0
+			while batch:
+				if pool is not None:
+					futures = [pool.submit(rotate_rows, part) for part in _split(batch, workers)]
+				# El siguiente lote se lee mientras el pool cifra este
+				next_batch = _read_batch(db, batch[-1][0], batch_size)
+				if pool is not None:
+					changed = [params for future in futures for params in future.result()]
+				else:
+					changed = rotate_rows(batch, keyring)
+
+				written = _write_batch(db, changed)
+				last_id = batch[-1][0]
+				rotated += written
+				skipped += len(changed) - written
+				scanned += len(batch)
+				db.query(mdls.KeyRotationProgress).filter_by(job=job).update({"last_id": last_id, "rotated": rotated})
+				db.commit()
+				# Tras el commit: en este proceso nada descifrado con la versión retirada sobrevive a la rotación
+				for params in changed:
+					invalidate_user_key(params["b_id"])
+
+				batch = next_batch
+				batches += 1
+				if max_batches is not None and batches >= max_batches:
+					break
+			finished = not batch
+			if finished:
+				db.query(mdls.KeyRotationProgress).filter_by(job=job).update({"finished": True})
+				db.commit()
+	finally:
+		if pool is not None:
+			pool.shutdown()
+
+	return RotationStats(scanned, rotated, skipped, time.monotonic() - started, finished)
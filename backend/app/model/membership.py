@@ -0,0 +1,62 @@
+import bisect
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+class MembershipIndex:
+	"""
+	Dueño y miembros de cada grupo en memoria: los ids de los miembros van en un
+	array ordenado (8 bytes por miembro) y la pertenencia se comprueba con bisect.
+	Las lecturas no toman el lock: cada escritura sustituye el array completo.
+	"""
+	def __init__(self, owners: Dict[str, int], memberships: Iterable[Tuple[str, int]], version: int, clock=time.monotonic):
+		members: Dict[str, List[int]] = {}
+		groups_by_user: Dict[int, List[str]] = {}
+		for group_name, user_id in memberships:
+			members.setdefault(group_name, []).append(user_id)
+			groups_by_user.setdefault(user_id, []).append(group_name)
+		self.version = version
+		self.clock = clock
+		self.checked_at = clock()
+		self._lock = threading.Lock()
+		self._owners = dict(owners)
+		self._members = {name: array("q", sorted(ids)) for name, ids in members.items()}
+		self._groups_by_user = {user_id: tuple(sorted(names)) for user_id, names in groups_by_user.items()}
+
+	def owner_id(self, group_name: str) -> Optional[int]:
+		return self._owners.get(group_name)
+
+	def is_member(self, user_id: int, group_name: str) -> bool:
+		# Dueño o miembro, como is_group_member
+		if self._owners.get(group_name) == user_id:
+			return True
+		ids = self._members.get(group_name, ())
+		i = bisect.bisect_left(ids, user_id)
+		return i < len(ids) and ids[i] == user_id
+
+	def participant_ids(self, group_name: str) -> Set[int]:
+		ids = set(self._members.get(group_name, ()))
+		if group_name in self._owners:
+			ids.add(self._owners[group_name])
+		return ids
+
+	def user_groups(self, user_id: int) -> Tuple[str, ...]:
+		# Grupos en los que el usuario es miembro (no los que solo posee), por nombre
+		return self._groups_by_user.get(user_id, ())
+
+	def add_group(self, group_name: str, owner_id: int):
+		with self._lock:
+			self._owners[group_name] = owner_id
+
+	def add_member(self, group_name: str, user_id: int):
+		with self._lock:
+			ids = self._members.get(group_name, array("q"))
+			i = bisect.bisect_left(ids, user_id)
+			if i < len(ids) and ids[i] == user_id:
+				return
+			self._members[group_name] = ids[:i] + array("q", [user_id]) + ids[i:]
+			self._groups_by_user[user_id] = tuple(sorted(self._groups_by_user.get(user_id, ()) + (group_name,)))
+
+	def is_stale(self, refresh: float) -> bool:
+		return self.clock() - self.checked_at >= refresh
@@ -1,15 +1,28 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import Column, Text, String, Boolean, Integer, ForeignKey, DateTime, or_, and_
-from app.db.db import Base
-from datetime import datetime, timezone
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Text, String, Boolean, Integer, ForeignKey, DateTime, Index, UniqueConstraint, or_, and_, case, cast, func, literal, select, text, union, union_all, update, event, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import postgresql, sqlite
+from app.db.db import Base, SessionLocal
+from app.config import get_setting
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.orm import relationship, aliased
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.schemas.schemas import BaseModel
-from typing import Optional
+from pydantic import Field
+from typing import Callable, Dict, List, Optional
 
-from app.crypto.crypto import cifrar_mensaje_grupal, cifrar_mensaje_individual, decrypt_bytes, descifrar_mensaje_grupal, descifrar_mensaje_individual, get_random_bytes
-from app.crypto.signing import str_to_bytes, bytes_to_str, sign_data_ecdsa, verify_signature_ecdsa
+from app.crypto.crypto import cifrar_mensaje_difusion, cifrar_mensajes_grupales, cifrar_mensajes_individuales, decrypt_bytes, unir_sobre_difusion, descifrar_mensaje_grupal, descifrar_mensaje_individual, get_random_bytes
+from app.crypto.signing import str_to_bytes, bytes_to_str, sign_data_ecdsa_batch, verify_signature_ecdsa
 from app.crypto.hashing import generate_hash
+from app.crypto.message_cache import get_message_cache, group_key_scope, invalidate_group_key, invalidate_user_key, user_key_scope
+from app.crypto.blind_index import keyword_tokens, message_search_enabled
+from app.crypto.group_keys import group_key_cache
+from app.model.identity import Identity, identity_cache
+from app.model.membership import MembershipIndex
+import threading
+from app.realtime.bus import publish_group_message, publish_p2p_message
+from app.utils.executor import run_crypto
 
 class User(Base):
 	__tablename__ = "users"
@@ -31,22 +44,71 @@ class User(Base):
 	email_verified = Column(Boolean, default=False)
 	totp_verified = Column(Boolean, default=False)
 
+class Conversation(Base):
+	__tablename__ = "conversations"
+	__table_args__ = (
+		UniqueConstraint("user_low_id", "user_high_id", name="uq_conversations_pair"),
+		Index("ix_conversations_user_high_id", "user_high_id"),
+	)
+
+	id = Column(Integer, primary_key=True)
+
+	# Par canónico: siempre user_low_id < user_high_id
+	user_low_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+	user_high_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+	created_at = Column(DateTime, default=datetime.utcnow)
+
+class PeerBroadcast(Base):
+	__tablename__ = "p2p_broadcasts"
+
+	# Parte común de un mensaje P2P enviado a varios destinatarios: {"mensaje", "iv"}
+	# cifrado una vez con una clave AES que cada PeerMessage envuelve para su receptor
+	id = Column(Integer, primary_key=True)
+	sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+	message = Column(Text, nullable=False)
+	signature = Column(Text)
+	timestamp = Column(DateTime, default=datetime.utcnow)
+
 class PeerMessage(Base):
 	__tablename__ = "p2p_messages"
+	__table_args__ = (
+		Index("ix_p2p_messages_conversation_ts", "conversation_id", "timestamp", "id"),
+		Index("ix_p2p_messages_pair_ts", "sender_id", "receiver_id", "timestamp"),
+	)
 
 	id = Column(Integer, primary_key=True, index=True)
 
 	sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
 	receiver_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+	# Nullable: la migración 0002 (o backfill_conversations.py) rellena los mensajes anteriores
+	conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=True)
 
 	hash = Column(Text, nullable=False)
 	signature = Column(Text)
 	message = Column(Text, nullable=False)
 	timestamp = Column(DateTime, default=datetime.utcnow)
+	# Difusión: message solo lleva {"clave_aes"} de este destinatario; el texto cifrado
+	# y la firma están una sola vez en PeerBroadcast
+	broadcast_id = Column(Integer, ForeignKey("p2p_broadcasts.id"), nullable=True)
 
+	broadcast = relationship("PeerBroadcast", lazy="selectin")
 	sender = relationship("User", foreign_keys=[sender_id], backref="sent_messages")
 	receiver = relationship("User", foreign_keys=[receiver_id], backref="received_messages")
 
+	@property
+	def envelope(self) -> str:
+		# Sobre completo {"mensaje", "clave_aes", "iv"}, también para las difusiones
+		if self.broadcast is None:
+			return self.message
+		return unir_sobre_difusion(self.broadcast.message, self.message)
+
+	@property
+	def signed_payload(self) -> tuple:
+		# (texto firmado, firma): en una difusión se firma una vez la parte común
+		if self.broadcast is None:
+			return self.message, self.signature
+		return self.broadcast.message, self.broadcast.signature
+
 class Group(Base):
 	__tablename__ = "groups"
 
@@ -61,6 +123,9 @@ class Group(Base):
 
 class GroupUser(Base):
 	__tablename__ = "group_users"
+	__table_args__ = (
+		Index("uq_group_users_group_user", "group_name", "user_id", unique=True),
+	)
 
 	id = Column(Integer, primary_key=True, index=True)
 
@@ -70,8 +135,21 @@ class GroupUser(Base):
 	user = relationship("User", backref="group_memberships")
 	group = relationship("Group", back_populates="users")
 
+class GroupKey(Base):
+	__tablename__ = "group_keys"
+
+	# Claves de las épocas 1, 2, ...; la época 0 es Group.shared_aes_key.
+	# Rotar es insertar una fila: cada mensaje sigue cifrado con la clave de su época
+	group_name = Column(String, ForeignKey("groups.id"), primary_key=True)
+	epoch = Column(Integer, primary_key=True)
+	aes_key = Column(String, nullable=False)
+	created_at = Column(DateTime, default=datetime.utcnow)
+
 class GroupMessage(Base):
 	__tablename__ = "group_messages"
+	__table_args__ = (
+		Index("ix_group_messages_group_ts", "group_name", "timestamp"),
+	)
 
 	id = Column(Integer, primary_key=True, index=True)
 
@@ -82,10 +160,16 @@ class GroupMessage(Base):
 	signature = Column(Text)
 	message = Column(Text, nullable=False)
 	timestamp = Column(DateTime, default=datetime.utcnow)
+	# Época de la clave del grupo con la que se cifró (GroupKey)
+	key_epoch = Column(Integer, nullable=False, default=0, server_default="0")
 
 	sender = relationship("User", foreign_keys=[sender_id], backref="sent_group_messages")
 	group = relationship("Group", foreign_keys=[group_name], backref="group_data")
 
+	@property
+	def envelope(self) -> str:
+		return self.message
+
 class Block(Base):
 	__tablename__ = "blocks"
 
@@ -99,6 +183,12 @@ class Block(Base):
 
 class BlockMessage(Base):
 	__tablename__ = "blockchain_messages"
+	__table_args__ = (
+		Index(
+			"ix_blockchain_messages_unassigned", "id",
+			postgresql_where=text("block_id IS NULL"), sqlite_where=text("block_id IS NULL"),
+		),
+	)
 
 	id = Column(Integer, primary_key=True)
 	is_p2p = Column(Boolean)
@@ -106,9 +196,74 @@ class BlockMessage(Base):
 	message_str = Column(String)
 	message_hash = Column(String)
 
-	block_id = Column(Integer, ForeignKey("blocks.id"))
+	block_id = Column(Integer, ForeignKey("blocks.id"), index=True)
 	block = relationship("Block", back_populates="messages")
 
+class ConversationHead(Base):
+	__tablename__ = "conversation_heads"
+
+	# "group:<nombre>" o "p2p:<id menor>:<id mayor>"
+	key = Column(String, primary_key=True)
+	last_message_id = Column(Integer, nullable=False)
+	updated_at = Column(DateTime, default=datetime.utcnow)
+
+class ConversationSummary(Base):
+	__tablename__ = "conversation_summaries"
+	__table_args__ = (
+		UniqueConstraint("user_id", "conversation_key", name="uq_conversation_summaries_user_key"),
+		Index("ix_conversation_summaries_user_activity", "user_id", "last_timestamp"),
+	)
+
+	id = Column(Integer, primary_key=True)
+
+	user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+	# Misma clave que ConversationHead
+	conversation_key = Column(String, nullable=False)
+	peer_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+	group_name = Column(String, ForeignKey("groups.id"), nullable=True)
+
+	last_message_id = Column(Integer, nullable=False)
+	last_sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+	last_timestamp = Column(DateTime, nullable=False)
+	last_read_message_id = Column(Integer, nullable=True)
+	unread_count = Column(Integer, nullable=False, default=0)
+
+class DirectoryVersion(Base):
+	__tablename__ = "directory_versions"
+
+	# "users", "groups" o "members:<grupo>"; sube con cada alta, baja o cambio de clave
+	name = Column(String, primary_key=True)
+	version = Column(Integer, nullable=False)
+
+class KeyRotationProgress(Base):
+	__tablename__ = "key_rotation_progress"
+
+	# Punto de reanudación de app/model/key_rotation.py: "users:v<versión destino>"
+	job = Column(String, primary_key=True)
+	last_id = Column(Integer, nullable=False, default=0)
+	rotated = Column(Integer, nullable=False, default=0)
+	finished = Column(Boolean, nullable=False, default=False)
+	updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class RevokedToken(Base):
+	__tablename__ = "revoked_tokens"
+	# AUTOINCREMENT en SQLite: un id borrado no se reutiliza y el cursor nunca retrocede
+	__table_args__ = {"sqlite_autoincrement": True}
+
+	# Lista de revocación de JWT (app/auth/revocation.py); id creciente para la sincronización entre workers
+	id = Column(Integer, primary_key=True)
+	jti = Column(String, unique=True, nullable=False)
+	expires_at = Column(DateTime, nullable=False, index=True)
+
+class MessageSearchToken(Base):
+	__tablename__ = "message_search_tokens"
+
+	# Índice ciego (app/crypto/blind_index.py): una fila por palabra distinta de cada mensaje.
+	# La clave primaria sirve de lista invertida: (conversación, token) -> ids de mensaje
+	conversation_key = Column(String, primary_key=True)
+	token = Column(String, primary_key=True)
+	message_id = Column(Integer, primary_key=True)
+
 class CreateGroupPayload(BaseModel):
 	name: str
 
@@ -116,7 +271,28 @@ class MessagePayload(BaseModel):
 	message: str
 	signed: bool
 
+# Máximo de mensajes por petición de envío en bloque
+BULK_MAX_MESSAGES = 1000
+
+class BulkMessagePayload(BaseModel):
+	messages: List[MessagePayload] = Field(..., min_length=1, max_length=BULK_MAX_MESSAGES)
+
+class BulkSendResponse(BaseModel):
+	ids: List[int]
+
+# Máximo de destinatarios de una difusión P2P
+BROADCAST_MAX_RECIPIENTS = 500
+
+class BroadcastPayload(MessagePayload):
+	recipients: List[str] = Field(..., min_length=1, max_length=BROADCAST_MAX_RECIPIENTS)
+
+class BroadcastSendResponse(BaseModel):
+	broadcast_id: int
+	# Un id de mensaje por destinatario, en el orden de recipients
+	ids: List[int]
+
 class MessageResponse(BaseModel):
+	id: Optional[int] = None
 	sender: str
 	receiver: str
 	message: str
@@ -124,84 +300,553 @@ class MessageResponse(BaseModel):
 	hash: str
 	timestamp: datetime
 
-def get_user_id_by_email(db: Session, email: str) -> int | None:
-	user = db.query(User).filter(User.email == email.strip()).first()
-	return user.id if user else None
+@event.listens_for(User, "after_insert")
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_identity(mapper, connection, user: User):
+	identity_cache.invalidate(user.id, user.email)
 
-def get_email_by_user_id(db: Session, id: int) -> int | None:
-	user = db.query(User).filter(User.id == id).first()
-	return user.email if user else None
+# Texto P2P descifrado con la clave privada del usuario: ni un id reutilizado ni una
+# clave nueva lo heredan. Los demás cambios (TOTP, contraseña...) no lo tocan.
+@event.listens_for(User, "after_insert")
+@event.listens_for(User, "after_delete")
+def _invalidate_user_messages(mapper, connection, user: User):
+	invalidate_user_key(user.id)
+
+@event.listens_for(User, "after_update")
+def _invalidate_user_messages_on_key_change(mapper, connection, user: User):
+	if inspect(user).attrs.private_key.history.has_changes():
+		invalidate_user_key(user.id)
+
+_IDENTITY_COLUMNS = (User.id, User.email, User.public_key, User.public_ecc_key)
+
+def _cache_identity(row) -> Identity:
+	identity = Identity(row.id, row.email, row.public_key, row.public_ecc_key)
+	identity_cache.put(identity)
+	return identity
+
+def get_user_id_by_email(db: Session, email: str) -> int | None:
+	email = email.strip()
+	user_id = identity_cache.get_id(email)
+	if user_id is not None:
+		return user_id
+	row = db.query(*_IDENTITY_COLUMNS).filter(User.email == email).first()
+	return _cache_identity(row).id if row else None
+
+def get_users_by_emails(db: Session, emails: List[str]) -> Dict[str, User]:
+	# Emisor y destinatario en una sola consulta
+	wanted = {email.strip() for email in emails}
+	users = {user.email: user for user in db.query(User).filter(User.email.in_(wanted))}
+	for user in users.values():
+		_cache_identity(user)
+	return users
+
+def get_identities_by_emails(db: Session, emails) -> Dict[str, Identity]:
+	"""
+	Como get_identities pero por email; los desconocidos no aparecen en el resultado.
+	"""
+	wanted = {email.strip() for email in emails}
+	ids = {email: identity_cache.get_id(email) for email in wanted}
+	cached = identity_cache.get_many(user_id for user_id in ids.values() if user_id is not None)
+	found = {identity.email: identity for identity in cached.values() if identity.email in wanted}
+	missing = wanted - found.keys()
+	if missing:
+		for row in db.query(*_IDENTITY_COLUMNS).filter(User.email.in_(missing)):
+			found[row.email] = _cache_identity(row)
+	return found
+
+def get_identities(db: Session, user_ids) -> Dict[int, Identity]:
+	"""
+	Email y claves públicas de varios usuarios: lo que no está en el caché
+	de identidades se carga en una sola consulta IN.
+	"""
+	wanted = set(user_ids)
+	found = identity_cache.get_many(wanted)
+	missing = wanted - found.keys()
+	if missing:
+		for row in db.query(*_IDENTITY_COLUMNS).filter(User.id.in_(missing)):
+			found[row.id] = _cache_identity(row)
+	return found
+
+def get_email_by_user_id(db: Session, id: int) -> str | None:
+	identity = get_identities(db, [id]).get(id)
+	return identity.email if identity else None
 
 def get_user_by_id(db: Session, id: int) -> User:
 	user = db.query(User).filter(User.id == id).first()
 	return user
 
-def send_p2p_message(db: Session, sender_id: int, receiver_id: int, payload: MessagePayload):
-	sender = db.query(User).filter_by(id=sender_id).first()
-	receiver = db.query(User).filter_by(id=receiver_id).first()
-
-	pub_key = str_to_bytes(receiver.public_key)
-	encrypted_message = cifrar_mensaje_individual(payload.message, pub_key)
-
-	signature = None
-	if (payload.signed):
-		private_ecc_key_encrypted = str_to_bytes(sender.private_ecc_key)
-		private_ecc_key = decrypt_bytes(private_ecc_key_encrypted)
-		signature = sign_data_ecdsa(encrypted_message, private_ecc_key)
+async def get_user_id_by_email_async(db: AsyncSession, email: str) -> int | None:
+	email = email.strip()
+	user_id = identity_cache.get_id(email)
+	if user_id is not None:
+		return user_id
+	row = (await db.execute(select(*_IDENTITY_COLUMNS).where(User.email == email))).first()
+	return _cache_identity(row).id if row else None
+
+KEY_BATCH_MAX = 500
+
+class PublicKeyEntry(BaseModel):
+	key: str
+	fingerprint: str
+
+class KeyDirectoryResponse(BaseModel):
+	# email -> tipo de clave ("rsa", "ecc", ...) -> clave y huella
+	keys: Dict[str, Dict[str, PublicKeyEntry]]
+	missing: List[str]
+
+class ConversationHeadResponse(BaseModel):
+	last_id: int
+	changed: bool
+
+class ConversationSummaryResponse(BaseModel):
+	conversation: str
+	last_message_id: int
+	last_sender: Optional[str] = None
+	last_timestamp: datetime
+	unread_count: int
+
+class ReadMarkerPayload(BaseModel):
+	# "group:<nombre>" o "peer:<email>"
+	conversation: str
+	last_read_id: Optional[int] = None
+
+class SyncPayload(BaseModel):
+	# "group:<nombre>" o "peer:<email>" -> último id recibido por el cliente
+	cursors: Dict[str, int] = {}
+
+class SyncConversation(BaseModel):
+	conversation: str
+	last_id: int
+	messages: List[MessageResponse]
+
+class SyncResponse(BaseModel):
+	conversations: List[SyncConversation]
+
+def group_conversation_key(group_name: str) -> str:
+	return f"group:{group_name}"
+
+def p2p_conversation_key(user1_id: int, user2_id: int) -> str:
+	low, high = sorted((user1_id, user2_id))
+	return f"p2p:{low}:{high}"
+
+def _upsert(db: Session, model):
+	# INSERT ... ON CONFLICT para Postgres (producción) y SQLite (pruebas)
+	if db.get_bind().dialect.name == "postgresql":
+		return postgresql.insert(model)
+	return sqlite.insert(model)
+
+# Filas por sentencia en los upserts multi-fila (límite de parámetros de SQLite)
+UPSERT_CHUNK = 500
+
+def _bump_conversation_heads(db: Session, heads: Dict[str, int]):
+	now = datetime.now(timezone.utc)
+	# Claves en orden fijo: lotes concurrentes bloquean las filas en el mismo orden
+	rows = [{"key": key, "last_message_id": message_id, "updated_at": now} for key, message_id in sorted(heads.items())]
+	stmt = _upsert(db, ConversationHead).values(rows)
+
+	# Nunca retroceder la marca si dos envíos confirman fuera de orden
+	stmt = stmt.on_conflict_do_update(
+		index_elements=[ConversationHead.key],
+		set_={
+			"last_message_id": case(
+				(stmt.excluded.last_message_id > ConversationHead.last_message_id, stmt.excluded.last_message_id),
+				else_=ConversationHead.last_message_id,
+			),
+			"updated_at": stmt.excluded.updated_at,
+		},
+	)
+	db.execute(stmt)
+
+def _record_conversation_activity(db: Session, rows: List[dict]):
+	for start in range(0, len(rows), UPSERT_CHUNK):
+		_upsert_conversation_summaries(db, rows[start:start + UPSERT_CHUNK])
+
+def _upsert_conversation_summaries(db: Session, rows: List[dict]):
+	stmt = _upsert(db, ConversationSummary).values(rows)
+	newer = stmt.excluded.last_message_id > ConversationSummary.last_message_id
+	stmt = stmt.on_conflict_do_update(
+		index_elements=[ConversationSummary.user_id, ConversationSummary.conversation_key],
+		set_={
+			"last_message_id": case((newer, stmt.excluded.last_message_id), else_=ConversationSummary.last_message_id),
+			"last_sender_id": case((newer, stmt.excluded.last_sender_id), else_=ConversationSummary.last_sender_id),
+			"last_timestamp": case((newer, stmt.excluded.last_timestamp), else_=ConversationSummary.last_timestamp),
+			"unread_count": ConversationSummary.unread_count + stmt.excluded.unread_count,
+		},
+	)
+	db.execute(stmt)
+
+def _group_member_ids(db: Session, group_names) -> Dict[str, set]:
+	# Dueño y miembros de todos los grupos del lote en una consulta
+	owners = select(Group.id, Group.owner_id).where(Group.id.in_(group_names))
+	users = select(GroupUser.group_name, GroupUser.user_id).where(GroupUser.group_name.in_(group_names))
+	members = {name: set() for name in group_names}
+	for group_name, user_id in db.execute(owners.union_all(users)):
+		members[group_name].add(user_id)
+	return members
+
+def record_sent_messages(db: Session, messages: list):
+	"""
+	Marcas y resúmenes de mensajes ya insertados, dentro de la transacción del envío.
+	Con el group commit llega el lote entero: una marca por conversación y una fila
+	de resumen por participante, con los no leídos sumados; el remitente no suma.
+	"""
+	group_names = {msg.group_name for msg in messages if isinstance(msg, GroupMessage)}
+	members = _group_member_ids(db, group_names) if group_names else {}
+
+	heads: Dict[str, int] = {}
+	rows: Dict[tuple, dict] = {}
+	search_rows: List[dict] = []
+	for msg in messages:
+		if isinstance(msg, PeerMessage):
+			key = p2p_conversation_key(msg.sender_id, msg.receiver_id)
+			targets = {msg.sender_id: {"peer_id": msg.receiver_id}, msg.receiver_id: {"peer_id": msg.sender_id}}
+		else:
+			key = group_conversation_key(msg.group_name)
+			targets = {user_id: {"group_name": msg.group_name} for user_id in members[msg.group_name] | {msg.sender_id}}
+		heads[key] = max(heads.get(key, 0), msg.id)
+		for token in getattr(msg, "_search_tokens", ()):
+			search_rows.append({"conversation_key": key, "token": token, "message_id": msg.id})
+
+		for user_id, target in targets.items():
+			unread = 0 if user_id == msg.sender_id else 1
+			row = rows.get((user_id, key))
+			if row is None:
+				rows[(user_id, key)] = {
+					"user_id": user_id,
+					"conversation_key": key,
+					"peer_id": target.get("peer_id"),
+					"group_name": target.get("group_name"),
+					"last_message_id": msg.id,
+					"last_sender_id": msg.sender_id,
+					"last_timestamp": msg.timestamp,
+					"unread_count": unread,
+				}
+				continue
+			row["unread_count"] += unread
+			if msg.id > row["last_message_id"]:
+				row.update(last_message_id=msg.id, last_sender_id=msg.sender_id, last_timestamp=msg.timestamp)
+
+	_bump_conversation_heads(db, heads)
+	_record_conversation_activity(db, [rows[key] for key in sorted(rows)])
+	if search_rows:
+		# executemany: Postgres lo agrupa en INSERTs multi-fila
+		db.execute(MessageSearchToken.__table__.insert(), search_rows)
+
+def _attach_search_tokens(messages: list, payloads: List[MessagePayload], conversation: str):
+	# Los tokens se calculan con el texto plano antes de cifrar y se insertan en record_sent_messages
+	if message_search_enabled():
+		for msg, payload in zip(messages, payloads):
+			msg._search_tokens = keyword_tokens(conversation, payload.message)
+
+def _get_conversation_head(db: Session, key: str, fallback) -> int:
+	head = db.get(ConversationHead, key)
+	if head is not None:
+		return head.last_message_id
+	# Conversaciones anteriores a la tabla de marcas: se calcula una vez sobre la tabla de mensajes
+	return fallback.scalar() or 0
+
+def get_group_last_message_id(db: Session, group_name: str) -> int:
+	return _get_conversation_head(
+		db,
+		group_conversation_key(group_name),
+		db.query(func.max(GroupMessage.id)).filter(GroupMessage.group_name == group_name),
+	)
 
-	timestamp = datetime.now(timezone.utc)
+def _conversation_pair_filter(user1_id: int, user2_id: int):
+	low, high = sorted((user1_id, user2_id))
+	return and_(Conversation.user_low_id == low, Conversation.user_high_id == high)
+
+def get_conversation(db: Session, user1_id: int, user2_id: int) -> Conversation | None:
+	return db.query(Conversation).filter(_conversation_pair_filter(user1_id, user2_id)).first()
+
+def get_or_create_conversation(db: Session, user1_id: int, user2_id: int) -> Conversation:
+	conversation = get_conversation(db, user1_id, user2_id)
+	if conversation:
+		return conversation
+	low, high = sorted((user1_id, user2_id))
+	try:
+		# Savepoint: si otro envío creó el par a la vez, se reutiliza su fila
+		with db.begin_nested():
+			conversation = Conversation(user_low_id=low, user_high_id=high)
+			db.add(conversation)
+	except IntegrityError:
+		conversation = get_conversation(db, user1_id, user2_id)
+	return conversation
+
+async def get_group_last_message_id_async(db: AsyncSession, group_name: str) -> int:
+	return await db.run_sync(get_group_last_message_id, group_name)
+
+def get_p2p_last_message_id(db: Session, user1_id: int, user2_id: int) -> int:
+	return _get_conversation_head(
+		db,
+		p2p_conversation_key(user1_id, user2_id),
+		db.query(func.max(PeerMessage.id))
+		.join(Conversation, PeerMessage.conversation_id == Conversation.id)
+		.filter(_conversation_pair_filter(user1_id, user2_id)),
+	)
 
-	msg = PeerMessage(
-		sender_id=sender_id,
-		receiver_id=receiver_id,
-		message=encrypted_message,
-		signature=signature,
-		hash=generate_hash(payload.message+sender.email+receiver.email+timestamp.isoformat()),
-		timestamp=timestamp
+async def get_p2p_last_message_id_async(db: AsyncSession, user1_id: int, user2_id: int) -> int:
+	return await db.run_sync(get_p2p_last_message_id, user1_id, user2_id)
+
+def _apply_cursor(query, model, since_id: int | None, since_timestamp: datetime | None):
+	if since_id is not None:
+		query = query.filter(model.id > since_id)
+	if since_timestamp is not None:
+		query = query.filter(model.timestamp > since_timestamp)
+	return query
+
+def _signature_status(msg, sender: User) -> str | None:
+	message, signature = msg.signed_payload if isinstance(msg, PeerMessage) else (msg.message, msg.signature)
+	if not signature:
+		return None
+	pub_ecc_key = str_to_bytes(sender.public_ecc_key)
+	if (verify_signature_ecdsa(message, signature, pub_ecc_key)):
+		return "Signed"
+	return "Unauthentic"
+
+def _decrypt_cached(msg, reader_id: int | None, scope: str, decrypt: Callable[[], tuple]) -> tuple:
+	"""
+	(texto, estado de firma) del mensaje, pasando por el caché de descifrado si está activo.
+	Sin lector conocido no se cachea.
+	"""
+	cache = get_message_cache()
+	if cache is None or reader_id is None:
+		return decrypt()
+	key = (msg.__tablename__, msg.id, reader_id)
+	cached = cache.get(key)
+	if cached is not None:
+		return cached
+	message, signature = decrypt()
+	cache.put(key, message, signature, scope)
+	return message, signature
+
+def _materialize_p2p_message(msg: PeerMessage, sender: User, receiver: User, reader_id: int | None = None) -> dict:
+	def decrypt():
+		private_key_encrypted = str_to_bytes(receiver.private_key)
+		private_key = decrypt_bytes(private_key_encrypted)
+		return descifrar_mensaje_individual(msg.envelope, private_key), _signature_status(msg, sender)
+	decrypted_message, signature = _decrypt_cached(msg, reader_id, user_key_scope(receiver.id), decrypt)
+
+	return {
+		"id":        msg.id,
+		"sender":    sender.email,
+		"receiver":  receiver.email,
+		"message" :  decrypted_message,
+		"signature": signature,
+		"hash": msg.hash,
+		"timestamp": msg.timestamp,
+	}
+
+def _materialize_group_message(msg: GroupMessage, aes_key: bytes, sender: Identity | User, reader_id: int | None = None) -> dict:
+	decrypted_message, signature = _decrypt_cached(
+		msg, reader_id, group_key_scope(msg.group_name),
+		lambda: (descifrar_mensaje_grupal(msg.message, aes_key), _signature_status(msg, sender)),
 	)
-	db.add(msg)
-	db.commit()
-	db.refresh(msg)
+	return {
+		"id":        msg.id,
+		"sender":    sender.email,
+		"receiver":  msg.group_name,
+		"message" :  decrypted_message,
+		"signature": signature,
+		"hash": msg.hash,
+		"timestamp": msg.timestamp,
+	}
+
+class PendingWrite(TimeoutError):
+	"""
+	El group commit no confirmó el envío dentro de result_timeout, pero el mensaje sigue
+	en la cola y puede acabar escrito: reintentarlo lo duplicaría. hash lo identifica.
+	"""
+	def __init__(self, msg):
+		super().__init__("El envío sigue pendiente de confirmar")
+		self.hash = msg.hash
+
+def _store_message(db: Session, msg, write: Callable, before_commit: Optional[Callable] = None, coalescer=None, publish: Optional[Callable] = None):
+	"""
+	Escribe un mensaje ya cifrado: fila, entrada de la cadena con before_commit(db, msg),
+	marca y resúmenes, todo en una única transacción, y lo notifica con publish(msg).
+	Con un WriteCoalescer la escritura la hace su hilo junto con otros envíos
+	y esta llamada espera al commit del lote; si no llega a tiempo lanza PendingWrite.
+	"""
+	def write_all(session: Session):
+		write(session)
+		if before_commit:
+			before_commit(session, msg)
+		return msg
+
+	if coalescer is not None:
+		# La sesión de la petición no debe retener su transacción (ni bloqueos)
+		# mientras el escritor confirma el lote
+		db.commit()
+		future = coalescer.submit(write_all, finalize=record_sent_messages)
+		try:
+			# Con plazo: si el escritor se atasca, la petición no se cuelga
+			msg = future.result(timeout=coalescer.result_timeout)
+		except TimeoutError:
+			# Si el lote se confirma después, se notifica entonces
+			if publish is not None:
+				future.add_done_callback(lambda done: done.exception() is None and publish(done.result()))
+			raise PendingWrite(msg)
+	else:
+		write_all(db)
+		record_sent_messages(db, [msg])
+		# Fuera de la sesión antes del commit: sus columnas ya están cargadas
+		# y así no hace falta un refresh para devolverlo
+		db.expunge(msg)
+		db.commit()
+	if publish is not None:
+		publish(msg)
 	return msg
 
-def get_p2p_messages_by_user(db: Session, user1_id: int, user2_id: int):
-	user1_db = get_user_by_id(db, user1_id)
-	user2_db = get_user_by_id(db, user2_id)
+def _store_messages_bulk(db: Session, messages: list, before_commit: Optional[Callable] = None):
+	# Un INSERT multi-fila (insertmanyvalues) y la cadena alimentada con todo el lote
+	db.add_all(messages)
+	db.flush()
+	if before_commit:
+		before_commit(db, messages)
+	record_sent_messages(db, messages)
+	for msg in messages:
+		db.expunge(msg)
+	db.commit()
+	return messages
 
-	data = db.query(PeerMessage).filter(
-		or_(
-			and_(PeerMessage.sender_id == user1_id, PeerMessage.receiver_id == user2_id),
-			and_(PeerMessage.sender_id == user2_id, PeerMessage.receiver_id == user1_id)
+def _sign_messages(sender: User, encrypted: List[str], payloads: List[MessagePayload]) -> List[Optional[str]]:
+	# La clave ECC del remitente se descifra una vez, y solo si algún mensaje va firmado
+	signatures = [None] * len(payloads)
+	to_sign = [i for i, payload in enumerate(payloads) if payload.signed]
+	if to_sign:
+		private_ecc_key = decrypt_bytes(str_to_bytes(sender.private_ecc_key))
+		for i, signature in zip(to_sign, sign_data_ecdsa_batch([encrypted[i] for i in to_sign], private_ecc_key)):
+			signatures[i] = signature
+	return signatures
+
+def _message_timestamps(count: int) -> List[datetime]:
+	# Un microsegundo entre mensajes del mismo lote para conservar su orden
+	now = datetime.now(timezone.utc)
+	return [now + timedelta(microseconds=i) for i in range(count)]
+
+def _build_p2p_messages(sender: User, receiver: User, payloads: List[MessagePayload]) -> List[PeerMessage]:
+	encrypted = cifrar_mensajes_individuales([payload.message for payload in payloads], str_to_bytes(receiver.public_key))
+	signatures = _sign_messages(sender, encrypted, payloads)
+	messages = [
+		PeerMessage(
+			sender_id=sender.id,
+			receiver_id=receiver.id,
+			message=encrypted_message,
+			signature=signature,
+			hash=generate_hash(payload.message+sender.email+receiver.email+timestamp.isoformat()),
+			timestamp=timestamp
 		)
-	).order_by(PeerMessage.timestamp.desc()).all()
+		for payload, encrypted_message, signature, timestamp in zip(payloads, encrypted, signatures, _message_timestamps(len(payloads)))
+	]
+	_attach_search_tokens(messages, payloads, p2p_conversation_key(sender.id, receiver.id))
+	return messages
+
+def send_p2p_message(db: Session, sender: User, receiver: User, payload: MessagePayload, before_commit: Optional[Callable] = None, coalescer=None):
+	sender_id, receiver_id = sender.id, receiver.id
+	msg = _build_p2p_messages(sender, receiver, [payload])[0]
+
+	def write(session: Session):
+		conversation = get_or_create_conversation(session, sender_id, receiver_id)
+		msg.conversation_id = conversation.id
+		session.add(msg)
+		session.flush()
+
+	return _store_message(db, msg, write, before_commit, coalescer, publish=lambda stored: publish_p2p_message(sender_id, receiver_id, stored.id))
+
+def send_p2p_messages_bulk(db: Session, sender: User, receiver: User, payloads: List[MessagePayload], before_commit: Optional[Callable] = None) -> List[PeerMessage]:
+	"""
+	Envío en bloque (importaciones, relays): clave pública y de firma cargadas una vez,
+	cifrado y firma por lotes y una única transacción. before_commit recibe la lista.
+	"""
+	messages = _build_p2p_messages(sender, receiver, payloads)
+	conversation = get_or_create_conversation(db, sender.id, receiver.id)
+	for msg in messages:
+		msg.conversation_id = conversation.id
+	_store_messages_bulk(db, messages, before_commit)
+	# Un solo evento: los sockets piden todo lo posterior a su cursor
+	publish_p2p_message(sender.id, receiver.id, messages[0].id)
+	return messages
+
+def _get_or_create_conversations(db: Session, user_id: int, peer_ids: List[int]) -> Dict[int, int]:
+	# peer_id -> id de conversación: las existentes en una consulta y solo las nuevas una a una
+	pairs = {peer_id: tuple(sorted((user_id, peer_id))) for peer_id in peer_ids}
+	existing = {
+		(row.user_low_id, row.user_high_id): row.id
+		for row in db.query(Conversation.id, Conversation.user_low_id, Conversation.user_high_id)
+		.filter(or_(
+			and_(Conversation.user_low_id == user_id, Conversation.user_high_id.in_(peer_ids)),
+			and_(Conversation.user_high_id == user_id, Conversation.user_low_id.in_(peer_ids)),
+		))
+	}
+	return {
+		peer_id: existing[pair] if pair in existing else get_or_create_conversation(db, user_id, peer_id).id
+		for peer_id, pair in pairs.items()
+	}
+
+def send_p2p_broadcast(db: Session, sender: User, receivers: List[User], payload: MessagePayload, before_commit: Optional[Callable] = None) -> List[PeerMessage]:
+	"""
+	El mismo mensaje privado a varios destinatarios: un cifrado AES y una firma para
+	todos (PeerBroadcast) y, por destinatario, solo la clave AES envuelta con su RSA
+	en su propio PeerMessage. Cada destinatario lo ve en su conversación con el remitente.
+	Una única transacción; before_commit recibe la lista.
+	"""
+	shared, wrapped_keys = cifrar_mensaje_difusion(payload.message, [str_to_bytes(receiver.public_key) for receiver in receivers])
+	signature = _sign_messages(sender, [shared], [payload])[0]
+	timestamp = _message_timestamps(1)[0]
+	broadcast = PeerBroadcast(sender_id=sender.id, message=shared, signature=signature, timestamp=timestamp)
+	conversations = _get_or_create_conversations(db, sender.id, [receiver.id for receiver in receivers])
 
 	messages = []
-	for msg in data:
-		sender =   user1_db if msg.sender_id   == user1_id else user2_db
-		receiver = user2_db if msg.receiver_id == user2_id else user1_db
+	for receiver, wrapped_key in zip(receivers, wrapped_keys):
+		msg = PeerMessage(
+			sender_id=sender.id,
+			receiver_id=receiver.id,
+			conversation_id=conversations[receiver.id],
+			broadcast=broadcast,
+			message=wrapped_key,
+			hash=generate_hash(payload.message+sender.email+receiver.email+timestamp.isoformat()),
+			timestamp=timestamp
+		)
+		_attach_search_tokens([msg], [payload], p2p_conversation_key(sender.id, receiver.id))
+		messages.append(msg)
 
-		private_key_encrypted = str_to_bytes(receiver.private_key)
-		private_key = decrypt_bytes(private_key_encrypted)
-		decrypted_message = descifrar_mensaje_individual(msg.message, private_key)
-
-		signature = None
-		if (msg.signature):
-			pub_ecc_key = str_to_bytes(sender.public_ecc_key)
-			if (verify_signature_ecdsa(msg.message, msg.signature, pub_ecc_key)):
-				signature = "Signed"
-			else:
-				signature = "Unauthentic"
-
-		messages.append({
-			"sender":    sender.email,
-			"receiver":  receiver.email,
-			"message" :  decrypted_message,
-			"signature": signature,
-			"hash": msg.hash,
-			"timestamp": msg.timestamp,
-		})
+	_store_messages_bulk(db, messages, before_commit)
+	for msg in messages:
+		publish_p2p_message(sender.id, msg.receiver_id, msg.id)
 	return messages
 
+def _load_p2p_messages(db: Session, user1_id: int, user2_id: int, since_id: int | None, since_timestamp: datetime | None):
+	# Conversación sin cambios desde el cursor: una sola búsqueda por clave primaria
+	if since_id is not None and get_p2p_last_message_id(db, user1_id, user2_id) <= since_id:
+		return [], {}
+
+	# Un único rango sobre (conversation_id, timestamp, id)
+	query = (
+		db.query(PeerMessage)
+		.join(Conversation, PeerMessage.conversation_id == Conversation.id)
+		.filter(_conversation_pair_filter(user1_id, user2_id))
+	)
+	data = _apply_cursor(query, PeerMessage, since_id, since_timestamp).order_by(PeerMessage.timestamp.desc(), PeerMessage.id.desc()).all()
+	if not data:
+		return [], {}
+
+	# Ambos extremos en una consulta; el descifrado necesita la clave privada del receptor
+	users = {user.id: user for user in db.query(User).filter(User.id.in_({user1_id, user2_id}))}
+	return data, users
+
+def _materialize_p2p_messages(data: List[PeerMessage], users: Dict[int, User], reader_id: int | None = None) -> List[dict]:
+	return [_materialize_p2p_message(msg, users[msg.sender_id], users[msg.receiver_id], reader_id) for msg in data]
+
+def get_p2p_messages_by_user(db: Session, user1_id: int, user2_id: int, since_id: int | None = None, since_timestamp: datetime | None = None, reader_id: int | None = None):
+	return _materialize_p2p_messages(*_load_p2p_messages(db, user1_id, user2_id, since_id, since_timestamp), reader_id=reader_id)
+
+async def get_p2p_messages_by_user_async(db: AsyncSession, user1_id: int, user2_id: int, since_id: int | None = None, since_timestamp: datetime | None = None, reader_id: int | None = None):
+	# Consultas en el event loop; el descifrado RSA/AES en el pool de cifrado
+	loaded = await db.run_sync(_load_p2p_messages, user1_id, user2_id, since_id, since_timestamp)
+	return await run_crypto(_materialize_p2p_messages, *loaded, reader_id=reader_id)
+
 def add_user_to_group(db: Session, user_id: int, group_name: int):
 	existing = db.query(GroupUser).filter_by(user_id=user_id, group_name=group_name).first()
 	if existing:
@@ -210,78 +855,267 @@ def add_user_to_group(db: Session, user_id: int, group_name: int):
 	db.add(group_user)
 	db.commit()
 	db.refresh(group_user)
+	index = _cached_membership_index(db)
+	if index is not None:
+		index.add_member(group_name, user_id)
 	return group_user
 
-def send_group_message(db: Session, sender_id: int, group_name: str, payload: MessagePayload):
-	aes_key_string = db.query(Group).filter_by(id=group_name).first().shared_aes_key
-	aes_key = str_to_bytes(aes_key_string)
-	encrypted_message = cifrar_mensaje_grupal(payload.message, aes_key)
+def current_group_key(db: Session, group: Group) -> tuple[int, bytes]:
+	"""
+	Época vigente del grupo y su clave. Se consulta en cada envío (una lectura por
+	clave primaria) para no cifrar nunca con una clave ya rotada por otro worker.
+	"""
+	row = db.query(GroupKey.epoch, GroupKey.aes_key).filter(GroupKey.group_name == group.id).order_by(GroupKey.epoch.desc()).first()
+	if row is None:
+		return 0, str_to_bytes(group.shared_aes_key)
+	aes_key = str_to_bytes(row.aes_key)
+	group_key_cache.put(group.id, row.epoch, aes_key)
+	return row.epoch, aes_key
+
+def _load_group_for_send(db: Session, group_name: str):
+	# Grupo y clave vigente en una sola consulta (LEFT JOIN con la última época)
+	row = (
+		db.query(Group, GroupKey.epoch, GroupKey.aes_key)
+		.outerjoin(GroupKey, GroupKey.group_name == Group.id)
+		.filter(Group.id == group_name)
+		.order_by(GroupKey.epoch.desc())
+		.first()
+	)
+	if row is None:
+		return None, None
+	group, epoch, aes_key = row
+	if epoch is None:
+		return group, (0, str_to_bytes(group.shared_aes_key))
+	return group, (epoch, str_to_bytes(aes_key))
+
+def get_group_keys(db: Session, group_name: str, epochs) -> Dict[int, bytes]:
+	"""
+	Claves de varias épocas de un grupo: las que no están en el caché en una sola consulta.
+	"""
+	wanted = set(epochs)
+	found = group_key_cache.get_many(group_name, wanted)
+	missing = wanted - found.keys()
+	if 0 in missing:
+		shared_aes_key = db.query(Group.shared_aes_key).filter(Group.id == group_name).scalar()
+		if shared_aes_key is not None:
+			found[0] = str_to_bytes(shared_aes_key)
+	if missing - {0}:
+		for epoch, aes_key in db.query(GroupKey.epoch, GroupKey.aes_key).filter(GroupKey.group_name == group_name, GroupKey.epoch.in_(missing - {0})):
+			found[epoch] = str_to_bytes(aes_key)
+	for epoch in missing & found.keys():
+		group_key_cache.put(group_name, epoch, found[epoch])
+	return found
+
+def rotate_group_key(db: Session, group_name: str) -> int:
+	"""
+	Crea la época siguiente con una clave AES nueva. Es un único INSERT: el historial
+	no se vuelve a cifrar. Dos rotaciones simultáneas chocan en la clave primaria
+	(IntegrityError). Devuelve la época nueva.
+	"""
+	epoch = (db.query(func.max(GroupKey.epoch)).filter(GroupKey.group_name == group_name).scalar() or 0) + 1
+	db.add(GroupKey(group_name=group_name, epoch=epoch, aes_key=bytes_to_str(get_random_bytes(32))))
+	try:
+		db.commit()
+	except IntegrityError:
+		db.rollback()
+		raise
+	# Lo ya descifrado con claves anteriores deja de servirse desde memoria
+	invalidate_group_key(group_name)
+	return epoch
+
+def _build_group_messages(sender: User, group: Group, payloads: List[MessagePayload], group_key: tuple[int, bytes]) -> List[GroupMessage]:
+	epoch, aes_key = group_key
+	encrypted = cifrar_mensajes_grupales([payload.message for payload in payloads], aes_key)
+	signatures = _sign_messages(sender, encrypted, payloads)
+	messages = [
+		GroupMessage(
+			sender_id=sender.id,
+			group_name=group.id,
+			key_epoch=epoch,
+			message=encrypted_message,
+			signature=signature,
+			hash=generate_hash(payload.message+sender.email+group.id+timestamp.isoformat()),
+			timestamp=timestamp
+		)
+		for payload, encrypted_message, signature, timestamp in zip(payloads, encrypted, signatures, _message_timestamps(len(payloads)))
+	]
+	_attach_search_tokens(messages, payloads, group_conversation_key(group.id))
+	return messages
 
-	sender = get_user_by_id(db, sender_id)
+def send_group_message(db: Session, sender: User, group_name: str, payload: MessagePayload, before_commit: Optional[Callable] = None, coalescer=None):
+	group, group_key = _load_group_for_send(db, group_name)
+	group_message = _build_group_messages(sender, group, [payload], group_key)[0]
 
-	signature = None
-	if (payload.signed):
-		private_ecc_key_encrypted = str_to_bytes(sender.private_ecc_key)
-		private_ecc_key = decrypt_bytes(private_ecc_key_encrypted)
-		signature = sign_data_ecdsa(encrypted_message, private_ecc_key)
+	def write(session: Session):
+		session.add(group_message)
+		session.flush()
 
-	timestamp = datetime.now(timezone.utc)
+	return _store_message(db, group_message, write, before_commit, coalescer, publish=lambda stored: publish_group_message(group_name, stored.id))
 
-	group_message = GroupMessage(
-		sender_id=sender_id,
-		group_name=group_name,
-		message=encrypted_message,
-		signature=signature,
-		hash=generate_hash(payload.message+sender.email+group_name+timestamp.isoformat()),
-		timestamp=timestamp
-	)
-	db.add(group_message)
-	db.commit()
-	db.refresh(group_message)
+def send_group_messages_bulk(db: Session, sender: User, group: Group, payloads: List[MessagePayload], before_commit: Optional[Callable] = None) -> List[GroupMessage]:
+	"""
+	Envío en bloque a un grupo: clave AES del grupo y clave de firma cargadas una vez,
+	cifrado y firma por lotes y una única transacción. before_commit recibe la lista.
+	"""
+	messages = _build_group_messages(sender, group, payloads, current_group_key(db, group))
+	_store_messages_bulk(db, messages, before_commit)
+	publish_group_message(group.id, messages[0].id)
+	return messages
 
-	return group_message
+def _load_group_messages(db: Session, group_name: str, since_id: int | None, since_timestamp: datetime | None, with_key: bool = True):
+	if since_id is not None and get_group_last_message_id(db, group_name) <= since_id:
+		return [], None, {}
 
-def get_group_messages(db: Session, group_name: int):
+	query = db.query(GroupMessage).filter_by(group_name=group_name)
 	data = (
-		db.query(GroupMessage)
-		.filter_by(group_name=group_name)
+		_apply_cursor(query, GroupMessage, since_id, since_timestamp)
 		.order_by(GroupMessage.timestamp.desc())
 		.all()
 	)
-	aes_key_string = db.query(Group).filter_by(id=group_name).first().shared_aes_key
-	aes_key = str_to_bytes(aes_key_string)
+	if not data:
+		return [], None, {}
+	# Solo las épocas presentes en el historial, normalmente desde el caché de claves
+	keys = get_group_keys(db, group_name, {msg.key_epoch for msg in data}) if with_key else None
+
+	# Todos los remitentes en una consulta IN, o ninguna si ya están en el caché de identidades
+	senders = get_identities(db, {msg.sender_id for msg in data})
+	return data, keys, senders
+
+def _materialize_group_messages(data: List[GroupMessage], keys: Dict[int, bytes], senders: Dict[int, Identity], reader_id: int | None = None) -> List[dict]:
+	return [_materialize_group_message(msg, keys[msg.key_epoch], senders[msg.sender_id], reader_id) for msg in data]
+
+def get_group_messages(db: Session, group_name: int, since_id: int | None = None, since_timestamp: datetime | None = None, reader_id: int | None = None):
+	return _materialize_group_messages(*_load_group_messages(db, group_name, since_id, since_timestamp), reader_id=reader_id)
+
+async def get_group_messages_async(db: AsyncSession, group_name: str, since_id: int | None = None, since_timestamp: datetime | None = None, reader_id: int | None = None):
+	loaded = await db.run_sync(_load_group_messages, group_name, since_id, since_timestamp)
+	return await run_crypto(_materialize_group_messages, *loaded, reader_id=reader_id)
+
+# Modo raw: el sobre tal como está guardado, sin descifrar ni verificar la firma en el servidor.
+# La firma es ECDSA P-256 (r||s en base64) sobre SHA-256 del sobre.
+# Grupos: {"mensaje": AES-256-GCM con el tag de 16 B al final, "nonce": 12 B}; la clave
+# es la de GET /group-messages/{grupo}/key?epoch=<key_epoch>.
+# P2P: {"mensaje", "clave_aes": clave AES envuelta con RSA-OAEP (SHA-1) para el receptor,
+# "iv": 16 B}; el cifrado GCM no guarda el tag y el texto lleva relleno de longitud al final.
+RAW_ALG_GROUP = "A256GCM"
+RAW_ALG_P2P = "RSA-OAEP+A256GCM-NOTAG"
+
+class RawMessageResponse(BaseModel):
+	id: int
+	sender: str
+	receiver: str
+	alg: str
+	envelope: str
+	signature: Optional[str] = None
+	hash: str
+	timestamp: datetime
+	# Solo en grupos: época de la clave con la que se cifró
+	key_epoch: Optional[int] = None
+	# Solo en difusiones P2P: texto sobre el que se calculó la firma ({"mensaje", "iv"})
+	signed_envelope: Optional[str] = None
+
+def _raw_message(msg, sender: Identity | User, receiver: str, alg: str) -> dict:
+	return {
+		"id":        msg.id,
+		"sender":    sender.email,
+		"receiver":  receiver,
+		"alg":       alg,
+		"envelope":  msg.envelope,
+		"signature": msg.signature,
+		"hash": msg.hash,
+		"timestamp": msg.timestamp,
+	}
+
+def _raw_p2p_message(msg: PeerMessage, users: Dict[int, User]) -> dict:
+	raw = _raw_message(msg, users[msg.sender_id], users[msg.receiver_id].email, RAW_ALG_P2P)
+	if msg.broadcast is not None:
+		# La firma cubre la parte común de la difusión, no el sobre de este destinatario
+		raw["signed_envelope"], raw["signature"] = msg.signed_payload
+	return raw
+
+def _raw_group_messages(data: List[GroupMessage], senders: Dict[int, Identity]) -> List[dict]:
+	return [dict(_raw_message(msg, senders[msg.sender_id], msg.group_name, RAW_ALG_GROUP), key_epoch=msg.key_epoch) for msg in data]
+
+def _raw_p2p_messages(data: List[PeerMessage], users: Dict[int, User]) -> List[dict]:
+	return [_raw_p2p_message(msg, users) for msg in data]
+
+def get_group_messages_raw(db: Session, group_name: str, since_id: int | None = None, since_timestamp: datetime | None = None) -> List[dict]:
+	data, _, senders = _load_group_messages(db, group_name, since_id, since_timestamp, with_key=False)
+	return _raw_group_messages(data, senders)
+
+async def get_group_messages_raw_async(db: AsyncSession, group_name: str, since_id: int | None = None, since_timestamp: datetime | None = None) -> List[dict]:
+	# Sin trabajo criptográfico: no hace falta el pool de cifrado
+	data, _, senders = await db.run_sync(_load_group_messages, group_name, since_id, since_timestamp, False)
+	return _raw_group_messages(data, senders)
+
+def get_p2p_messages_raw(db: Session, user1_id: int, user2_id: int, since_id: int | None = None, since_timestamp: datetime | None = None) -> List[dict]:
+	return _raw_p2p_messages(*_load_p2p_messages(db, user1_id, user2_id, since_id, since_timestamp))
+
+async def get_p2p_messages_raw_async(db: AsyncSession, user1_id: int, user2_id: int, since_id: int | None = None, since_timestamp: datetime | None = None) -> List[dict]:
+	loaded = await db.run_sync(_load_p2p_messages, user1_id, user2_id, since_id, since_timestamp)
+	return _raw_p2p_messages(*loaded)
+
+SEARCH_MESSAGES_LIMIT = 20
+
+def _matching_message_ids(db: Session, conversation: str, text: str, limit: int) -> List[int]:
+	"""
+	Ids de los mensajes que contienen todas las palabras de `text`, más recientes primero.
+	Solo se leen las entradas de esas palabras: el coste depende de los aciertos, no del historial.
+	"""
+	tokens = keyword_tokens(conversation, text)
+	if not tokens:
+		return []
+	rows = (
+		db.query(MessageSearchToken.message_id)
+		.filter(MessageSearchToken.conversation_key == conversation, MessageSearchToken.token.in_(tokens))
+		.group_by(MessageSearchToken.message_id)
+		.having(func.count() == len(tokens))
+		.order_by(MessageSearchToken.message_id.desc())
+		.limit(limit)
+	)
+	return [row[0] for row in rows]
+
+def _load_group_search(db: Session, group_name: str, text: str, limit: int):
+	ids = _matching_message_ids(db, group_conversation_key(group_name), text, limit)
+	if not ids:
+		return [], None, {}
+	data = db.query(GroupMessage).filter(GroupMessage.group_name == group_name, GroupMessage.id.in_(ids)).order_by(GroupMessage.id.desc()).all()
+	keys = get_group_keys(db, group_name, {msg.key_epoch for msg in data})
+	return data, keys, get_identities(db, {msg.sender_id for msg in data})
+
+def _load_p2p_search(db: Session, user1_id: int, user2_id: int, text: str, limit: int):
+	ids = _matching_message_ids(db, p2p_conversation_key(user1_id, user2_id), text, limit)
+	if not ids:
+		return [], {}
+	data = (
+		db.query(PeerMessage)
+		.join(Conversation, PeerMessage.conversation_id == Conversation.id)
+		.filter(_conversation_pair_filter(user1_id, user2_id), PeerMessage.id.in_(ids))
+		.order_by(PeerMessage.id.desc())
+		.all()
+	)
+	users = {user.id: user for user in db.query(User).filter(User.id.in_({user1_id, user2_id}))}
+	return data, users
 
-	messages = []
-	for msg in data:
-		decrypted_message = descifrar_mensaje_grupal(msg.message, aes_key)
-		sender = get_user_by_id(db, msg.sender_id)
-
-		signature = None
-		if (msg.signature):
-			pub_ecc_key = str_to_bytes(sender.public_ecc_key)
-			if (verify_signature_ecdsa(msg.message, msg.signature, pub_ecc_key)):
-				signature = "Signed"
-			else:
-				signature = "Unauthentic"
-
-		messages.append({
-			"sender":    sender.email,
-			"receiver":  msg.group_name,
-			"message" :  decrypted_message,
-			"signature": signature,
-			"hash": msg.hash,
-			"timestamp": msg.timestamp,
-		})
+def search_group_messages(db: Session, group_name: str, text: str, limit: int = SEARCH_MESSAGES_LIMIT, reader_id: int | None = None) -> List[dict]:
+	return _materialize_group_messages(*_load_group_search(db, group_name, text, limit), reader_id=reader_id)
 
-	return messages
+async def search_group_messages_async(db: AsyncSession, group_name: str, text: str, limit: int = SEARCH_MESSAGES_LIMIT, reader_id: int | None = None) -> List[dict]:
+	loaded = await db.run_sync(_load_group_search, group_name, text, limit)
+	return await run_crypto(_materialize_group_messages, *loaded, reader_id=reader_id)
 
-def get_user_groups(db: Session, user_id: int):
-	return (
-		db.query(Group)
-		.join(GroupUser)
-		.filter(GroupUser.user_id == user_id)
-		.all()
-	)
+def search_p2p_messages(db: Session, user1_id: int, user2_id: int, text: str, limit: int = SEARCH_MESSAGES_LIMIT, reader_id: int | None = None) -> List[dict]:
+	return _materialize_p2p_messages(*_load_p2p_search(db, user1_id, user2_id, text, limit), reader_id=reader_id)
+
+async def search_p2p_messages_async(db: AsyncSession, user1_id: int, user2_id: int, text: str, limit: int = SEARCH_MESSAGES_LIMIT, reader_id: int | None = None) -> List[dict]:
+	loaded = await db.run_sync(_load_p2p_search, user1_id, user2_id, text, limit)
+	return await run_crypto(_materialize_p2p_messages, *loaded, reader_id=reader_id)
+
+def get_user_groups(db: Session, user_id: int) -> List[str]:
+	"""
+	Nombres de los grupos en los que el usuario es miembro, desde el índice de membresías.
+	"""
+	return list(membership_index(db).user_groups(user_id))
 
 def create_group(db: Session, name: str, user_id) -> Group:
 	aes_key = bytes_to_str(get_random_bytes(32))
@@ -289,22 +1123,426 @@ def create_group(db: Session, name: str, user_id) -> Group:
 	db.add(new_group)
 	db.commit()
 	db.refresh(new_group)
+	index = _cached_membership_index(db)
+	if index is not None:
+		index.add_group(name, user_id)
 	return new_group
 
 def get_group_owner_email(db: Session, group_name: str) -> str | None:
-	group = db.query(Group).filter(Group.id == group_name).first()
-	if group and group.owner:
-		return group.owner.email
-	return None
+	owner_id = membership_index(db).owner_id(group_name)
+	if owner_id is None:
+		return None
+	owner = get_identities(db, [owner_id]).get(owner_id)
+	return owner.email if owner else None
+
+def is_group_member(db: Session, user_id: int, group_name: str) -> bool:
+	return membership_index(db).is_member(user_id, group_name)
+
+# Índice de membresías por base de datos (URL sin driver: el engine sync y el async
+# comparten índice). Los cambios de este proceso se aplican al momento; los de otros
+# workers se detectan con la versión "memberships", como mucho cada MEMBERSHIP_INDEX_REFRESH_SECONDS
+MEMBERSHIP_INDEX_REFRESH = float(get_setting("MEMBERSHIP_INDEX_REFRESH_SECONDS", "5"))
+_membership_indexes: Dict[str, MembershipIndex] = {}
+_membership_lock = threading.Lock()
+
+def _membership_key(db: Session) -> str:
+	url = db.get_bind().url
+	return url.set(drivername=url.get_backend_name()).render_as_string(hide_password=True)
+
+def _cached_membership_index(db: Session) -> MembershipIndex | None:
+	return _membership_indexes.get(_membership_key(db))
+
+def _build_membership_index(db: Session) -> MembershipIndex:
+	version = get_directory_versions(db, [DIRECTORY_MEMBERSHIPS])[DIRECTORY_MEMBERSHIPS]
+	owners = dict(db.query(Group.id, Group.owner_id).all())
+	return MembershipIndex(owners, db.query(GroupUser.group_name, GroupUser.user_id).all(), version)
+
+def membership_index(db: Session) -> MembershipIndex:
+	key = _membership_key(db)
+	index = _membership_indexes.get(key)
+	if index is not None and not index.is_stale(MEMBERSHIP_INDEX_REFRESH):
+		return index
+	if index is not None and get_directory_versions(db, [DIRECTORY_MEMBERSHIPS])[DIRECTORY_MEMBERSHIPS] == index.version:
+		index.checked_at = index.clock()
+		return index
+	index = _build_membership_index(db)
+	with _membership_lock:
+		_membership_indexes[key] = index
+	return index
+
+def warm_membership_index():
+	# Al arrancar el worker: la primera comprobación de permisos ya no consulta la base
+	with SessionLocal() as db:
+		membership_index(db)
+
+def clear_membership_indexes():
+	with _membership_lock:
+		_membership_indexes.clear()
+
+DIRECTORY_USERS = "users"
+DIRECTORY_GROUPS = "groups"
+DIRECTORY_MEMBERSHIPS = "memberships"
+DIRECTORY_PAGE_SIZE = 100
+DIRECTORY_MAX_PAGE = 1000
+
+def group_members_directory(group_name: str) -> str:
+	return f"members:{group_name}"
+
+def _bump_directories(connection, *names: str):
+	# En la misma transacción que el cambio: todas las réplicas y workers ven la versión nueva a la vez
+	table = DirectoryVersion.__table__
+	insert = postgresql.insert if connection.dialect.name == "postgresql" else sqlite.insert
+	for name in names:
+		stmt = insert(table).values(name=name, version=1)
+		connection.execute(stmt.on_conflict_do_update(index_elements=[table.c.name], set_={"version": table.c.version + 1}))
+
+@event.listens_for(User, "after_insert")
+@event.listens_for(User, "after_delete")
+def _bump_users_directory(mapper, connection, user: User):
+	_bump_directories(connection, DIRECTORY_USERS)
+
+@event.listens_for(User, "after_update")
+def _bump_users_directory_on_email(mapper, connection, user: User):
+	if inspect(user).attrs.email.history.has_changes():
+		_bump_directories(connection, DIRECTORY_USERS)
+
+@event.listens_for(Group, "after_insert")
+@event.listens_for(Group, "after_delete")
+def _bump_groups_directory(mapper, connection, group: Group):
+	_bump_directories(connection, DIRECTORY_GROUPS, DIRECTORY_MEMBERSHIPS)
+
+@event.listens_for(GroupUser, "after_insert")
+@event.listens_for(GroupUser, "after_delete")
+def _bump_members_directory(mapper, connection, group_user: GroupUser):
+	_bump_directories(connection, group_members_directory(group_user.group_name), DIRECTORY_MEMBERSHIPS)
+
+def get_directory_versions(db: Session, names: List[str]) -> Dict[str, int]:
+	rows = dict(db.query(DirectoryVersion.name, DirectoryVersion.version).filter(DirectoryVersion.name.in_(names)).all())
+	return {name: rows.get(name, 0) for name in names}
+
+def _keyset_page(query, column, limit: int, after: str | None):
+	"""
+	Página ordenada por una columna única: WHERE columna > cursor ORDER BY columna LIMIT n+1.
+	Devuelve (valores, siguiente cursor o None).
+	"""
+	if after is not None:
+		query = query.filter(column > after)
+	values = [row[0] for row in query.order_by(column).limit(limit + 1)]
+	if len(values) > limit:
+		return values[:limit], values[limit - 1]
+	return values, None
+
+def list_user_emails(db: Session, limit: int = DIRECTORY_PAGE_SIZE, after: str | None = None):
+	return _keyset_page(db.query(User.email), User.email, limit, after)
+
+def list_group_names(db: Session, limit: int = DIRECTORY_PAGE_SIZE, after: str | None = None):
+	return _keyset_page(db.query(Group.id), Group.id, limit, after)
+
+def group_participant_filter(group_name: str):
+	# Dueño o miembro del grupo, como condición sobre User
+	owner_id = select(Group.owner_id).where(Group.id == group_name).scalar_subquery()
+	is_member = select(GroupUser.id).where(GroupUser.group_name == group_name, GroupUser.user_id == User.id).exists()
+	return or_(User.id == owner_id, is_member)
+
+# Por encima de este número de participantes, NOT IN con los ids deja de compensar frente a la subconsulta
+PARTICIPANT_IN_MAX = 1000
+
+def group_participants_condition(db: Session, group_name: str):
+	"""
+	Condición "es dueño o miembro del grupo" sobre User: lista de ids del índice de
+	membresías si el grupo es pequeño y, si no, la subconsulta de group_participant_filter.
+	"""
+	ids = membership_index(db).participant_ids(group_name)
+	if len(ids) <= PARTICIPANT_IN_MAX:
+		return User.id.in_(ids)
+	return group_participant_filter(group_name)
+
+def get_group_non_participants(db: Session, group_name: str, limit: int = DIRECTORY_PAGE_SIZE, after: str | None = None):
+	"""
+	Emails de los usuarios que no son dueño ni miembros del grupo, paginados por email.
+	"""
+	query = db.query(User.email).filter(~group_participants_condition(db, group_name))
+	return _keyset_page(query, User.email, limit, after)
+
+def _load_sync(db: Session, user_id: int, cursors: Dict[str, int]):
+	group_cursors = {group_name: cursors.get(f"group:{group_name}", 0) for group_name in get_user_groups(db, user_id)}
+
+	users = {}
+	peer_cursors = {}
+	peer_emails = [key[len("peer:"):] for key in cursors if key.startswith("peer:")]
+	if peer_emails:
+		for user in db.query(User).filter(User.email.in_(peer_emails)):
+			users[user.id] = user
+			peer_cursors[user.id] = cursors[f"peer:{user.email}"]
+
+	conversation_ids = {}
+	for conversation in db.query(Conversation).filter(or_(Conversation.user_low_id == user_id, Conversation.user_high_id == user_id)):
+		peer_id = conversation.user_high_id if conversation.user_low_id == user_id else conversation.user_low_id
+		conversation_ids[peer_id] = conversation.id
+		peer_cursors.setdefault(peer_id, 0)
+	# Pares pedidos por el cliente sin conversación todavía no tienen mensajes
+	peer_cursors = {peer_id: since_id for peer_id, since_id in peer_cursors.items() if peer_id in conversation_ids}
+
+	# Marcas de agua de los grupos y chats P2P en los que participa el usuario
+	head_keys = [group_conversation_key(name) for name in group_cursors]
+	head_keys += [p2p_conversation_key(user_id, peer_id) for peer_id in peer_cursors]
+	heads = {}
+	if head_keys:
+		heads = dict(db.query(ConversationHead.key, ConversationHead.last_message_id).filter(ConversationHead.key.in_(head_keys)).all())
+
+	# Sin marca de agua (conversaciones antiguas) se consulta igualmente
+	changed_groups = {
+		name: since_id for name, since_id in group_cursors.items()
+		if heads.get(group_conversation_key(name), since_id + 1) > since_id
+	}
+	changed_peers = {
+		peer_id: since_id for peer_id, since_id in peer_cursors.items()
+		if heads.get(p2p_conversation_key(user_id, peer_id), since_id + 1) > since_id
+	}
+
+	group_rows = []
+	aes_keys = {}
+	if changed_groups:
+		group_rows = (
+			db.query(GroupMessage)
+			.filter(or_(*[
+				and_(GroupMessage.group_name == name, GroupMessage.id > since_id)
+				for name, since_id in changed_groups.items()
+			]))
+			.order_by(GroupMessage.timestamp.desc())
+			.all()
+		)
+		epochs: Dict[str, set] = {}
+		for msg in group_rows:
+			epochs.setdefault(msg.group_name, set()).add(msg.key_epoch)
+		for group_name, group_epochs in epochs.items():
+			aes_keys[group_name] = get_group_keys(db, group_name, group_epochs)
+
+	peer_rows = []
+	if changed_peers:
+		peer_rows = (
+			db.query(PeerMessage)
+			.filter(or_(*[
+				and_(PeerMessage.conversation_id == conversation_ids[peer_id], PeerMessage.id > since_id)
+				for peer_id, since_id in changed_peers.items()
+			]))
+			.order_by(PeerMessage.timestamp.desc())
+			.all()
+		)
 
-def get_group_non_participants(db: Session, group_name:str):
-	group = db.query(Group).filter(Group.id == group_name).first()
+	# Remitentes y participantes en una sola consulta
+	missing = ({user_id} | {msg.sender_id for msg in group_rows} | {msg.sender_id for msg in peer_rows} | {msg.receiver_id for msg in peer_rows}) - users.keys()
+	if missing:
+		for user in db.query(User).filter(User.id.in_(missing)):
+			users[user.id] = user
+
+	return user_id, group_rows, aes_keys, peer_rows, users
+
+def _materialize_sync(user_id: int, group_rows: List[GroupMessage], aes_keys: Dict[str, Dict[int, bytes]], peer_rows: List[PeerMessage], users: Dict[int, User]) -> dict:
+	conversations: Dict[str, List[dict]] = {}
+	for msg in group_rows:
+		message = _materialize_group_message(msg, aes_keys[msg.group_name][msg.key_epoch], users[msg.sender_id], user_id)
+		conversations.setdefault(f"group:{msg.group_name}", []).append(message)
+	for msg in peer_rows:
+		peer_id = msg.receiver_id if msg.sender_id == user_id else msg.sender_id
+		message = _materialize_p2p_message(msg, users[msg.sender_id], users[msg.receiver_id], user_id)
+		conversations.setdefault(f"peer:{users[peer_id].email}", []).append(message)
+
+	return {
+		"conversations": [
+			{"conversation": key, "last_id": max(message["id"] for message in messages), "messages": messages}
+			for key, messages in conversations.items()
+		]
+	}
+
+def sync_conversations(db: Session, user_id: int, cursors: Dict[str, int]) -> dict:
+	"""
+	Mensajes nuevos de todos los grupos y chats P2P del usuario respecto a los cursores
+	del cliente, con un número fijo de consultas sin importar cuántas conversaciones tenga.
+	"""
+	return _materialize_sync(*_load_sync(db, user_id, cursors))
+
+async def sync_conversations_async(db: AsyncSession, user_id: int, cursors: Dict[str, int]) -> dict:
+	loaded = await db.run_sync(_load_sync, user_id, cursors)
+	return await run_crypto(_materialize_sync, *loaded)
+
+def backfill_conversation_ids(db: Session, batch_size: int = 1000) -> int:
+	"""
+	Crea las conversaciones que faltan y asigna conversation_id a los mensajes P2P
+	antiguos por lotes, confirmando cada lote para no bloquear la tabla. Es idempotente.
+	"""
+	low = case((PeerMessage.sender_id < PeerMessage.receiver_id, PeerMessage.sender_id), else_=PeerMessage.receiver_id)
+	high = case((PeerMessage.sender_id < PeerMessage.receiver_id, PeerMessage.receiver_id), else_=PeerMessage.sender_id)
+
+	pairs = db.query(low, high).filter(PeerMessage.conversation_id.is_(None)).distinct().all()
+	for user_low_id, user_high_id in pairs:
+		get_or_create_conversation(db, user_low_id, user_high_id)
+	db.commit()
 
-	member_user_ids = db.query(GroupUser.user_id).filter(GroupUser.group_name == group_name).subquery()
+	conversation_id = (
+		select(Conversation.id)
+		.where(Conversation.user_low_id == low, Conversation.user_high_id == high)
+		.scalar_subquery()
+	)
+	updated = 0
+	while True:
+		batch = select(PeerMessage.id).where(PeerMessage.conversation_id.is_(None)).limit(batch_size).scalar_subquery()
+		result = db.execute(
+			update(PeerMessage)
+			.where(PeerMessage.id.in_(batch))
+			.values(conversation_id=conversation_id)
+			.execution_options(synchronize_session=False)
+		)
+		db.commit()
+		if not result.rowcount:
+			return updated
+		updated += result.rowcount
+
+SUMMARY_COLUMNS = ("user_id", "conversation_key", "peer_id", "group_name", "last_message_id", "last_sender_id", "last_timestamp", "unread_count")
+
+def _insert_missing_summaries(db: Session, rows) -> int:
+	# INSERT ... SELECT de las filas cuyo (usuario, conversación) aún no tiene resumen
+	existing = select(ConversationSummary.id).where(
+		ConversationSummary.user_id == rows.c.user_id,
+		ConversationSummary.conversation_key == rows.c.conversation_key,
+	).exists()
+	missing = select(*(rows.c[name] for name in SUMMARY_COLUMNS)).where(~existing)
+	return db.execute(ConversationSummary.__table__.insert().from_select(SUMMARY_COLUMNS, missing)).rowcount
+
+def backfill_conversation_summaries(db: Session) -> int:
+	"""
+	Resúmenes de las conversaciones anteriores a conversation_summaries, que solo se
+	escriben al enviar: último mensaje y mensajes ajenos como no leídos, por participante
+	(los dos extremos de un P2P; dueño y miembros de un grupo). Todo en SQL, sin cargar
+	mensajes; no toca los resúmenes que ya existen, así que es idempotente.
+	"""
+	# P2P: una fila por mensaje y extremo; el remitente no suma no leídos
+	sent = select(PeerMessage.sender_id.label("user_id"), PeerMessage.receiver_id.label("peer_id"), PeerMessage.id.label("message_id"), literal(0).label("unread"))
+	received = select(PeerMessage.receiver_id, PeerMessage.sender_id, PeerMessage.id, literal(1)).where(PeerMessage.receiver_id != PeerMessage.sender_id)
+	p2p = union_all(sent, received).subquery()
+	p2p_stats = (
+		select(p2p.c.user_id, p2p.c.peer_id, func.max(p2p.c.message_id).label("last_id"), func.sum(p2p.c.unread).label("unread"))
+		.group_by(p2p.c.user_id, p2p.c.peer_id)
+		.subquery()
+	)
+	low = case((p2p_stats.c.user_id < p2p_stats.c.peer_id, p2p_stats.c.user_id), else_=p2p_stats.c.peer_id)
+	high = case((p2p_stats.c.user_id < p2p_stats.c.peer_id, p2p_stats.c.peer_id), else_=p2p_stats.c.user_id)
+	p2p_rows = (
+		select(
+			p2p_stats.c.user_id,
+			# Misma clave que p2p_conversation_key
+			(literal("p2p:") + cast(low, String) + literal(":") + cast(high, String)).label("conversation_key"),
+			p2p_stats.c.peer_id,
+			literal(None, String).label("group_name"),
+			PeerMessage.id.label("last_message_id"),
+			PeerMessage.sender_id.label("last_sender_id"),
+			func.coalesce(PeerMessage.timestamp, func.current_timestamp()).label("last_timestamp"),
+			p2p_stats.c.unread.label("unread_count"),
+		)
+		.select_from(p2p_stats)
+		.join(PeerMessage, PeerMessage.id == p2p_stats.c.last_id)
+		.subquery()
+	)
 
-	users = db.query(User).filter(
-		User.id != group.owner_id,
-		~User.id.in_(member_user_ids)
-	).all()
+	# Grupos: dueño y miembros actuales; cuenta como no leído todo mensaje ajeno
+	participants = union(
+		select(Group.id.label("group_name"), Group.owner_id.label("user_id")),
+		select(GroupUser.group_name, GroupUser.user_id),
+	).subquery()
+	group_stats = (
+		select(
+			participants.c.group_name,
+			participants.c.user_id,
+			func.max(GroupMessage.id).label("last_id"),
+			func.sum(case((GroupMessage.sender_id != participants.c.user_id, 1), else_=0)).label("unread"),
+		)
+		.join(GroupMessage, GroupMessage.group_name == participants.c.group_name)
+		.group_by(participants.c.group_name, participants.c.user_id)
+		.subquery()
+	)
+	last = aliased(GroupMessage)
+	group_rows = (
+		select(
+			group_stats.c.user_id,
+			(literal("group:") + group_stats.c.group_name).label("conversation_key"),
+			literal(None, Integer).label("peer_id"),
+			group_stats.c.group_name,
+			last.id.label("last_message_id"),
+			last.sender_id.label("last_sender_id"),
+			func.coalesce(last.timestamp, func.current_timestamp()).label("last_timestamp"),
+			group_stats.c.unread.label("unread_count"),
+		)
+		.select_from(group_stats)
+		.join(last, last.id == group_stats.c.last_id)
+		.subquery()
+	)
+
+	inserted = _insert_missing_summaries(db, p2p_rows) + _insert_missing_summaries(db, group_rows)
+	db.commit()
+	return inserted
+
+def get_conversation_summaries(db: Session, user_id: int, limit: int = 50) -> List[dict]:
+	Peer = aliased(User)
+	Sender = aliased(User)
+	rows = (
+		db.query(ConversationSummary, Peer.email, Sender.email)
+		.outerjoin(Peer, Peer.id == ConversationSummary.peer_id)
+		.outerjoin(Sender, Sender.id == ConversationSummary.last_sender_id)
+		.filter(ConversationSummary.user_id == user_id)
+		.order_by(ConversationSummary.last_timestamp.desc())
+		.limit(limit)
+		.all()
+	)
+	return [
+		{
+			"conversation": f"group:{summary.group_name}" if summary.group_name else f"peer:{peer_email}",
+			"last_message_id": summary.last_message_id,
+			"last_sender": sender_email,
+			"last_timestamp": summary.last_timestamp,
+			"unread_count": summary.unread_count,
+		}
+		for summary, peer_email, sender_email in rows
+	]
+
+def mark_conversation_read(db: Session, user_id: int, conversation: str, last_read_id: int | None = None) -> Optional[int]:
+	"""
+	Avanza la marca de lectura hasta last_read_id (o hasta el último mensaje) y devuelve
+	los no leídos que quedan, o None si la conversación no existe. Un único UPDATE que
+	recuenta los mensajes ajenos posteriores a la marca: un envío concurrente que ya sumó
+	su no leído no se pierde y la marca nunca retrocede.
+	"""
+	if conversation.startswith("group:"):
+		group_name = conversation[len("group:"):]
+		key = group_conversation_key(group_name)
+		newer = (GroupMessage.group_name == group_name, GroupMessage.sender_id != user_id)
+		message_id = GroupMessage.id
+	elif conversation.startswith("peer:"):
+		peer_id = get_user_id_by_email(db, conversation[len("peer:"):])
+		if not peer_id:
+			return None
+		key = p2p_conversation_key(user_id, peer_id)
+		newer = (PeerMessage.sender_id == peer_id, PeerMessage.receiver_id == user_id, PeerMessage.sender_id != user_id)
+		message_id = PeerMessage.id
+	else:
+		return None
+
+	target = ConversationSummary.last_message_id if last_read_id is None else last_read_id
+	previous = func.coalesce(ConversationSummary.last_read_message_id, 0)
+	read_upto = case((previous > target, previous), else_=target)
+	unread = select(func.count(message_id)).where(*newer, message_id > read_upto).scalar_subquery()
+	mine = (ConversationSummary.user_id == user_id, ConversationSummary.conversation_key == key)
+	result = db.execute(
+		update(ConversationSummary)
+		.where(*mine)
+		.values(last_read_message_id=read_upto, unread_count=unread)
+		.execution_options(synchronize_session=False)
+	)
+	if not result.rowcount:
+		db.rollback()
+		return None
+	remaining = db.execute(select(ConversationSummary.unread_count).where(*mine)).scalar_one()
+	db.commit()
+	return remaining
 
-	return [{"email": user.email} for user in users]
\ No newline at end of file
+async def get_conversation_summaries_async(db: AsyncSession, user_id: int, limit: int = 50) -> List[dict]:
+	return await db.run_sync(get_conversation_summaries, user_id, limit)
@@ -0,0 +1,130 @@
+import bisect
+import re
+import threading
+import time
+import weakref
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.config import get_setting
+import app.model.models as mdls
+
+SEARCH_MAX_RESULTS = 100
+# Separadores de palabra dentro de un email o nombre de grupo
+_TOKEN_BOUNDARY = re.compile(r"[^0-9a-z]+")
+
+class PrefixIndex:
+	"""
+	Índice ordenado en memoria para buscar por prefijo con bisect.
+	Cada valor se indexa por su texto completo y por cada palabra interna
+	("juan.perez@correo.com" también responde a "perez" o "correo").
+	Una búsqueda recorre solo las entradas que devuelve: O(log n + limit).
+	"""
+	def __init__(self, values: List[str]):
+		full = []
+		tokens = []
+		for position, value in enumerate(values):
+			lowered = value.lower()
+			full.append((lowered, position))
+			for match in _TOKEN_BOUNDARY.finditer(lowered):
+				if match.end() < len(lowered):
+					tokens.append((lowered[match.end():], lowered, position))
+		full.sort()
+		tokens.sort()
+		self.values = values
+		self._full = ([key for key, _ in full], [position for _, position in full])
+		self._tokens = ([key for key, _, _ in tokens], [position for _, _, position in tokens])
+
+	def search(self, query: str, limit: int, exclude: Optional[Set[str]] = None) -> List[str]:
+		"""
+		Primero los valores que empiezan por la consulta y después los que tienen
+		una palabra que empieza por ella, cada grupo en orden alfabético.
+		"""
+		query = query.lower()
+		results: List[str] = []
+		seen = set(exclude or ())
+		for keys, positions in (self._full, self._tokens):
+			i = bisect.bisect_left(keys, query)
+			while i < len(keys) and len(results) < limit and keys[i].startswith(query):
+				value = self.values[positions[i]]
+				if value not in seen:
+					seen.add(value)
+					results.append(value)
+				i += 1
+		return results
+
+class _IndexCache:
+	"""
+	Un índice por (engine, directorio), reconstruido cuando sube la versión del
+	directorio y como mucho cada SEARCH_INDEX_REFRESH_SECONDS.
+	"""
+	def __init__(self, refresh: float):
+		self.refresh = refresh
+		self._lock = threading.Lock()
+		self._indexes: "weakref.WeakKeyDictionary[object, Dict[str, tuple]]" = weakref.WeakKeyDictionary()
+
+	def get(self, db: Session, directory: str, load) -> PrefixIndex:
+		engine = db.get_bind()
+		version = mdls.get_directory_versions(db, [directory])[directory]
+		with self._lock:
+			cached = self._indexes.get(engine, {}).get(directory)
+		if cached is not None:
+			index, built_version, built_at = cached
+			if built_version == version or time.monotonic() - built_at < self.refresh:
+				return index
+		index = PrefixIndex(load(db))
+		with self._lock:
+			self._indexes.setdefault(engine, {})[directory] = (index, version, time.monotonic())
+		return index
+
+_index_cache = _IndexCache(refresh=float(get_setting("SEARCH_INDEX_REFRESH_SECONDS", "5")))
+
+def _escape_like(text: str) -> str:
+	return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _search_sql(db: Session, query, column, text: str, limit: int) -> List[str]:
+	"""
+	Postgres: los prefijos usan el índice lower(col) text_pattern_ops y, desde 3
+	caracteres, las subcadenas el índice GIN de trigramas (0005_search_indexes).
+	Orden: prefijos en orden alfabético (recorrido del índice), luego subcadenas
+	por posición de la coincidencia y longitud.
+	"""
+	lowered = func.lower(column)
+	escaped = _escape_like(text.lower())
+	prefix = escaped + "%"
+	results = [row[0] for row in query.filter(lowered.like(prefix, escape="\\")).order_by(lowered).limit(limit)]
+	if len(results) < limit and len(text) >= 3:
+		results += [
+			row[0] for row in query
+			.filter(lowered.like("%" + escaped + "%", escape="\\"), ~lowered.like(prefix, escape="\\"))
+			.order_by(func.strpos(lowered, text.lower()), func.length(column), column)
+			.limit(limit - len(results))
+		]
+	return results
+
+def search_users(db: Session, text: str, limit: int = 20, not_in_group: Optional[str] = None) -> List[str]:
+	"""
+	Emails que coinciden con `text`, ordenados por relevancia.
+	Con not_in_group se omiten el dueño y los miembros de ese grupo (selector de miembros).
+	"""
+	if db.get_bind().dialect.name == "postgresql":
+		query = db.query(mdls.User.email)
+		if not_in_group is not None:
+			query = query.filter(~mdls.group_participants_condition(db, not_in_group))
+		return _search_sql(db, query, mdls.User.email, text, limit)
+
+	index = _index_cache.get(db, mdls.DIRECTORY_USERS, lambda db: [row[0] for row in db.query(mdls.User.email)])
+	exclude = None
+	if not_in_group is not None:
+		participants = mdls.membership_index(db).participant_ids(not_in_group)
+		exclude = {identity.email for identity in mdls.get_identities(db, participants).values()}
+	return index.search(text, limit, exclude)
+
+def search_groups(db: Session, text: str, limit: int = 20) -> List[str]:
+	if db.get_bind().dialect.name == "postgresql":
+		return _search_sql(db, db.query(mdls.Group.id), mdls.Group.id, text, limit)
+
+	index = _index_cache.get(db, mdls.DIRECTORY_GROUPS, lambda db: [row[0] for row in db.query(mdls.Group.id)])
+	return index.search(text, limit)
@@ -0,0 +1,195 @@
+import asyncio
+import json
+import logging
+import select
+import threading
+from typing import Dict, Iterable, Set
+
+from sqlalchemy.engine.url import make_url
+
+from app.config import get_setting
+
+logger = logging.getLogger(__name__)
+
+# Canal de Postgres usado para repartir eventos entre workers
+NOTIFY_CHANNEL = "chat_events"
+
+def group_channel(group_name: str) -> str:
+	return f"group:{group_name}"
+
+def user_channel(user_id: int) -> str:
+	return f"user:{user_id}"
+
+class Subscription:
+	"""
+	Cola de eventos de un suscriptor (una conexión WebSocket).
+	Debe crearse dentro del event loop que la va a consumir.
+	"""
+	def __init__(self, bus: "InProcessBus", channels: Iterable[str]):
+		self.bus = bus
+		self.loop = asyncio.get_running_loop()
+		self.queue: asyncio.Queue = asyncio.Queue()
+		self.channels: Set[str] = set()
+		for channel in channels:
+			self.add(channel)
+
+	def add(self, channel: str):
+		if channel not in self.channels:
+			self.channels.add(channel)
+			self.bus._attach(channel, self)
+
+	def deliver(self, event: dict):
+		# Puede llamarse desde cualquier hilo (threadpool de Starlette o listener)
+		self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+
+	async def get(self) -> dict:
+		return await self.queue.get()
+
+	def close(self):
+		for channel in self.channels:
+			self.bus._detach(channel, self)
+		self.channels.clear()
+
+class InProcessBus:
+	"""
+	Pub/sub en memoria para un único worker.
+	Los eventos solo llevan el canal y el id del mensaje, nunca texto plano.
+	"""
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._subscribers: Dict[str, Set[Subscription]] = {}
+
+	def subscribe(self, channels: Iterable[str]) -> Subscription:
+		return Subscription(self, channels)
+
+	def _attach(self, channel: str, subscription: Subscription):
+		with self._lock:
+			self._subscribers.setdefault(channel, set()).add(subscription)
+
+	def _detach(self, channel: str, subscription: Subscription):
+		with self._lock:
+			subscribers = self._subscribers.get(channel)
+			if subscribers:
+				subscribers.discard(subscription)
+				if not subscribers:
+					del self._subscribers[channel]
+
+	def dispatch(self, event: dict):
+		with self._lock:
+			subscribers = list(self._subscribers.get(event["channel"], ()))
+		for subscription in subscribers:
+			subscription.deliver(event)
+
+	def publish(self, event: dict):
+		self.dispatch(event)
+
+	def close(self):
+		with self._lock:
+			self._subscribers.clear()
+
+class PostgresNotifyBus(InProcessBus):
+	"""
+	Reparte eventos entre varios workers con LISTEN/NOTIFY.
+	Cada worker publica con NOTIFY y entrega a sus suscriptores locales
+	desde un hilo listener, incluidos los eventos que él mismo publicó.
+	"""
+	def __init__(self, database_url: str):
+		super().__init__()
+		self._dsn = make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+		self._publish_lock = threading.Lock()
+		self._publish_conn = None
+		self._listener = None
+		self._stopping = threading.Event()
+
+	def _connect(self):
+		import psycopg2
+
+		conn = psycopg2.connect(self._dsn)
+		conn.autocommit = True
+		return conn
+
+	def publish(self, event: dict):
+		payload = json.dumps(event)
+		with self._publish_lock:
+			try:
+				if self._publish_conn is None or self._publish_conn.closed:
+					self._publish_conn = self._connect()
+				with self._publish_conn.cursor() as cursor:
+					cursor.execute("SELECT pg_notify(%s, %s)", (NOTIFY_CHANNEL, payload))
+			except Exception:
+				logger.exception("No se pudo publicar el evento %s", event)
+				self._publish_conn = None
+
+	def subscribe(self, channels: Iterable[str]) -> Subscription:
+		self._ensure_listener()
+		return super().subscribe(channels)
+
+	def _ensure_listener(self):
+		with self._lock:
+			if self._listener is None or not self._listener.is_alive():
+				self._stopping.clear()
+				self._listener = threading.Thread(target=self._listen, name="chat-bus-listener", daemon=True)
+				self._listener.start()
+
+	def _listen(self):
+		while not self._stopping.is_set():
+			try:
+				conn = self._connect()
+				with conn.cursor() as cursor:
+					cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+				while not self._stopping.is_set():
+					if select.select([conn], [], [], 1.0) == ([], [], []):
+						continue
+					conn.poll()
+					while conn.notifies:
+						notify = conn.notifies.pop(0)
+						self.dispatch(json.loads(notify.payload))
+				conn.close()
+			except Exception:
+				logger.exception("Listener de eventos desconectado, reintentando")
+				self._stopping.wait(1.0)
+
+	def close(self):
+		self._stopping.set()
+		with self._publish_lock:
+			if self._publish_conn is not None:
+				self._publish_conn.close()
+				self._publish_conn = None
+		super().close()
+
+_bus = None
+_bus_lock = threading.Lock()
+
+def get_bus() -> InProcessBus:
+	"""
+	CHAT_BUS=memory (por defecto) para un worker, CHAT_BUS=postgres para varios.
+	"""
+	global _bus
+	with _bus_lock:
+		if _bus is None:
+			backend = get_setting("CHAT_BUS", "memory").lower()
+			if backend == "postgres":
+				_bus = PostgresNotifyBus(get_setting("DATABASE_URL"))
+			else:
+				_bus = InProcessBus()
+		return _bus
+
+def close_bus():
+	global _bus
+	with _bus_lock:
+		if _bus is not None:
+			_bus.close()
+			_bus = None
+
+def publish_group_message(group_name: str, message_id: int):
+	get_bus().publish({"channel": group_channel(group_name), "group": group_name, "message_id": message_id})
+
+def publish_p2p_message(sender_id: int, receiver_id: int, message_id: int):
+	# Se notifica a ambos extremos para que el emisor vea su mensaje en otras pestañas
+	for user_id in {sender_id, receiver_id}:
+		get_bus().publish({
+			"channel": user_channel(user_id),
+			"sender_id": sender_id,
+			"receiver_id": receiver_id,
+			"message_id": message_id,
+		})
@@ -6,14 +6,15 @@ from app.schemas.schemas import UserCreate, UserOut, Token, UserLogin, SignupRes
 from app.model.models import User
 from app.db.db import get_db
 from app.auth.utils import verify_password
-from app.auth.jwt import create_access_token, create_refresh_token, decode_token
+from app.auth.jwt import create_access_token, create_refresh_token, decode_token, revoke_token
 from app.auth.totp import verify_totp_token
-from app.auth.dependencies import get_current_user
+from app.auth.dependencies import get_current_user, oauth2_scheme
 import pyotp
 import qrcode
 import io
 import base64
 import logging
+from typing import Optional
 
 from app.crypto.crypto import bytes_to_str, generate_rsa_keys, encrypt_bytes, generate_ecc_keys
 from app.utils.limiter import limiter
@@ -147,6 +148,8 @@ def refresh_token_endpoint(
 	if not user:
 		raise HTTPException(status_code=404, detail="User not found")
 
+	# Rotación: el refresh token usado deja de valer
+	revoke_token(payload)
 	new_access_token = create_access_token({"sub": email}, scope="user")
 	new_refresh_token = create_refresh_token({"sub": email})
 
@@ -156,6 +159,28 @@ def refresh_token_endpoint(
 		"token_type": "bearer",
 	}
 
+@router.post("/logout")
+@limiter.limit("1/second")
+def logout(
+	request: Request, token: str = Depends(oauth2_scheme), refresh_token: Optional[str] = Header(None)
+):
+	"""
+	Revoca el access token de la petición y, si llega en la cabecera refresh-token y es del
+	mismo usuario, también el refresh token. Con varios workers, los demás lo rechazan como
+	mucho JWT_REVOCATION_SYNC_SECONDS después.
+	"""
+	payload = decode_token(token, expected_type="access")
+	if not payload:
+		raise HTTPException(status_code=401, detail="Invalid token")
+	revoke_token(payload)
+
+	if refresh_token:
+		refresh_payload = decode_token(refresh_token, expected_type="refresh")
+		if refresh_payload and refresh_payload.get("sub") == payload.get("sub"):
+			revoke_token(refresh_payload)
+
+	return {"detail": "Sesión cerrada"}
+
 @router.get("/me")
 @limiter.limit("1/second")
 def get_me(
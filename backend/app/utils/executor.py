@@ -0,0 +1,15 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from app.config import get_setting
+
+# Pool propio para el cifrado/descifrado de los endpoints async: el trabajo de CPU
+# no bloquea el event loop ni compite con el threadpool de Starlette (40 hilos)
+CRYPTO_WORKERS = int(get_setting("CRYPTO_WORKERS", os.cpu_count() or 4))
+_crypto_executor = ThreadPoolExecutor(max_workers=CRYPTO_WORKERS, thread_name_prefix="crypto")
+
+async def run_crypto(func, *args, **kwargs):
+	loop = asyncio.get_running_loop()
+	return await loop.run_in_executor(_crypto_executor, partial(func, *args, **kwargs))
@@ -0,0 +1,13 @@
+# backfill_conversations.py
+from app.db.db import SessionLocal
+from app.model.models import backfill_conversation_ids, backfill_conversation_summaries
+
+print("⏳ Asignando conversation_id a los mensajes P2P existentes...")
+with SessionLocal() as db:
+	updated = backfill_conversation_ids(db)
+print(f"✅ {updated} mensajes actualizados.")
+
+print("⏳ Creando los resúmenes de las conversaciones existentes...")
+with SessionLocal() as db:
+	created = backfill_conversation_summaries(db)
+print(f"✅ {created} resúmenes creados.")
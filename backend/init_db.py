@@ -1,7 +1,8 @@
 # init_db.py
-from app.db.db import Base, engine
+from app.db.db import Base, get_engine, create_database_if_not_exists
 from app.model.models import User, PeerMessage, Group, GroupUser, GroupMessage
 
 print("⏳ Creando tablas en la base de datos...")
-Base.metadata.create_all(bind=engine)
+create_database_if_not_exists()
+Base.metadata.create_all(bind=get_engine())
 print("✅ Tablas creadas correctamente.")
\ No newline at end of file
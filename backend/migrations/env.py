@@ -0,0 +1,44 @@
+from logging.config import fileConfig
+
+from alembic import context
+import sqlalchemy
+
+from app.config import get_setting
+
+config = context.config
+if config.config_file_name is not None:
+	fileConfig(config.config_file_name)
+
+def get_url() -> str:
+	return config.get_main_option("sqlalchemy.url") or get_setting("DATABASE_URL")
+
+def get_target_metadata():
+	# Solo --autogenerate compara contra los modelos
+	from app.db.db import Base
+	import app.model.models  # noqa: F401  registra las tablas en Base.metadata
+
+	return Base.metadata
+
+target_metadata = get_target_metadata() if getattr(config.cmd_opts, "autogenerate", False) else None
+
+def run_migrations_offline():
+	context.configure(
+		url=get_url(),
+		target_metadata=target_metadata,
+		literal_binds=True,
+		dialect_opts={"paramstyle": "named"},
+	)
+	with context.begin_transaction():
+		context.run_migrations()
+
+def run_migrations_online():
+	engine = sqlalchemy.create_engine(get_url(), poolclass=sqlalchemy.pool.NullPool)
+	with engine.connect() as connection:
+		context.configure(connection=connection, target_metadata=target_metadata)
+		with context.begin_transaction():
+			context.run_migrations()
+
+if context.is_offline_mode():
+	run_migrations_offline()
+else:
+	run_migrations_online()
@@ -0,0 +1,103 @@
+"""Esquema inicial, tal como lo creaba Base.metadata.create_all
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001_baseline"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+	op.create_table(
+		"users",
+		sa.Column("id", sa.Integer(), primary_key=True),
+		sa.Column("email", sa.String(), nullable=False),
+		sa.Column("hashed_password", sa.String(), nullable=False),
+		sa.Column("totp_secret", sa.String(), nullable=True),
+		sa.Column("public_key", sa.String(), nullable=False),
+		sa.Column("private_key", sa.String(), nullable=False),
+		sa.Column("public_ecc_key", sa.String(), nullable=False),
+		sa.Column("private_ecc_key", sa.String(), nullable=False),
+		sa.Column("is_active", sa.Boolean(), nullable=True),
+		sa.Column("is_google_account", sa.Boolean(), nullable=True),
+		sa.Column("email_verified", sa.Boolean(), nullable=True),
+		sa.Column("totp_verified", sa.Boolean(), nullable=True),
+	)
+	op.create_index("ix_users_id", "users", ["id"])
+	op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+	op.create_table(
+		"p2p_messages",
+		sa.Column("id", sa.Integer(), primary_key=True),
+		sa.Column("sender_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+		sa.Column("receiver_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+		sa.Column("hash", sa.Text(), nullable=False),
+		sa.Column("signature", sa.Text(), nullable=True),
+		sa.Column("message", sa.Text(), nullable=False),
+		sa.Column("timestamp", sa.DateTime(), nullable=True),
+	)
+	op.create_index("ix_p2p_messages_id", "p2p_messages", ["id"])
+
+	op.create_table(
+		"groups",
+		sa.Column("id", sa.String(), primary_key=True),
+		sa.Column("owner_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+		sa.Column("shared_aes_key", sa.String(), nullable=False),
+	)
+	op.create_index("ix_groups_id", "groups", ["id"])
+
+	op.create_table(
+		"group_users",
+		sa.Column("id", sa.Integer(), primary_key=True),
+		sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+		sa.Column("group_name", sa.String(), sa.ForeignKey("groups.id"), nullable=False),
+	)
+	op.create_index("ix_group_users_id", "group_users", ["id"])
+
+	op.create_table(
+		"group_messages",
+		sa.Column("id", sa.Integer(), primary_key=True),
+		sa.Column("sender_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+		sa.Column("group_name", sa.String(), sa.ForeignKey("groups.id"), nullable=False),
+		sa.Column("hash", sa.Text(), nullable=False),
+		sa.Column("signature", sa.Text(), nullable=True),
+		sa.Column("message", sa.Text(), nullable=False),
+		sa.Column("timestamp", sa.DateTime(), nullable=True),
+	)
+	op.create_index("ix_group_messages_id", "group_messages", ["id"])
+
+	op.create_table(
+		"blocks",
+		sa.Column("id", sa.Integer(), primary_key=True),
+		sa.Column("hash", sa.String(), nullable=True, unique=True),
+		sa.Column("previous_hash", sa.String(), nullable=True),
+		sa.Column("timestamp", sa.DateTime(), nullable=True),
+		sa.Column("block_string", sa.String(), nullable=True),
+	)
+
+	op.create_table(
+		"blockchain_messages",
+		sa.Column("id", sa.Integer(), primary_key=True),
+		sa.Column("is_p2p", sa.Boolean(), nullable=True),
+		sa.Column("message_id", sa.Integer(), nullable=True),
+		sa.Column("message_str", sa.String(), nullable=True),
+		sa.Column("message_hash", sa.String(), nullable=True),
+		sa.Column("block_id", sa.Integer(), sa.ForeignKey("blocks.id"), nullable=True),
+	)
+
+
+def downgrade():
+	op.drop_table("blockchain_messages")
+	op.drop_table("blocks")
+	op.drop_table("group_messages")
+	op.drop_table("group_users")
+	op.drop_table("groups")
+	op.drop_table("p2p_messages")
+	op.drop_table("users")
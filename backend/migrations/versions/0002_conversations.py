@@ -0,0 +1,126 @@
+"""Marcas de agua, conversaciones P2P y resúmenes por usuario
+
+Tolera objetos ya creados por Base.metadata.create_all al arrancar la app.
+Crea las conversaciones de los mensajes P2P existentes y les asigna conversation_id.
+
+Revision ID: 0002_conversations
+Revises: 0001_baseline
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002_conversations"
+down_revision = "0001_baseline"
+branch_labels = None
+depends_on = None
+
+
+# Mensajes por UPDATE al rellenar conversation_id; cada lote se confirma por separado
+BACKFILL_BATCH_SIZE = 10000
+
+p2p_messages = sa.table(
+	"p2p_messages",
+	sa.column("id", sa.Integer), sa.column("sender_id", sa.Integer), sa.column("receiver_id", sa.Integer),
+	sa.column("conversation_id", sa.Integer), sa.column("timestamp", sa.DateTime),
+)
+conversations = sa.table(
+	"conversations",
+	sa.column("id", sa.Integer), sa.column("user_low_id", sa.Integer), sa.column("user_high_id", sa.Integer),
+	sa.column("created_at", sa.DateTime),
+)
+
+
+def _inspector():
+	return sa.inspect(op.get_bind())
+
+
+def _backfill_conversations():
+	bind = op.get_bind()
+	low = sa.case((p2p_messages.c.sender_id < p2p_messages.c.receiver_id, p2p_messages.c.sender_id), else_=p2p_messages.c.receiver_id)
+	high = sa.case((p2p_messages.c.sender_id < p2p_messages.c.receiver_id, p2p_messages.c.receiver_id), else_=p2p_messages.c.sender_id)
+	unassigned = p2p_messages.c.conversation_id.is_(None)
+
+	# Una conversación por par que aún no la tenga, fechada con su primer mensaje
+	existing = sa.exists().where(conversations.c.user_low_id == low, conversations.c.user_high_id == high)
+	pairs = sa.select(low, high, sa.func.min(p2p_messages.c.timestamp)).where(unassigned, ~existing).group_by(low, high)
+	bind.execute(conversations.insert().from_select(["user_low_id", "user_high_id", "created_at"], pairs))
+
+	first, last = bind.execute(sa.select(sa.func.min(p2p_messages.c.id), sa.func.max(p2p_messages.c.id)).where(unassigned)).one()
+	if first is None:
+		return
+	conversation_id = (
+		sa.select(conversations.c.id)
+		.where(conversations.c.user_low_id == low, conversations.c.user_high_id == high)
+		.scalar_subquery()
+	)
+	# Rangos de id confirmados uno a uno: ninguna transacción bloquea toda la tabla
+	with op.get_context().autocommit_block():
+		for start in range(first, last + 1, BACKFILL_BATCH_SIZE):
+			bind.execute(
+				p2p_messages.update()
+				.where(p2p_messages.c.id >= start, p2p_messages.c.id < start + BACKFILL_BATCH_SIZE, unassigned)
+				.values(conversation_id=conversation_id)
+			)
+
+
+def upgrade():
+	tables = set(_inspector().get_table_names())
+
+	if "conversation_heads" not in tables:
+		op.create_table(
+			"conversation_heads",
+			sa.Column("key", sa.String(), primary_key=True),
+			sa.Column("last_message_id", sa.Integer(), nullable=False),
+			sa.Column("updated_at", sa.DateTime(), nullable=True),
+		)
+
+	if "conversations" not in tables:
+		op.create_table(
+			"conversations",
+			sa.Column("id", sa.Integer(), primary_key=True),
+			sa.Column("user_low_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+			sa.Column("user_high_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+			sa.Column("created_at", sa.DateTime(), nullable=True),
+			sa.UniqueConstraint("user_low_id", "user_high_id", name="uq_conversations_pair"),
+		)
+		op.create_index("ix_conversations_user_high_id", "conversations", ["user_high_id"])
+
+	columns = {column["name"] for column in _inspector().get_columns("p2p_messages")}
+	if "conversation_id" not in columns:
+		with op.batch_alter_table("p2p_messages") as batch:
+			batch.add_column(sa.Column("conversation_id", sa.Integer(), nullable=True))
+			batch.create_foreign_key("fk_p2p_messages_conversation_id", "conversations", ["conversation_id"], ["id"])
+	indexes = {index["name"] for index in _inspector().get_indexes("p2p_messages")}
+	if "ix_p2p_messages_conversation_ts" not in indexes:
+		op.create_index("ix_p2p_messages_conversation_ts", "p2p_messages", ["conversation_id", "timestamp", "id"])
+
+	if "conversation_summaries" not in tables:
+		op.create_table(
+			"conversation_summaries",
+			sa.Column("id", sa.Integer(), primary_key=True),
+			sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+			sa.Column("conversation_key", sa.String(), nullable=False),
+			sa.Column("peer_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+			sa.Column("group_name", sa.String(), sa.ForeignKey("groups.id"), nullable=True),
+			sa.Column("last_message_id", sa.Integer(), nullable=False),
+			sa.Column("last_sender_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+			sa.Column("last_timestamp", sa.DateTime(), nullable=False),
+			sa.Column("last_read_message_id", sa.Integer(), nullable=True),
+			sa.Column("unread_count", sa.Integer(), nullable=False),
+			sa.UniqueConstraint("user_id", "conversation_key", name="uq_conversation_summaries_user_key"),
+		)
+		op.create_index("ix_conversation_summaries_user_activity", "conversation_summaries", ["user_id", "last_timestamp"])
+
+	_backfill_conversations()
+
+
+def downgrade():
+	op.drop_table("conversation_summaries")
+	op.drop_index("ix_p2p_messages_conversation_ts", table_name="p2p_messages")
+	with op.batch_alter_table("p2p_messages") as batch:
+		batch.drop_constraint("fk_p2p_messages_conversation_id", type_="foreignkey")
+		batch.drop_column("conversation_id")
+	op.drop_table("conversations")
+	op.drop_table("conversation_heads")
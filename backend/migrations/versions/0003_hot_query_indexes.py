@@ -0,0 +1,47 @@
+"""Índices compuestos para las consultas calientes
+
+En Postgres se crean con CREATE INDEX CONCURRENTLY fuera de la transacción
+de la migración, sin bloquear escrituras sobre tablas grandes.
+benchmarks/query_plans.py compara los planes antes y después.
+
+Revision ID: 0003_hot_query_indexes
+Revises: 0002_conversations
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003_hot_query_indexes"
+down_revision = "0002_conversations"
+branch_labels = None
+depends_on = None
+
+UNASSIGNED = sa.text("block_id IS NULL")
+
+INDEXES = [
+	# (nombre, tabla, columnas, opciones)
+	("ix_group_messages_group_ts", "group_messages", ["group_name", "timestamp"], {}),
+	("ix_p2p_messages_pair_ts", "p2p_messages", ["sender_id", "receiver_id", "timestamp"], {}),
+	("uq_group_users_group_user", "group_users", ["group_name", "user_id"], {"unique": True}),
+	# Mensajes pendientes de bloque: el índice solo contiene las pocas filas sin asignar
+	("ix_blockchain_messages_unassigned", "blockchain_messages", ["id"], {"postgresql_where": UNASSIGNED, "sqlite_where": UNASSIGNED}),
+	("ix_blockchain_messages_block_id", "blockchain_messages", ["block_id"], {}),
+]
+
+
+def upgrade():
+	# El índice único fallaría con membresías duplicadas creadas por carreras en add_user_to_group
+	op.execute(
+		"DELETE FROM group_users WHERE id NOT IN "
+		"(SELECT MIN(id) FROM group_users GROUP BY group_name, user_id)"
+	)
+	with op.get_context().autocommit_block():
+		for name, table, columns, options in INDEXES:
+			op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True, **options)
+
+
+def downgrade():
+	with op.get_context().autocommit_block():
+		for name, table, _, _ in reversed(INDEXES):
+			op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,31 @@
+"""Versiones de los directorios de usuarios y grupos
+
+Cada alta o baja de usuario, grupo o miembro sube la versión de su directorio
+en la misma transacción; los ETag de /users, /users/all, /groups/all y
+/group-messages/{grupo}/users se derivan de ella. Sin fila, la versión es 0.
+
+Revision ID: 0004_directory_versions
+Revises: 0003_hot_query_indexes
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004_directory_versions"
+down_revision = "0003_hot_query_indexes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+	if "directory_versions" not in sa.inspect(op.get_bind()).get_table_names():
+		op.create_table(
+			"directory_versions",
+			sa.Column("name", sa.String(), primary_key=True),
+			sa.Column("version", sa.Integer(), nullable=False),
+		)
+
+
+def downgrade():
+	op.drop_table("directory_versions")
@@ -0,0 +1,56 @@
+"""Índices de búsqueda de usuarios y grupos (solo Postgres)
+
+lower(col) text_pattern_ops sirve las búsquedas por prefijo (LIKE 'abc%') y un
+GIN con pg_trgm las de subcadena (LIKE '%abc%'). Si el usuario de la migración
+no puede crear la extensión pg_trgm se omiten los índices de trigramas: la
+búsqueda sigue funcionando, pero las subcadenas recorren la tabla.
+En SQLite la búsqueda usa un índice en memoria (app/model/search.py).
+
+Revision ID: 0005_search_indexes
+Revises: 0004_directory_versions
+Create Date: 2026-10-19
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0005_search_indexes"
+down_revision = "0004_directory_versions"
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+PATTERN_INDEXES = [
+	("ix_users_email_lower_pattern", "users", "email"),
+	("ix_groups_id_lower_pattern", "groups", "id"),
+]
+TRIGRAM_INDEXES = [
+	("ix_users_email_trgm", "users", "email"),
+	("ix_groups_id_trgm", "groups", "id"),
+]
+
+
+def upgrade():
+	if op.get_bind().dialect.name != "postgresql":
+		return
+	with op.get_context().autocommit_block():
+		for name, table, column in PATTERN_INDEXES:
+			op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} (lower({column}) text_pattern_ops)")
+		try:
+			op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+		except sa.exc.DBAPIError:
+			logger.warning("No se pudo crear pg_trgm; se omiten los índices de trigramas")
+			return
+		for name, table, column in TRIGRAM_INDEXES:
+			op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} USING gin (lower({column}) gin_trgm_ops)")
+
+
+def downgrade():
+	if op.get_bind().dialect.name != "postgresql":
+		return
+	with op.get_context().autocommit_block():
+		for name, _, _ in TRIGRAM_INDEXES + PATTERN_INDEXES:
+			op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
@@ -0,0 +1,33 @@
+"""Índice ciego de palabras de los mensajes
+
+Una fila por (conversación, HMAC de la palabra, mensaje). La clave primaria en
+ese orden sirve directamente la búsqueda por palabra dentro de una conversación.
+Solo se indexan los mensajes enviados con MESSAGE_SEARCH=true; el historial
+anterior no se rellena (habría que descifrarlo entero).
+
+Revision ID: 0006_message_search_tokens
+Revises: 0005_search_indexes
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0006_message_search_tokens"
+down_revision = "0005_search_indexes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+	if "message_search_tokens" not in sa.inspect(op.get_bind()).get_table_names():
+		op.create_table(
+			"message_search_tokens",
+			sa.Column("conversation_key", sa.String(), primary_key=True),
+			sa.Column("token", sa.String(), primary_key=True),
+			sa.Column("message_id", sa.Integer(), primary_key=True),
+		)
+
+
+def downgrade():
+	op.drop_table("message_search_tokens")
@@ -0,0 +1,41 @@
+"""Épocas de clave de grupo
+
+group_keys guarda las claves de las épocas 1, 2, ...; la época 0 sigue siendo
+groups.shared_aes_key, así que no hay que copiar ni volver a cifrar nada.
+group_messages.key_epoch indica con qué época se cifró cada mensaje; las filas
+existentes quedan en 0 por el valor por defecto.
+
+Revision ID: 0007_group_key_epochs
+Revises: 0006_message_search_tokens
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0007_group_key_epochs"
+down_revision = "0006_message_search_tokens"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+	inspector = sa.inspect(op.get_bind())
+	if "group_keys" not in inspector.get_table_names():
+		op.create_table(
+			"group_keys",
+			sa.Column("group_name", sa.String(), sa.ForeignKey("groups.id"), primary_key=True),
+			sa.Column("epoch", sa.Integer(), primary_key=True),
+			sa.Column("aes_key", sa.String(), nullable=False),
+			sa.Column("created_at", sa.DateTime()),
+		)
+	if "key_epoch" not in {column["name"] for column in inspector.get_columns("group_messages")}:
+		# Con valor por defecto constante Postgres no reescribe la tabla
+		with op.batch_alter_table("group_messages") as batch:
+			batch.add_column(sa.Column("key_epoch", sa.Integer(), nullable=False, server_default="0"))
+
+
+def downgrade():
+	with op.batch_alter_table("group_messages") as batch:
+		batch.drop_column("key_epoch")
+	op.drop_table("group_keys")
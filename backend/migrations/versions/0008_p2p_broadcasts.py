@@ -0,0 +1,42 @@
+"""Difusiones P2P
+
+p2p_broadcasts guarda una vez el texto cifrado y la firma de un mensaje enviado
+a varios destinatarios; cada p2p_messages de la difusión solo lleva la clave AES
+envuelta para su receptor y apunta a ella con broadcast_id.
+
+Revision ID: 0008_p2p_broadcasts
+Revises: 0007_group_key_epochs
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0008_p2p_broadcasts"
+down_revision = "0007_group_key_epochs"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+	inspector = sa.inspect(op.get_bind())
+	if "p2p_broadcasts" not in inspector.get_table_names():
+		op.create_table(
+			"p2p_broadcasts",
+			sa.Column("id", sa.Integer(), primary_key=True),
+			sa.Column("sender_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+			sa.Column("message", sa.Text(), nullable=False),
+			sa.Column("signature", sa.Text()),
+			sa.Column("timestamp", sa.DateTime()),
+		)
+	if "broadcast_id" not in {column["name"] for column in inspector.get_columns("p2p_messages")}:
+		with op.batch_alter_table("p2p_messages") as batch:
+			batch.add_column(sa.Column("broadcast_id", sa.Integer(), nullable=True))
+			batch.create_foreign_key("fk_p2p_messages_broadcast_id", "p2p_broadcasts", ["broadcast_id"], ["id"])
+
+
+def downgrade():
+	with op.batch_alter_table("p2p_messages") as batch:
+		batch.drop_constraint("fk_p2p_messages_broadcast_id", type_="foreignkey")
+		batch.drop_column("broadcast_id")
+	op.drop_table("p2p_broadcasts")
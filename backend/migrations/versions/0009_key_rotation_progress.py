@@ -0,0 +1,33 @@
+"""Progreso de la rotación de claves
+
+key_rotation_progress guarda el último id de usuario ya vuelto a cifrar por
+rotate_keys.py, para retomar el trabajo si se interrumpe.
+
+Revision ID: 0009_key_rotation_progress
+Revises: 0008_p2p_broadcasts
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0009_key_rotation_progress"
+down_revision = "0008_p2p_broadcasts"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+	if "key_rotation_progress" not in sa.inspect(op.get_bind()).get_table_names():
+		op.create_table(
+			"key_rotation_progress",
+			sa.Column("job", sa.String(), primary_key=True),
+			sa.Column("last_id", sa.Integer(), nullable=False),
+			sa.Column("rotated", sa.Integer(), nullable=False),
+			sa.Column("finished", sa.Boolean(), nullable=False),
+			sa.Column("updated_at", sa.DateTime()),
+		)
+
+
+def downgrade():
+	op.drop_table("key_rotation_progress")
@@ -0,0 +1,36 @@
+"""Lista de revocación de JWT
+
+revoked_tokens guarda los jti revocados hasta el exp de cada token
+(JWT_REVOCATION_STORE=sql). El id es el cursor con el que cada worker
+añade a su filtro de Bloom lo revocado en los demás.
+
+Revision ID: 0010_revoked_tokens
+Revises: 0009_key_rotation_progress
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0010_revoked_tokens"
+down_revision = "0009_key_rotation_progress"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+	inspector = sa.inspect(op.get_bind())
+	if "revoked_tokens" not in inspector.get_table_names():
+		op.create_table(
+			"revoked_tokens",
+			sa.Column("id", sa.Integer(), primary_key=True),
+			sa.Column("jti", sa.String(), nullable=False, unique=True),
+			sa.Column("expires_at", sa.DateTime(), nullable=False),
+			sqlite_autoincrement=True,
+		)
+		op.create_index("ix_revoked_tokens_expires_at", "revoked_tokens", ["expires_at"])
+
+
+def downgrade():
+	op.drop_index("ix_revoked_tokens_expires_at", table_name="revoked_tokens")
+	op.drop_table("revoked_tokens")
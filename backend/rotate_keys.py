@@ -0,0 +1,9 @@
+# rotate_keys.py
+# Vuelve a cifrar las claves privadas con la versión más alta de APP_SECRET_KEYS.
+# Se puede interrumpir y volver a lanzar: continúa desde el último lote escrito.
+from app.crypto.keyring import get_keyring
+from app.model.key_rotation import rotate_user_keys
+
+print(f"⏳ Cifrando claves privadas con la versión {get_keyring().primary} del keyring...")
+stats = rotate_user_keys()
+print(f"✅ {stats.rotated} usuarios actualizados ({stats.scanned} revisados, {stats.skipped} cambiados durante la rotación) en {stats.seconds:.1f} s.")
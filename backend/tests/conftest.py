@@ -17,9 +17,214 @@ if str(BACKEND_ROOT) not in sys.path:
     sys.path.insert(0, str(BACKEND_ROOT))
 
 @pytest.fixture(autouse=True)
-def patch_jti_store(monkeypatch):
-    """Patch JWT JTI store hooks so token creation doesn't raise NotImplementedError."""
-    from app.auth import jwt as jwtmod
-    monkeypatch.setattr(jwtmod, "register_jti_in_store", lambda jti, expires_at, token_type: None, raising=False)
-    monkeypatch.setattr(jwtmod, "is_jti_revoked", lambda jti: False, raising=False)
+def reset_revocation_store():
+    """Every test starts with an empty in-memory JWT revocation store."""
+    from app.auth.revocation import close_revocation_store
+    close_revocation_store()
     yield
+    close_revocation_store()
+
+
+@pytest.fixture(autouse=True)
+def clear_identity_cache():
+    """Each test builds its own database, so user ids and group names are reused across tests."""
+    from app.crypto.group_keys import group_key_cache
+    from app.model.identity import identity_cache
+    identity_cache.clear()
+    group_key_cache.clear()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def clear_membership_index():
+    """Every in-memory SQLite database has the same URL, so the per-database index is reset."""
+    from app.model.models import clear_membership_indexes
+    clear_membership_indexes()
+    yield
+
+
+@pytest.fixture
+def db_session():
+    """Session on an in-memory SQLite database with the full schema, independent of the app engine."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from app.db.db import Base
+    import app.model.models  # noqa: F401  registers the tables
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine, autoflush=False)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def make_chat_user(email):
+    """User row with real RSA/ECC keys, as created by /auth/signup."""
+    from app.crypto.crypto import bytes_to_str, encrypt_bytes, generate_ecc_keys, generate_rsa_keys
+    from app.model.models import User
+
+    private_key, public_key = generate_rsa_keys()
+    private_ecc_key, public_ecc_key = generate_ecc_keys()
+    return User(
+        email=email,
+        hashed_password="x",
+        public_key=bytes_to_str(public_key),
+        private_key=bytes_to_str(encrypt_bytes(private_key)),
+        public_ecc_key=bytes_to_str(public_ecc_key),
+        private_ecc_key=bytes_to_str(encrypt_bytes(private_ecc_key)),
+    )
+
+
+@pytest.fixture
+def chat_db(db_session):
+    """db_session with alice@example.com and bob@example.com already signed up."""
+    db_session.add_all([make_chat_user("alice@example.com"), make_chat_user("bob@example.com")])
+    db_session.commit()
+    return db_session
+
+
+class ChatSteps:
+    """Signups, groups and sends on one session, as the chat routes do them."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def users(self, *emails):
+        """alice and bob by default, in the order asked for."""
+        from app.model.models import get_users_by_emails
+        emails = emails or ("alice@example.com", "bob@example.com")
+        found = get_users_by_emails(self.db, list(emails))
+        return [found[email] for email in emails]
+
+    def signup(self, email):
+        self.db.add(make_chat_user(email))
+        self.db.commit()
+        return self.users(email)[0]
+
+    def group(self, owner, *members, name="g"):
+        from app.model.models import add_user_to_group, create_group
+        group = create_group(self.db, name, owner.id)
+        for member in members:
+            add_user_to_group(self.db, member.id, name)
+        return group
+
+    def send(self, sender, receiver, text, **kwargs):
+        from app.model.models import MessagePayload, send_p2p_message
+        return send_p2p_message(self.db, sender, receiver, MessagePayload(message=text, signed=False), **kwargs)
+
+    def send_group(self, sender, text, group="g", **kwargs):
+        from app.model.models import MessagePayload, send_group_message
+        return send_group_message(self.db, sender, group, MessagePayload(message=text, signed=False), **kwargs)
+
+
+@pytest.fixture
+def chat(chat_db):
+    """ChatSteps on chat_db."""
+    return ChatSteps(chat_db)
+
+
+class RoundTrips:
+    """Statements and commits sent through an engine while it is attached."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.statements = []
+        self.commits = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+        event.listen(engine, "commit", self._on_commit)
+        self.engine = engine
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def _on_commit(self, conn):
+        self.commits += 1
+
+    def reset(self):
+        self.statements.clear()
+        self.commits = 0
+
+    def close(self):
+        from sqlalchemy import event
+        if event.contains(self.engine, "commit", self._on_commit):
+            event.remove(self.engine, "before_cursor_execute", self._on_execute)
+            event.remove(self.engine, "commit", self._on_commit)
+
+
+@pytest.fixture
+def round_trips():
+    """round_trips(db) starts counting on the session's engine; counting stops at close() or teardown."""
+    started = []
+
+    def start(db):
+        trips = RoundTrips(db.get_bind())
+        started.append(trips)
+        return trips
+
+    yield start
+    for trips in started:
+        trips.close()
+
+
+@pytest.fixture
+def chat_api(tmp_path, monkeypatch):
+    """
+    Chat and chain routers on a file-backed SQLite database that the sync routes reach
+    through a regular engine and the async ones through aiosqlite, as in production.
+    alice@example.com and bob@example.com are signed up; api.user is the caller,
+    api.chat the ChatSteps on api.db and api.async_sessions counts the sessions
+    opened on the async engine.
+    """
+    import asyncio
+    from types import SimpleNamespace
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from sqlalchemy import create_engine
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+    from sqlalchemy.orm import sessionmaker
+    from app.auth.dependencies import get_current_user, get_current_user_async
+    from app.db.db import Base, get_async_read_db, get_db, get_read_db
+    from app.endpoints import chain, chat
+    from app.utils.limiter import limiter
+
+    path = tmp_path / "chat.db"
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine, autoflush=False)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async_factory = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+    def session():
+        with factory() as db:
+            yield db
+
+    async def async_session():
+        api.async_sessions += 1
+        async with async_factory() as db:
+            yield db
+
+    api = SimpleNamespace(user="alice@example.com", db=factory(), async_sessions=0)
+    api.db.add_all([make_chat_user("alice@example.com"), make_chat_user("bob@example.com")])
+    api.db.commit()
+    api.chat = ChatSteps(api.db)
+
+    monkeypatch.setattr(limiter, "enabled", False)
+    app = FastAPI()
+    app.state.limiter = limiter
+    app.include_router(chat.router)
+    app.include_router(chain.router)
+    app.dependency_overrides[get_db] = session
+    app.dependency_overrides[get_read_db] = session
+    app.dependency_overrides[get_async_read_db] = async_session
+    app.dependency_overrides[get_current_user] = lambda: api.user
+    app.dependency_overrides[get_current_user_async] = lambda: api.user
+    with TestClient(app) as client:
+        api.client = client
+        yield api
+    api.db.close()
+    engine.dispose()
+    asyncio.run(async_engine.dispose())
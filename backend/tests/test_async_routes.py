@@ -0,0 +1,44 @@
+import pytest
+
+import app.model.models as mdls
+from app.endpoints import chain
+
+
+@pytest.fixture
+def history(chat_api, monkeypatch):
+    """A P2P chat and a group chat sent through the sync write routes, with search enabled."""
+    monkeypatch.setenv("MESSAGE_SEARCH", "true")
+    client = chat_api.client
+    assert client.post("/group-messages/create", json={"name": "g"}).status_code == 200
+    assert client.post("/group-messages/g/add", json={"name": "bob@example.com"}).status_code == 200
+    for text in ("hola bob", "la clave es 1234"):
+        assert client.post("/messages/bob@example.com", json={"message": text, "signed": True}).status_code == 200
+    for text in ("hola grupo", "clave del grupo"):
+        assert client.post("/group-messages/g", json={"message": text, "signed": True}).status_code == 200
+    chat_api.async_sessions = 0
+    return chat_api
+
+
+def _texts(response):
+    assert response.status_code == 200, response.text
+    return sorted(message["message"] for message in response.json())
+
+
+ROUTES = {
+    "p2p history": lambda client: _texts(client.get("/messages/alice@example.com/bob@example.com")) == ["hola bob", "la clave es 1234"],
+    "p2p head": lambda client: client.get("/messages/alice@example.com/bob@example.com/head", params={"since_id": 1}).json() == {"last_id": 2, "changed": True},
+    "p2p search": lambda client: _texts(client.get("/messages/alice@example.com/bob@example.com/search", params={"q": "clave"})) == ["la clave es 1234"],
+    "group history": lambda client: _texts(client.get("/group-messages/g")) == ["clave del grupo", "hola grupo"],
+    "group head": lambda client: client.get("/group-messages/g/head", params={"since_id": 2}).json() == {"last_id": 2, "changed": False},
+    "group search": lambda client: _texts(client.get("/group-messages/g/search", params={"q": "clave"})) == ["clave del grupo"],
+    "conversations": lambda client: {c["conversation"] for c in client.get("/conversations").json()} == {"peer:bob@example.com", "group:g"},
+    "sync": lambda client: {c["conversation"] for c in client.post("/sync", json={"cursors": {"peer:bob@example.com": 1}}).json()["conversations"]} == {"peer:bob@example.com"},
+    "transactions": lambda client: [len(block["messages"]) for block in client.get("/transactions").json()] == [chain.BLOCK_SIZE],
+    "verify transactions": lambda client: client.get("/verify-transactions").json()[0] is True,
+}
+
+
+@pytest.mark.parametrize("route", ROUTES)
+def test_async_route_reads_through_the_async_engine(history, route):
+    assert ROUTES[route](history.client)
+    assert history.async_sessions == 1
@@ -0,0 +1,72 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import app.crypto.crypto as crypto
+import app.model.models as mdls
+from app.auth.dependencies import get_current_user
+from app.db.db import get_db
+from app.endpoints import chat
+from app.utils.limiter import limiter
+from conftest import make_chat_user
+
+
+@pytest.fixture
+def broadcast_db(chat_db):
+    chat_db.add(make_chat_user("carol@example.com"))
+    chat_db.commit()
+    return chat_db
+
+
+def test_broadcast_encrypts_and_signs_once(broadcast_db, monkeypatch):
+    users = mdls.get_users_by_emails(broadcast_db, ["alice@example.com", "bob@example.com", "carol@example.com"])
+    alice, bob, carol = users["alice@example.com"], users["bob@example.com"], users["carol@example.com"]
+    calls = {"aes": 0, "sign": 0}
+    cifrar_aes, sign = crypto._cifrar_aes, mdls.sign_data_ecdsa_batch
+    monkeypatch.setattr(crypto, "_cifrar_aes", lambda *args: calls.__setitem__("aes", calls["aes"] + 1) or cifrar_aes(*args))
+    monkeypatch.setattr(mdls, "sign_data_ecdsa_batch", lambda *args: calls.__setitem__("sign", calls["sign"] + 1) or sign(*args))
+
+    messages = mdls.send_p2p_broadcast(broadcast_db, alice, [bob, carol], mdls.MessagePayload(message="hola a los dos", signed=True))
+
+    assert calls == {"aes": 1, "sign": 1}
+    assert broadcast_db.query(mdls.PeerBroadcast).count() == 1
+    # Each recipient row only stores its wrapped AES key
+    assert all(set(json.loads(msg.message)) == {"clave_aes"} for msg in messages)
+    for receiver in (bob, carol):
+        [message] = mdls.get_p2p_messages_by_user(broadcast_db, alice.id, receiver.id, reader_id=receiver.id)
+        assert (message["message"], message["signature"], message["receiver"]) == ("hola a los dos", "Signed", receiver.email)
+    assert [summary["conversation"] for summary in mdls.get_conversation_summaries(broadcast_db, carol.id)] == ["peer:alice@example.com"]
+
+
+def test_raw_broadcast_exposes_the_signed_part(broadcast_db):
+    users = mdls.get_users_by_emails(broadcast_db, ["alice@example.com", "bob@example.com"])
+    alice, bob = users["alice@example.com"], users["bob@example.com"]
+    mdls.send_p2p_broadcast(broadcast_db, alice, [bob], mdls.MessagePayload(message="hola", signed=True))
+
+    [raw] = mdls.get_p2p_messages_raw(broadcast_db, alice.id, bob.id)
+    mdls.RawMessageResponse(**raw)
+    assert set(json.loads(raw["envelope"])) == {"mensaje", "clave_aes", "iv"}
+    assert raw["signed_envelope"] == broadcast_db.query(mdls.PeerBroadcast.message).scalar()
+    assert mdls.verify_signature_ecdsa(raw["signed_envelope"], raw["signature"], mdls.str_to_bytes(alice.public_ecc_key))
+
+
+def test_broadcast_endpoint(broadcast_db, monkeypatch):
+    monkeypatch.setattr(limiter, "enabled", False)
+    app = FastAPI()
+    app.state.limiter = limiter
+    app.include_router(chat.router)
+    app.dependency_overrides[get_db] = lambda: broadcast_db
+    app.dependency_overrides[get_current_user] = lambda: "alice@example.com"
+    client = TestClient(app)
+
+    body = {"message": "aviso", "signed": False, "recipients": ["bob@example.com", "carol@example.com", "bob@example.com"]}
+    response = client.post("/messages/broadcast", json=body)
+    assert response.status_code == 200
+    assert len(response.json()["ids"]) == 2
+    # One chain entry per delivered message
+    assert broadcast_db.query(mdls.BlockMessage).count() == 2
+
+    body["recipients"] = ["bob@example.com", "nobody@example.com"]
+    assert client.post("/messages/broadcast", json=body).status_code == 404
@@ -0,0 +1,72 @@
+import pytest
+from pydantic import ValidationError
+
+import app.model.models as mdls
+from app.endpoints.chain import BlockchainManager
+
+
+def _payloads(count, signed_every=0):
+    return [
+        mdls.MessagePayload(message=f"msg {i}", signed=bool(signed_every) and i % signed_every == 0)
+        for i in range(count)
+    ]
+
+
+def test_group_bulk_send_is_one_transaction_with_multi_row_inserts(chat_db, round_trips):
+    users = mdls.get_users_by_emails(chat_db, ["alice@example.com", "bob@example.com"])
+    group = mdls.create_group(chat_db, "team", users["alice@example.com"].id)
+    mdls.add_user_to_group(chat_db, users["bob@example.com"].id, "team")
+
+    trips = round_trips(chat_db)
+    messages = mdls.send_group_messages_bulk(
+        chat_db, users["alice@example.com"], group, _payloads(50, signed_every=5),
+        before_commit=lambda session, msgs: BlockchainManager(session).add_messages(False, msgs),
+    )
+    inserts = [s for s in trips.statements if s.startswith("INSERT INTO group_messages")]
+    chain_inserts = [s for s in trips.statements if s.startswith("INSERT INTO blockchain_messages")]
+    # Postgres batches the ORM flush into multi-row INSERT ... RETURNING (insertmanyvalues);
+    # SQLite has no sentinel for autoincrement keys and falls back to one row per statement
+    batched = chat_db.get_bind().dialect.name == "postgresql"
+    assert len(inserts) == len(chain_inserts) == (1 if batched else 50)
+    assert trips.commits == 1
+    trips.close()
+
+    assert [msg.id for msg in messages] == list(range(1, 51))
+    history = mdls.get_group_messages(chat_db, "team")
+    assert [m["message"] for m in reversed(history)] == [f"msg {i}" for i in range(50)]
+    assert [m["signature"] for m in reversed(history)][:6] == ["Signed", None, None, None, None, "Signed"]
+
+    # 50 chain entries: 12 full blocks, 2 waiting for the next ones
+    assert chat_db.query(mdls.Block).count() == 12
+    assert chat_db.query(mdls.BlockMessage).filter(mdls.BlockMessage.block_id.is_(None)).count() == 2
+    assert BlockchainManager(chat_db).verify_blockchain()[0]
+
+    bob_summary = chat_db.query(mdls.ConversationSummary).filter_by(user_id=users["bob@example.com"].id).one()
+    assert bob_summary.unread_count == 50 and bob_summary.last_message_id == 50
+
+
+def test_p2p_bulk_send_continues_the_chain(chat_db):
+    users = mdls.get_users_by_emails(chat_db, ["alice@example.com", "bob@example.com"])
+    manager = BlockchainManager(chat_db)
+    single = mdls.send_p2p_message(
+        chat_db, users["alice@example.com"], users["bob@example.com"], mdls.MessagePayload(message="hi", signed=False),
+        before_commit=lambda session, m: BlockchainManager(session).add_message(True, m),
+    )
+    users = mdls.get_users_by_emails(chat_db, ["alice@example.com", "bob@example.com"])
+    messages = mdls.send_p2p_messages_bulk(
+        chat_db, users["bob@example.com"], users["alice@example.com"], _payloads(7, signed_every=2),
+        before_commit=lambda session, msgs: BlockchainManager(session).add_messages(True, msgs),
+    )
+
+    assert all(msg.conversation_id == single.conversation_id for msg in messages)
+    history = mdls.get_p2p_messages_by_user(chat_db, users["alice@example.com"].id, users["bob@example.com"].id)
+    assert [m["message"] for m in reversed(history)] == ["hi"] + [f"msg {i}" for i in range(7)]
+    assert chat_db.query(mdls.Block).count() == 2
+    assert manager.verify_blockchain()[0]
+
+
+def test_bulk_payload_limits():
+    with pytest.raises(ValidationError):
+        mdls.BulkMessagePayload(messages=[])
+    with pytest.raises(ValidationError):
+        mdls.BulkMessagePayload(messages=_payloads(mdls.BULK_MAX_MESSAGES + 1))
@@ -0,0 +1,40 @@
+from sqlalchemy import update
+
+import app.model.models as mdls
+
+
+def _legacy_history(db):
+    """Messages as they were before migration 0002: no conversation row, no id, no head."""
+    users = mdls.get_users_by_emails(db, ["alice@example.com", "bob@example.com"])
+    alice, bob = users["alice@example.com"], users["bob@example.com"]
+    sent = [
+        mdls.send_p2p_message(db, alice, bob, mdls.MessagePayload(message="uno", signed=False)),
+        mdls.send_p2p_message(db, bob, alice, mdls.MessagePayload(message="dos", signed=False)),
+    ]
+    db.execute(update(mdls.PeerMessage).values(conversation_id=None))
+    db.query(mdls.Conversation).delete()
+    db.query(mdls.ConversationHead).delete()
+    db.commit()
+    return alice.id, bob.id, [msg.id for msg in sent]
+
+
+def test_backfill_makes_legacy_messages_visible(chat_db):
+    alice_id, bob_id, ids = _legacy_history(chat_db)
+    # Reads go through the conversation: unassigned rows stay hidden until the backfill runs
+    assert mdls.get_p2p_messages_by_user(chat_db, alice_id, bob_id) == []
+
+    assert mdls.backfill_conversation_ids(chat_db, batch_size=1) == 2
+
+    messages = mdls.get_p2p_messages_by_user(chat_db, alice_id, bob_id, reader_id=bob_id)
+    assert sorted((m["id"], m["message"]) for m in messages) == [(ids[0], "uno"), (ids[1], "dos")]
+    assert mdls.get_p2p_last_message_id(chat_db, alice_id, bob_id) == ids[1]
+    [conversation] = mdls.sync_conversations(chat_db, bob_id, {})["conversations"]
+    assert (conversation["conversation"], conversation["last_id"]) == ("peer:alice@example.com", ids[1])
+
+
+def test_backfill_is_idempotent(chat_db):
+    alice_id, bob_id, _ = _legacy_history(chat_db)
+    mdls.backfill_conversation_ids(chat_db)
+    assert mdls.backfill_conversation_ids(chat_db) == 0
+    assert chat_db.query(mdls.Conversation).count() == 1
+    assert chat_db.query(mdls.PeerMessage).filter(mdls.PeerMessage.conversation_id.is_(None)).count() == 0
@@ -0,0 +1,74 @@
+import app.model.models as mdls
+
+
+def test_head_follows_the_newest_message_and_never_moves_back(chat_db, chat):
+    alice, bob = chat.users()
+    chat.send(alice, bob, "uno")
+    last = chat.send(bob, alice, "dos")
+    key = mdls.p2p_conversation_key(alice.id, bob.id)
+    assert mdls.get_p2p_last_message_id(chat_db, alice.id, bob.id) == last.id
+
+    # A batch that commits late with an older id leaves the head alone
+    mdls._bump_conversation_heads(chat_db, {key: last.id - 1})
+    chat_db.commit()
+    assert chat_db.get(mdls.ConversationHead, key).last_message_id == last.id
+
+
+def test_unchanged_conversation_is_answered_from_the_head(chat_db, chat, round_trips):
+    alice, bob = chat.users()
+    chat.group(alice, bob)
+    last = chat.send(alice, bob, "uno")
+    last_group = chat.send_group(alice, "hola")
+    alice_id, bob_id, last_id, last_group_id = alice.id, bob.id, last.id, last_group.id
+    trips = round_trips(chat_db)
+    assert mdls.get_p2p_messages_by_user(chat_db, alice_id, bob_id, since_id=last_id) == []
+    assert mdls.get_group_messages(chat_db, "g", since_id=last_group_id) == []
+    trips.close()
+
+    # One primary-key lookup of the head each, no scan of the message tables
+    assert len(trips.statements) == 2
+    assert all("conversation_heads" in statement for statement in trips.statements)
+
+
+def test_since_id_returns_only_newer_p2p_messages(chat_db, chat):
+    alice, bob = chat.users()
+    first = chat.send(alice, bob, "uno")
+    second = chat.send(bob, alice, "dos")
+    third = chat.send(alice, bob, "tres")
+
+    newer = mdls.get_p2p_messages_by_user(chat_db, alice.id, bob.id, since_id=first.id, reader_id=bob.id)
+    assert sorted(m["id"] for m in newer) == [second.id, third.id]
+    assert {m["message"] for m in newer} == {"dos", "tres"}
+    assert len(mdls.get_p2p_messages_by_user(chat_db, alice.id, bob.id, since_id=0, reader_id=bob.id)) == 3
+
+
+def test_since_id_returns_only_newer_group_messages(chat_db, chat):
+    alice, bob = chat.users()
+    chat.group(alice, bob)
+    first = chat.send_group(alice, "uno")
+    second = chat.send_group(bob, "dos")
+
+    newer = mdls.get_group_messages(chat_db, "g", since_id=first.id, reader_id=alice.id)
+    assert [(m["id"], m["message"]) for m in newer] == [(second.id, "dos")]
+
+
+def test_head_and_since_id_endpoints(chat_api):
+    chat = chat_api.chat
+    alice, bob = chat.users()
+    chat.group(alice, bob)
+    first = chat.send(alice, bob, "uno")
+    second = chat.send(bob, alice, "dos")
+    group_message = chat.send_group(alice, "hola")
+    client = chat_api.client
+
+    head = client.get("/messages/alice@example.com/bob@example.com/head", params={"since_id": second.id}).json()
+    assert head == {"last_id": second.id, "changed": False}
+    head = client.get("/messages/alice@example.com/bob@example.com/head", params={"since_id": first.id}).json()
+    assert head == {"last_id": second.id, "changed": True}
+    messages = client.get("/messages/alice@example.com/bob@example.com", params={"since_id": first.id}).json()
+    assert [(m["id"], m["message"]) for m in messages] == [(second.id, "dos")]
+
+    head = client.get("/group-messages/g/head", params={"since_id": group_message.id}).json()
+    assert head == {"last_id": group_message.id, "changed": False}
+    assert client.get("/group-messages/g", params={"since_id": group_message.id}).json() == []
+    assert [m["message"] for m in client.get("/group-messages/g", params={"since_id": 0}).json()] == ["hola"]
@@ -0,0 +1,88 @@
+import app.model.models as mdls
+
+
+def _summary(db, user_id, conversation):
+    return next(s for s in mdls.get_conversation_summaries(db, user_id) if s["conversation"] == conversation)
+
+
+def test_sends_upsert_one_summary_per_participant(chat_db, chat):
+    alice, bob = chat.users()
+    chat.send(alice, bob, "uno")
+    last = chat.send(alice, bob, "dos")
+    chat.group(alice, bob)
+    chat.send_group(alice, "hola")
+
+    assert chat_db.query(mdls.ConversationSummary).filter_by(user_id=bob.id).count() == 2
+    peer = _summary(chat_db, bob.id, "peer:alice@example.com")
+    assert (peer["unread_count"], peer["last_message_id"], peer["last_sender"]) == (2, last.id, "alice@example.com")
+    # The sender's own messages never count as unread
+    assert _summary(chat_db, alice.id, "peer:bob@example.com")["unread_count"] == 0
+    assert _summary(chat_db, bob.id, "group:g")["unread_count"] == 1
+    assert _summary(chat_db, alice.id, "group:g")["unread_count"] == 0
+
+
+def test_mark_read_recounts_after_last_read_id(chat_db, chat):
+    alice, bob = chat.users()
+    first, second, _ = (chat.send(alice, bob, text) for text in ("uno", "dos", "tres"))
+
+    assert mdls.mark_conversation_read(chat_db, bob.id, "peer:alice@example.com", second.id) == 1
+    # An older marker (e.g. from another device) does not move the marker back
+    assert mdls.mark_conversation_read(chat_db, bob.id, "peer:alice@example.com", first.id) == 1
+    summary = chat_db.query(mdls.ConversationSummary).filter_by(user_id=bob.id).one()
+    assert summary.last_read_message_id == second.id
+
+    assert mdls.mark_conversation_read(chat_db, bob.id, "peer:alice@example.com") == 0
+    assert mdls.mark_conversation_read(chat_db, bob.id, "peer:nobody@example.com") is None
+    assert mdls.mark_conversation_read(chat_db, bob.id, "group:missing") is None
+
+
+def test_mark_read_keeps_messages_sent_after_the_marker(chat_db, chat):
+    alice, bob = chat.users()
+    chat.group(alice, bob)
+    seen = chat.send_group(alice, "visto")
+    # Arrives while bob's client is still posting the marker for `seen`
+    chat.send_group(alice, "nuevo")
+
+    assert mdls.mark_conversation_read(chat_db, bob.id, "group:g", seen.id) == 1
+    assert _summary(chat_db, bob.id, "group:g")["unread_count"] == 1
+
+
+def test_backfill_rebuilds_summaries_from_existing_messages(chat_db, chat):
+    alice, bob = chat.users()
+    carol = chat.signup("carol@example.com")
+    chat.group(alice, bob, carol)
+    chat.send(alice, bob, "uno")
+    chat.send(bob, alice, "dos")
+    chat.send(alice, bob, "tres")
+    chat.send(carol, alice, "hola")
+    chat.send_group(alice, "grupo")
+    chat.send_group(bob, "grupo 2")
+    users = (alice.id, bob.id, carol.id)
+    expected = {user_id: mdls.get_conversation_summaries(chat_db, user_id) for user_id in users}
+
+    # Conversations from before conversation_summaries existed
+    chat_db.query(mdls.ConversationSummary).delete()
+    chat_db.commit()
+    assert mdls.backfill_conversation_summaries(chat_db) == 7
+    assert {user_id: mdls.get_conversation_summaries(chat_db, user_id) for user_id in users} == expected
+    assert _summary(chat_db, alice.id, "peer:bob@example.com")["unread_count"] == 1
+    assert _summary(chat_db, carol.id, "group:g")["unread_count"] == 2
+    # Existing summaries are left alone
+    assert mdls.backfill_conversation_summaries(chat_db) == 0
+
+
+def test_conversations_endpoints(chat_api):
+    alice, bob = chat_api.chat.users()
+    first = chat_api.chat.send(alice, bob, "uno")
+    chat_api.chat.send(alice, bob, "dos")
+    chat_api.user = "bob@example.com"
+
+    [summary] = chat_api.client.get("/conversations").json()
+    assert (summary["conversation"], summary["unread_count"], summary["last_sender"]) == ("peer:alice@example.com", 2, "alice@example.com")
+
+    response = chat_api.client.post("/conversations/read", json={"conversation": "peer:alice@example.com", "last_read_id": first.id})
+    assert response.json() == {"conversation": "peer:alice@example.com", "unread_count": 1}
+    assert chat_api.client.get("/conversations").json()[0]["unread_count"] == 1
+    response = chat_api.client.post("/conversations/read", json={"conversation": "peer:alice@example.com"})
+    assert response.json()["unread_count"] == 0
+    assert chat_api.client.post("/conversations/read", json={"conversation": "peer:carol@example.com"}).status_code == 404
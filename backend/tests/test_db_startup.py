@@ -0,0 +1,64 @@
+import asyncio
+import subprocess
+import sys
+from pathlib import Path
+
+import sqlalchemy
+
+from app.db import db as dbmod
+
+BACKEND_ROOT = Path(__file__).resolve().parents[1]
+UNREACHABLE_DATABASE_URL = "postgresql://u:p@127.0.0.1:1/nodb"
+
+
+def test_importing_models_does_not_connect():
+    code = (
+        "import app.db.db as d, app.model.models, app.endpoints.chat\n"
+        "assert d._engine is None and d._async_engine is None\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=BACKEND_ROOT,
+        env={"DATABASE_URL": UNREACHABLE_DATABASE_URL, "SECRET_KEY": "s", "APP_SECRET": "a", "PATH": ""},
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+
+
+def test_init_database_creates_engine_and_schema_on_demand(tmp_path, monkeypatch):
+    import app.model.models  # noqa: F401
+
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'app.db'}")
+    monkeypatch.setattr(dbmod, "_engine", None)
+    monkeypatch.setattr(dbmod, "_async_engine", None)
+
+    dbmod.init_database()
+    tables = set(sqlalchemy.inspect(dbmod.get_engine()).get_table_names())
+    assert {"users", "p2p_messages", "conversation_summaries"} <= tables
+
+    with dbmod.SessionLocal() as session:
+        assert session.get_bind() is dbmod.get_engine()
+
+    asyncio.run(dbmod.dispose_engines())
+    assert dbmod._engine is None
+
+
+def test_session_local_respects_explicit_bind(db_session, monkeypatch):
+    monkeypatch.setattr(dbmod, "_engine", None)
+    bind = db_session.get_bind()
+    with dbmod.SessionLocal(bind=bind) as session:
+        assert session.execute(sqlalchemy.text("SELECT count(*) FROM users")).scalar() == 0
+    # An explicit bind never materialises the app engine
+    assert dbmod._engine is None
+
+
+def test_import_time_benchmark_reports_app_modules():
+    sys.path.insert(0, str(BACKEND_ROOT / "benchmarks"))
+    try:
+        import import_time
+    finally:
+        sys.path.pop(0)
+    timings = import_time.measure("app.db.db")
+    assert "app.db.db" in timings and "app.config" in timings
+    assert import_time.parse_importtime("import time: self [us] | cumulative | imported package\n") == {}
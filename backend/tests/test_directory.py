@@ -0,0 +1,87 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import app.model.models as mdls
+from app.db.db import get_read_db
+from app.endpoints import chat
+from app.utils.limiter import limiter
+
+
+def _user(email):
+    """Directory listings only read the email; keys are placeholders."""
+    return mdls.User(email=email, hashed_password="x", public_key="pk", private_key="sk", public_ecc_key="pk", private_ecc_key="sk")
+
+
+@pytest.fixture
+def directory_db(db_session):
+    db_session.add_all([_user(f"user{n}@example.com") for n in range(5)])
+    db_session.commit()
+    return db_session
+
+
+def test_keyset_pages_cover_every_user_once(directory_db):
+    seen, after = [], None
+    while True:
+        emails, after = mdls.list_user_emails(directory_db, limit=2, after=after)
+        seen += emails
+        if after is None:
+            break
+    assert seen == sorted(f"user{n}@example.com" for n in range(5))
+
+
+def test_versions_follow_directory_changes(directory_db):
+    assert mdls.get_directory_versions(directory_db, [mdls.DIRECTORY_USERS, mdls.DIRECTORY_GROUPS]) == {"users": 5, "groups": 0}
+
+    user = directory_db.query(mdls.User).filter_by(email="user0@example.com").one()
+    user.totp_secret = "secret"
+    directory_db.commit()
+    assert mdls.get_directory_versions(directory_db, ["users"]) == {"users": 5}
+    user.email = "user0-renamed@example.com"
+    directory_db.commit()
+    assert mdls.get_directory_versions(directory_db, ["users"]) == {"users": 6}
+
+
+def test_non_participants_exclude_owner_and_members(directory_db):
+    ids = {user.email: user.id for user in directory_db.query(mdls.User)}
+    mdls.create_group(directory_db, "g", ids["user0@example.com"])
+    mdls.add_user_to_group(directory_db, ids["user1@example.com"], "g")
+
+    emails, after = mdls.get_group_non_participants(directory_db, "g", limit=2)
+    assert emails == ["user2@example.com", "user3@example.com"]
+    assert mdls.get_group_non_participants(directory_db, "g", limit=2, after=after) == (["user4@example.com"], None)
+    assert mdls.get_directory_versions(directory_db, [mdls.group_members_directory("g")]) == {"members:g": 1}
+
+
+@pytest.fixture
+def client(directory_db, monkeypatch):
+    monkeypatch.setattr(limiter, "enabled", False)
+    monkeypatch.setattr(chat, "_first_pages", type(chat._first_pages)())
+    app = FastAPI()
+    app.state.limiter = limiter
+    app.include_router(chat.router)
+    app.dependency_overrides[get_read_db] = lambda: directory_db
+    return TestClient(app)
+
+
+def test_users_all_pagination_etag_and_first_page_cache(client, directory_db):
+    first = client.get("/users/all", params={"limit": 3})
+    assert first.json() == [f"user{n}@example.com" for n in range(3)]
+    etag = first.headers["ETag"]
+
+    assert client.get("/users/all", params={"limit": 3}, headers={"If-None-Match": etag}).status_code == 304
+    assert len(chat._first_pages) == 1
+
+    second = client.get("/users/all", params={"limit": 3, "after": first.headers["X-Next-Cursor"]})
+    assert second.json() == ["user3@example.com", "user4@example.com"]
+    assert "X-Next-Cursor" not in second.headers
+
+    directory_db.add(_user("user5@example.com"))
+    directory_db.commit()
+    changed = client.get("/users/all", params={"limit": 3}, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+
+def test_invalid_cursor_is_rejected(client):
+    assert client.get("/groups/all", params={"after": "%%%"}).status_code == 400
@@ -0,0 +1,61 @@
+import base64
+
+import pytest
+
+import app.model.models as mdls
+
+
+@pytest.fixture
+def members(chat):
+    """alice owns group g and bob is a member."""
+    alice, bob = chat.users()
+    chat.group(alice, bob)
+    return alice, bob
+
+
+def test_rotation_is_one_insert_and_history_stays_readable(chat_db, chat, members, round_trips):
+    alice, bob = members
+    chat.send_group(alice, "antes")
+
+    trips = round_trips(chat_db)
+    assert mdls.rotate_group_key(chat_db, "g") == 1
+    trips.close()
+    writes = [statement for statement in trips.statements if not statement.lstrip().upper().startswith("SELECT")]
+    assert len(writes) == 1 and writes[0].startswith("INSERT INTO group_keys")
+
+    after = chat.send_group(bob, "después")
+    assert after.key_epoch == 1
+    history = mdls.get_group_messages(chat_db, "g", reader_id=bob.id)
+    assert sorted(message["message"] for message in history) == ["antes", "después"]
+    assert [raw["key_epoch"] for raw in mdls.get_group_messages_raw(chat_db, "g")] == [1, 0]
+
+
+def test_bulk_send_uses_the_latest_epoch(chat_db, members):
+    alice, _ = members
+    mdls.rotate_group_key(chat_db, "g")
+    mdls.rotate_group_key(chat_db, "g")
+    group = chat_db.get(mdls.Group, "g")
+    messages = mdls.send_group_messages_bulk(chat_db, alice, group, [mdls.MessagePayload(message="x", signed=False)] * 3)
+    assert {message.key_epoch for message in messages} == {2}
+
+
+def test_key_endpoint_serves_each_epoch_to_members_only(chat_api):
+    alice, bob = chat_api.chat.users()
+    chat_api.chat.group(alice, bob)
+    db, http = chat_api.db, chat_api.client
+    chat_api.user = "bob@example.com"
+    epoch0 = db.get(mdls.Group, "g").shared_aes_key
+
+    assert http.get("/group-messages/g/key").json() == epoch0
+    assert http.post("/group-messages/g/rotate-key").status_code == 403
+
+    chat_api.user = "alice@example.com"
+    assert http.post("/group-messages/g/rotate-key").json() == {"epoch": 1}
+    current = http.get("/group-messages/g/key").json()
+    assert current != epoch0 and len(base64.b64decode(current)) == 32
+    assert http.get("/group-messages/g/key", params={"epoch": 0}).json() == epoch0
+    assert http.get("/group-messages/g/key", params={"epoch": 5}).status_code == 404
+
+    chat_api.chat.signup("carol@example.com")
+    chat_api.user = "carol@example.com"
+    assert http.get("/group-messages/g/key").status_code == 403
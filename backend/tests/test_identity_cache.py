@@ -0,0 +1,67 @@
+import app.model.models as mdls
+from app.model.identity import Identity, IdentityCache, identity_cache
+from conftest import make_chat_user
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bounded_lru_with_ttl():
+    clock = FakeClock()
+    cache = IdentityCache(max_entries=2, ttl=10, clock=clock)
+    for n in (1, 2):
+        cache.put(Identity(n, f"u{n}@example.com", "pk", "ecc"))
+    cache.get(1)
+    cache.put(Identity(3, "u3@example.com", "pk", "ecc"))
+
+    assert cache.get_id("u2@example.com") is None
+    assert cache.get_id("u1@example.com") == 1
+    clock.now = 11
+    assert cache.get(1) is None
+    assert cache.get_id("u3@example.com") is None
+
+
+def test_group_history_loads_senders_in_one_query(chat_db, round_trips):
+    users = mdls.get_users_by_emails(chat_db, ["alice@example.com", "bob@example.com"])
+    alice, bob = users["alice@example.com"], users["bob@example.com"]
+    mdls.create_group(chat_db, "g", alice.id)
+    mdls.add_user_to_group(chat_db, bob.id, "g")
+    payloads = [mdls.MessagePayload(message=f"m{n}", signed=False) for n in range(250)]
+    group = chat_db.get(mdls.Group, "g")
+    mdls.send_group_messages_bulk(chat_db, alice, group, payloads)
+    mdls.send_group_messages_bulk(chat_db, bob, group, payloads)
+    alice_id, bob_id = alice.id, bob.id
+    identity_cache.clear()
+
+    trips = round_trips(chat_db)
+    assert len(mdls.get_group_messages(chat_db, "g")) == 500
+    # messages, group key, senders (one IN query)
+    assert len(trips.statements) == 3, trips.statements
+    trips.reset()
+    mdls.get_group_messages(chat_db, "g")
+    # senders and the group key now come from the identity and key caches
+    assert len(trips.statements) == 1, trips.statements
+    trips.reset()
+    assert mdls.get_user_id_by_email(chat_db, "bob@example.com") == bob_id
+    assert mdls.get_email_by_user_id(chat_db, alice_id) == "alice@example.com"
+    assert trips.statements == []
+
+
+def test_user_writes_invalidate_the_cache(chat_db):
+    alice_id = mdls.get_user_id_by_email(chat_db, "alice@example.com")
+    assert identity_cache.get(alice_id) is not None
+
+    alice = chat_db.get(mdls.User, alice_id)
+    alice.email = "alice2@example.com"
+    chat_db.commit()
+    assert identity_cache.get(alice_id) is None
+    assert mdls.get_user_id_by_email(chat_db, "alice@example.com") is None
+
+    chat_db.add(make_chat_user("carol@example.com"))
+    chat_db.commit()
+    assert mdls.get_user_id_by_email(chat_db, "carol@example.com") is not None
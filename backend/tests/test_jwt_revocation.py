@@ -0,0 +1,214 @@
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+import app.model.models as mdls
+from app.auth.jwt import create_access_token, create_refresh_token, decode_token
+from app.auth.resp import RespServer
+from app.auth.revocation import BloomFilter, MemoryRevocationStore, RespRevocationStore, RevocationStore, SqlRevocationStore
+from app.db.db import get_db
+from app.routers import auth
+from app.utils.limiter import limiter
+from conftest import make_chat_user
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000)
+    revoked = [str(uuid.uuid4()) for _ in range(1000)]
+    for jti in revoked:
+        bloom.add(jti)
+    assert all(jti in bloom for jti in revoked)
+    false_positives = sum(str(uuid.uuid4()) in bloom for _ in range(10000))
+    assert false_positives < 50
+
+
+def test_is_revoked_never_touches_the_backend(db_session, monkeypatch):
+    clock = Clock()
+    store = SqlRevocationStore(sessionmaker(bind=db_session.get_bind()), clock=clock, sync_seconds=1)
+    store.sync()
+    store.revoke("revocado", clock.now + 60)
+
+    def backend_call(*args):
+        pytest.fail("backend access from is_revoked")
+
+    for name in ("_store", "_changes_since", "_rebuild", "session_factory"):
+        monkeypatch.setattr(store, name, backend_call)
+    clock.now += 3600
+    assert not store.is_revoked("revocado")
+    clock.now -= 3590
+    assert store.is_revoked("revocado")
+    assert not any(store.is_revoked(str(uuid.uuid4())) for _ in range(100))
+
+
+def test_entries_expire_with_the_token():
+    clock = Clock()
+    store = MemoryRevocationStore(clock=clock, rebuild_seconds=10)
+    store.revoke("corto", clock.now + 5)
+    store.revoke("largo", clock.now + 60)
+    store.revoke("caducado", clock.now - 1)
+    assert store.is_revoked("corto") and not store.is_revoked("caducado")
+
+    clock.now += 30
+    assert not store.is_revoked("corto") and store.is_revoked("largo")
+    store.sync()
+    assert "corto" not in store._revoked and "corto" not in store._bloom
+
+
+def _shared_workers(make_store):
+    clock = Clock()
+    return clock, make_store(clock), make_store(clock)
+
+
+def _assert_workers_share_revocations(clock, first, second):
+    first.sync()
+    second.sync()
+    first.revoke("a", clock.now + 60)
+    assert first.is_revoked("a")
+    assert not second.is_revoked("a")
+
+    # El otro worker lo ve en la siguiente sincronización
+    clock.now += 2
+    second.sync()
+    assert second.is_revoked("a")
+    assert not second.is_revoked("b")
+
+    clock.now += 120
+    assert not second.is_revoked("a")
+
+
+def test_sql_store_is_shared_between_workers(db_session):
+    factory = sessionmaker(bind=db_session.get_bind())
+    clock, first, second = _shared_workers(lambda clock: SqlRevocationStore(factory, clock=clock, sync_seconds=1, rebuild_seconds=100))
+    _assert_workers_share_revocations(clock, first, second)
+
+    # La reconstrucción borra las filas caducadas
+    first.revoke("c", clock.now + 500)
+    clock.now += 200
+    second.sync()
+    assert [row.jti for row in db_session.query(mdls.RevokedToken)] == ["c"]
+
+
+def test_resp_store_is_shared_between_workers():
+    server = RespServer(port=0)
+    server.state.clock = lambda: clock.now
+    server.start()
+    try:
+        clock, first, second = _shared_workers(lambda clock: RespRevocationStore(server.url, clock=clock, sync_seconds=1, rebuild_seconds=100))
+        _assert_workers_share_revocations(clock, first, second)
+        clock.now += 100
+        second.sync()
+        assert server.state.execute("ZRANGEBYSCORE", ["jwt:revoked", "-inf", "+inf"]) == []
+        first.close()
+        second.close()
+    finally:
+        server.stop()
+
+
+@pytest.fixture
+def client(chat_db, monkeypatch):
+    monkeypatch.setattr(limiter, "enabled", False)
+    app = FastAPI()
+    app.state.limiter = limiter
+    app.include_router(auth.router)
+    app.dependency_overrides[get_db] = lambda: chat_db
+    return TestClient(app)
+
+
+def test_logout_revokes_access_and_refresh_tokens(client):
+    access = create_access_token({"sub": "alice@example.com"})
+    refresh = create_refresh_token({"sub": "alice@example.com"})
+    other_refresh = create_refresh_token({"sub": "bob@example.com"})
+    assert client.get("/auth/me", headers={"Authorization": f"Bearer {access}"}).status_code == 200
+
+    response = client.post("/auth/logout", headers={"Authorization": f"Bearer {access}", "refresh-token": refresh})
+    assert response.status_code == 200
+
+    assert client.get("/auth/me", headers={"Authorization": f"Bearer {access}"}).status_code == 401
+    assert decode_token(refresh, expected_type="refresh") is None
+    assert client.post("/auth/logout", headers={"Authorization": f"Bearer {access}"}).status_code == 401
+
+    # Un refresh token de otro usuario no se revoca
+    fresh = create_access_token({"sub": "alice@example.com"})
+    client.post("/auth/logout", headers={"Authorization": f"Bearer {fresh}", "refresh-token": other_refresh})
+    assert decode_token(other_refresh, expected_type="refresh") is not None
+
+
+def test_refresh_token_is_single_use(client):
+    refresh = create_refresh_token({"sub": "alice@example.com"})
+    first = client.post("/auth/refresh", headers={"refresh-token": refresh})
+    assert first.status_code == 200
+    assert client.post("/auth/refresh", headers={"refresh-token": refresh}).status_code == 401
+    assert client.post("/auth/refresh", headers={"refresh-token": first.json()["refresh_token"]}).status_code == 200
+
+
+def test_background_thread_keeps_the_snapshot_current(db_session):
+    factory = sessionmaker(bind=db_session.get_bind())
+    first = SqlRevocationStore(factory)
+    second = SqlRevocationStore(factory, sync_seconds=0.01)
+    second.start()
+    try:
+        first.revoke("remoto", time.time() + 60)
+        deadline = time.time() + 5
+        while not second.is_revoked("remoto") and time.time() < deadline:
+            time.sleep(0.01)
+        assert second.is_revoked("remoto")
+    finally:
+        second.close()
+    assert second._thread is None
+
+
+def test_store_hooks_are_abstract():
+    class Partial(RevocationStore):
+        def _store(self, jti, expires_at):
+            pass
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_close_does_not_wait_for_a_stuck_sync():
+    release = threading.Event()
+
+    class Stuck(MemoryRevocationStore):
+        def _changes_since(self, cursor):
+            release.wait(5)
+            return (), cursor
+
+    store = Stuck(sync_seconds=0.01)
+    store.start()
+    try:
+        time.sleep(0.05)  # the background thread is now blocked in _changes_since
+        started = time.monotonic()
+        store.close(timeout=0.1)
+        assert time.monotonic() - started < 1
+        assert store._thread is None
+    finally:
+        release.set()
+
+
+def test_importing_jwt_does_not_load_the_store():
+    code = "import sys, app.auth.jwt\nassert 'app.auth.revocation' not in sys.modules\n"
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=Path(__file__).resolve().parents[1],
+        env={"DATABASE_URL": "postgresql://u:p@127.0.0.1:1/nodb", "SECRET_KEY": "s", "APP_SECRET": "a", "PATH": ""},
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,65 @@
+import base64
+import hashlib
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import app.model.models as mdls
+from app.auth.dependencies import get_current_user
+from app.db.db import get_read_db
+from app.endpoints import chat
+from app.utils.limiter import limiter
+
+
+@pytest.fixture
+def client(chat_db, monkeypatch):
+    monkeypatch.setattr(limiter, "enabled", False)
+    app = FastAPI()
+    app.state.limiter = limiter
+    app.include_router(chat.router)
+    app.dependency_overrides[get_read_db] = lambda: chat_db
+    app.dependency_overrides[get_current_user] = lambda: "alice@example.com"
+    return TestClient(app)
+
+
+def test_batch_returns_every_key_with_its_fingerprint(client, chat_db):
+    response = client.get("/users/keys", params={"users": ["bob@example.com", "alice@example.com", "nobody@example.com"]})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["missing"] == ["nobody@example.com"]
+    bob = chat_db.query(mdls.User).filter_by(email="bob@example.com").one()
+    assert body["keys"]["bob@example.com"] == {
+        "rsa": {"key": bob.public_key, "fingerprint": hashlib.sha256(base64.b64decode(bob.public_key)).hexdigest()},
+        "ecc": {"key": bob.public_ecc_key, "fingerprint": hashlib.sha256(base64.b64decode(bob.public_ecc_key)).hexdigest()},
+    }
+    assert set(body["keys"]) == {"alice@example.com", "bob@example.com"}
+
+
+def test_second_batch_is_served_from_the_identity_cache(client, chat_db):
+    client.get("/users/keys", params={"users": ["alice@example.com", "bob@example.com"]})
+    statements = []
+    engine = chat_db.get_bind()
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        client.get("/users/keys", params={"users": ["alice@example.com", "bob@example.com"]})
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert statements == []
+
+
+def test_etag_revalidates_until_a_key_changes(client, chat_db):
+    params = {"users": ["alice@example.com", "bob@example.com"]}
+    etag = client.get("/users/keys", params=params).headers["ETag"]
+
+    assert client.get("/users/keys", params=params, headers={"If-None-Match": etag}).status_code == 304
+
+    bob = chat_db.query(mdls.User).filter_by(email="bob@example.com").one()
+    bob.public_ecc_key = base64.b64encode(b"rotated").decode()
+    chat_db.commit()
+    changed = client.get("/users/keys", params=params, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
@@ -0,0 +1,68 @@
+import base64
+import hashlib
+
+import pytest
+from cryptography.fernet import Fernet, InvalidToken
+from sqlalchemy.orm import sessionmaker
+
+import app.model.models as mdls
+from app.crypto.crypto import str_to_bytes
+from app.crypto.keyring import Keyring, parse_secrets
+from app.model.key_rotation import rotate_user_keys
+from conftest import make_chat_user
+
+OLD = "appsecret-for-tests"
+
+
+def test_keyring_reads_legacy_tokens_and_tags_new_ones():
+    legacy = Fernet(base64.urlsafe_b64encode(hashlib.sha256(OLD.encode()).digest())).encrypt(b"secret")
+    keyring = Keyring(parse_secrets(OLD, "2:nuevo, 1:intermedio"))
+
+    assert keyring.primary == 2
+    assert keyring.decrypt(legacy) == b"secret"
+    rotated = keyring.rotate(legacy)
+    assert rotated.startswith(b"v2:") and keyring.decrypt(rotated) == b"secret"
+    assert keyring.rotate(rotated) is rotated
+
+    with pytest.raises(InvalidToken):
+        Keyring(parse_secrets(OLD, None)).decrypt(rotated)
+    with pytest.raises(ValueError):
+        parse_secrets(OLD, "0:bad")
+
+
+@pytest.fixture
+def users_db(db_session):
+    db_session.add_all([make_chat_user(f"user{n}@example.com") for n in range(5)])
+    db_session.commit()
+    return db_session
+
+
+def _versions(db, keyring):
+    rows = db.query(mdls.User.private_key, mdls.User.private_ecc_key).all()
+    return {keyring.version_of(str_to_bytes(value)) for row in rows for value in row}
+
+
+def test_job_is_resumable_and_rewrites_every_user(users_db):
+    keyring = Keyring(parse_secrets(OLD, "1:nuevo"))
+    factory = sessionmaker(bind=users_db.get_bind())
+    before = {user.id: Keyring(parse_secrets(OLD, None)).decrypt(str_to_bytes(user.private_key)) for user in users_db.query(mdls.User)}
+
+    first = rotate_user_keys(factory, keyring, batch_size=2, workers=0, max_batches=1)
+    assert (first.scanned, first.rotated, first.finished) == (2, 2, False)
+
+    second = rotate_user_keys(factory, keyring, batch_size=2, workers=0)
+    assert (second.scanned, second.rotated, second.finished) == (3, 5, True)
+
+    users_db.expire_all()
+    assert _versions(users_db, keyring) == {1}
+    assert {user.id: keyring.decrypt(str_to_bytes(user.private_key)) for user in users_db.query(mdls.User)} == before
+    progress = users_db.get(mdls.KeyRotationProgress, "users:v1")
+    assert (progress.rotated, progress.finished) == (5, True)
+
+
+def test_job_uses_a_process_pool(users_db):
+    keyring = Keyring(parse_secrets(OLD, "1:nuevo"))
+    stats = rotate_user_keys(sessionmaker(bind=users_db.get_bind()), keyring, batch_size=3, workers=2)
+    assert (stats.rotated, stats.finished) == (5, True)
+    users_db.expire_all()
+    assert _versions(users_db, keyring) == {1}
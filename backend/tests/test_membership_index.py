@@ -0,0 +1,60 @@
+import pytest
+from sqlalchemy import event
+
+import app.model.models as mdls
+from app.model.membership import MembershipIndex
+
+
+def test_index_answers_owner_and_member_checks():
+    index = MembershipIndex({"g": 1, "h": 2}, [("g", 5), ("g", 3), ("h", 3)], version=0)
+
+    assert index.is_member(1, "g") and index.is_member(3, "g") and index.is_member(5, "g")
+    assert not index.is_member(4, "g") and not index.is_member(1, "unknown")
+    assert index.owner_id("h") == 2
+    assert index.participant_ids("g") == {1, 3, 5}
+    assert index.user_groups(3) == ("g", "h")
+
+    index.add_member("g", 4)
+    index.add_member("g", 4)
+    assert list(index._members["g"]) == [3, 4, 5]
+    assert index.user_groups(4) == ("g",)
+
+
+@pytest.fixture
+def group_db(chat_db):
+    users = mdls.get_users_by_emails(chat_db, ["alice@example.com", "bob@example.com"])
+    alice, bob = users["alice@example.com"], users["bob@example.com"]
+    mdls.create_group(chat_db, "g", alice.id)
+    mdls.add_user_to_group(chat_db, bob.id, "g")
+    return chat_db, alice.id, bob.id
+
+
+def test_authorization_checks_run_without_queries(group_db):
+    db, alice_id, bob_id = group_db
+    mdls.get_group_owner_email(db, "g")
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.get_bind(), "before_cursor_execute", listener)
+    try:
+        assert mdls.is_group_member(db, alice_id, "g")
+        assert mdls.is_group_member(db, bob_id, "g")
+        assert mdls.get_group_owner_email(db, "g") == "alice@example.com"
+        assert mdls.get_user_groups(db, bob_id) == ["g"]
+        assert mdls.get_user_groups(db, alice_id) == []
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", listener)
+    assert statements == []
+
+
+def test_changes_from_another_worker_are_picked_up_after_refresh(group_db, monkeypatch):
+    db, alice_id, bob_id = group_db
+    assert not mdls.is_group_member(db, bob_id, "other")
+    # Written by another process: this one only sees the bumped "memberships" version
+    db.add(mdls.Group(id="other", owner_id=alice_id, shared_aes_key="k"))
+    db.add(mdls.GroupUser(user_id=bob_id, group_name="other"))
+    db.commit()
+    assert not mdls.is_group_member(db, bob_id, "other")
+
+    monkeypatch.setattr(mdls, "MEMBERSHIP_INDEX_REFRESH", 0)
+    assert mdls.is_group_member(db, bob_id, "other")
+    assert mdls.get_user_groups(db, bob_id) == ["g", "other"]
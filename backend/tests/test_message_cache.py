@@ -0,0 +1,143 @@
+import pytest
+
+import app.crypto.message_cache as message_cache
+import app.model.models as mdls
+from app.crypto.message_cache import CHUNK_SIZE, DecryptedMessageCache, group_key_scope
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_hit_miss_and_ttl():
+    clock = FakeClock()
+    cache = DecryptedMessageCache(max_bytes=CHUNK_SIZE, ttl=10, clock=clock)
+    assert cache.get(("group_messages", 1, 7)) is None
+    cache.put(("group_messages", 1, 7), "hola", "Signed", "group:g")
+    assert cache.get(("group_messages", 1, 7)) == ("hola", "Signed")
+    # Another reader is a separate entry
+    assert cache.get(("group_messages", 1, 8)) is None
+
+    clock.now = 11
+    assert cache.get(("group_messages", 1, 7)) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 3, 0)
+    cache.close()
+
+
+def test_lru_eviction_zeroes_the_slot():
+    # One chunk of 64-byte slots holds CHUNK_SIZE // 64 entries
+    cache = DecryptedMessageCache(max_bytes=CHUNK_SIZE)
+    slots = CHUNK_SIZE // 64
+    for n in range(slots):
+        cache.put(("p2p_messages", n, 1), f"secret-{n}", None, "user:1")
+    cache.get(("p2p_messages", 0, 1))
+    offset = cache._entries[("p2p_messages", 1, 1)].offset
+
+    cache.put(("p2p_messages", slots, 1), "nuevo", None, "user:1")
+
+    # The least recently used entry (1, not the re-read 0) was evicted
+    assert cache.get(("p2p_messages", 1, 1)) is None
+    assert cache.get(("p2p_messages", 0, 1)) == ("secret-0", None)
+    assert cache.stats()["evictions"] == 1
+    new_offset = cache._entries[("p2p_messages", slots, 1)].offset
+    assert new_offset == offset
+    assert cache._arena.read(offset, 64) == b"nuevo".ljust(64, b"\0")
+    cache.close()
+
+
+def test_freed_chunk_is_reused_for_another_size():
+    cache = DecryptedMessageCache(max_bytes=CHUNK_SIZE)
+    cache.put(("group_messages", 1, 1), "a", None, "group:g")
+    cache.put(("group_messages", 2, 1), "b" * 1000, None, "group:g")
+    assert cache.get(("group_messages", 1, 1)) is None
+    assert cache.get(("group_messages", 2, 1)) == ("b" * 1000, None)
+    assert cache._arena.read(0, CHUNK_SIZE).strip(b"\0") == b"b" * 1000
+    cache.close()
+
+
+def test_invalidate_scope_only_drops_that_key():
+    cache = DecryptedMessageCache(max_bytes=CHUNK_SIZE)
+    cache.put(("group_messages", 1, 1), "uno", None, group_key_scope("g1"))
+    cache.put(("group_messages", 2, 1), "dos", None, group_key_scope("g2"))
+    assert cache.invalidate(group_key_scope("g1")) == 1
+    assert cache.get(("group_messages", 1, 1)) is None
+    assert cache.get(("group_messages", 2, 1)) == ("dos", None)
+    cache.close()
+
+
+@pytest.fixture
+def enabled_cache(monkeypatch):
+    monkeypatch.setenv("MESSAGE_CACHE", "true")
+    message_cache.close_message_cache()
+    yield
+    message_cache.close_message_cache()
+
+
+def test_repeat_history_reads_skip_decryption(chat_db, enabled_cache, monkeypatch):
+    alice = mdls.get_users_by_emails(chat_db, ["alice@example.com"])["alice@example.com"]
+    mdls.create_group(chat_db, "g", alice.id)
+    for n in range(3):
+        mdls.send_group_message(chat_db, alice, "g", mdls.MessagePayload(message=f"m{n}", signed=True))
+
+    first = mdls.get_group_messages(chat_db, "g", reader_id=alice.id)
+
+    def fail(*args):
+        raise AssertionError("decrypted again")
+    monkeypatch.setattr(mdls, "descifrar_mensaje_grupal", fail)
+    monkeypatch.setattr(mdls, "verify_signature_ecdsa", fail)
+    assert mdls.get_group_messages(chat_db, "g", reader_id=alice.id) == first
+    assert [m["signature"] for m in first] == ["Signed"] * 3
+
+    stats = message_cache.get_message_cache().stats()
+    assert (stats["hits"], stats["misses"]) == (3, 3)
+
+    message_cache.invalidate_group_key("g")
+    with pytest.raises(AssertionError):
+        mdls.get_group_messages(chat_db, "g", reader_id=alice.id)
+
+
+def _cached_p2p_history(db):
+    users = mdls.get_users_by_emails(db, ["alice@example.com", "bob@example.com"])
+    alice, bob = users["alice@example.com"], users["bob@example.com"]
+    mdls.send_p2p_message(db, alice, bob, mdls.MessagePayload(message="hola", signed=False))
+    mdls.get_p2p_messages_by_user(db, alice.id, bob.id, reader_id=bob.id)
+    assert message_cache.get_message_cache().stats()["entries"] == 1
+    return alice, bob
+
+
+def test_key_rotation_drops_the_users_cached_messages(chat_db, enabled_cache):
+    from sqlalchemy.orm import sessionmaker
+    from app.crypto.keyring import Keyring, parse_secrets
+    from app.model.key_rotation import rotate_user_keys
+
+    _cached_p2p_history(chat_db)
+    keyring = Keyring(parse_secrets("appsecret-for-tests", "1:nuevo"))
+    assert rotate_user_keys(sessionmaker(bind=chat_db.get_bind()), keyring, workers=0).rotated == 2
+    assert message_cache.get_message_cache().stats()["entries"] == 0
+
+
+def test_user_changes_drop_the_users_cached_messages(chat_db, enabled_cache):
+    alice, bob = _cached_p2p_history(chat_db)
+    # Entries are scoped to the receiver's private key: the sender's changes keep them
+    alice.totp_verified = True
+    chat_db.commit()
+    assert message_cache.get_message_cache().stats()["entries"] == 1
+    # Only a new private key makes the receiver's entries stale
+    bob.totp_verified = True
+    bob.hashed_password = "y"
+    chat_db.commit()
+    assert message_cache.get_message_cache().stats()["entries"] == 1
+
+    bob.private_key = alice.private_key
+    chat_db.commit()
+    assert message_cache.get_message_cache().stats()["entries"] == 0
+
+
+def test_cache_is_disabled_by_default(monkeypatch):
+    monkeypatch.delenv("MESSAGE_CACHE", raising=False)
+    assert message_cache.get_message_cache() is None
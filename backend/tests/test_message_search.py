@@ -0,0 +1,56 @@
+import pytest
+
+import app.model.models as mdls
+from app.crypto.blind_index import keyword_tokens, normalize_keywords
+
+
+@pytest.fixture
+def search_enabled(monkeypatch):
+    monkeypatch.setenv("MESSAGE_SEARCH", "true")
+
+
+def test_keywords_are_normalized_and_deduplicated():
+    assert normalize_keywords("Canción, CANCION y a la canción!") == ["cancion", "la"]
+    assert keyword_tokens("group:g", "Hola") == keyword_tokens("group:g", "hola")
+    # Same word, different conversation: unrelated tokens
+    assert keyword_tokens("group:g", "hola") != keyword_tokens("group:h", "hola")
+
+
+def test_group_search_matches_all_words_and_decrypts_only_hits(chat_db, chat, search_enabled, monkeypatch):
+    alice, _ = chat.users()
+    chat.group(alice)
+    for text in ("reunión el lunes", "el martes no hay reunion", "nada que ver"):
+        chat.send_group(alice, text)
+
+    decrypted = []
+    original = mdls.descifrar_mensaje_grupal
+    monkeypatch.setattr(mdls, "descifrar_mensaje_grupal", lambda *args: decrypted.append(1) or original(*args))
+
+    hits = mdls.search_group_messages(chat_db, "g", "REUNION")
+    assert [hit["message"] for hit in hits] == ["el martes no hay reunion", "reunión el lunes"]
+    assert len(decrypted) == 2
+    assert [hit["message"] for hit in mdls.search_group_messages(chat_db, "g", "reunion lunes")] == ["reunión el lunes"]
+    assert mdls.search_group_messages(chat_db, "g", "reu") == []
+    assert len(mdls.search_group_messages(chat_db, "g", "el", limit=1)) == 1
+
+
+def test_p2p_search_is_scoped_to_the_conversation(chat_db, chat, search_enabled):
+    alice, bob = chat.users()
+    chat.group(alice)
+    chat.send_group(alice, "clave secreta del grupo")
+    chat.send(alice, bob, "la clave es 1234")
+
+    hits = mdls.search_p2p_messages(chat_db, alice.id, bob.id, "clave", reader_id=bob.id)
+    assert [hit["message"] for hit in hits] == ["la clave es 1234"]
+    assert [hit["message"] for hit in mdls.search_group_messages(chat_db, "g", "clave")] == ["clave secreta del grupo"]
+
+
+def test_nothing_is_indexed_by_default(chat_api, monkeypatch):
+    monkeypatch.delenv("MESSAGE_SEARCH", raising=False)
+    [alice] = chat_api.chat.users("alice@example.com")
+    chat_api.chat.group(alice)
+    chat_api.chat.send_group(alice, "hola")
+    assert chat_api.db.query(mdls.MessageSearchToken).count() == 0
+
+    response = chat_api.client.get("/group-messages/g/search", params={"q": "hola"})
+    assert response.status_code == 404
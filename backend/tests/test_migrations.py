@@ -0,0 +1,87 @@
+from pathlib import Path
+
+import pytest
+import sqlalchemy as sa
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from sqlalchemy.orm import sessionmaker
+
+import app.model.models as mdls
+from app.db.db import Base
+
+BACKEND_ROOT = Path(__file__).resolve().parents[1]
+
+
+def _alembic_config(url):
+    # No ini file: env.py would reconfigure logging for the whole test run
+    config = Config()
+    config.set_main_option("script_location", str(BACKEND_ROOT / "migrations"))
+    config.set_main_option("sqlalchemy.url", url)
+    return config
+
+
+@pytest.fixture
+def baseline_db(tmp_path):
+    """SQLite database at 0001_baseline with rows written by the pre-migration app."""
+    url = f"sqlite:///{tmp_path / 'legacy.db'}"
+    config = _alembic_config(url)
+    command.upgrade(config, "0001_baseline")
+
+    engine = sa.create_engine(url)
+    with engine.begin() as conn:
+        for user_id, email in ((1, "alice@example.com"), (2, "bob@example.com")):
+            conn.execute(sa.text(
+                "INSERT INTO users (id, email, hashed_password, public_key, private_key, public_ecc_key, private_ecc_key) "
+                "VALUES (:id, :email, 'x', 'pk', 'sk', 'pe', 'se')"
+            ), {"id": user_id, "email": email})
+        conn.execute(sa.text(
+            "INSERT INTO p2p_messages (id, sender_id, receiver_id, hash, message, timestamp) VALUES "
+            "(1, 1, 2, 'h1', 'm1', '2024-01-01 10:00:00'), (2, 2, 1, 'h2', 'm2', '2024-01-01 10:01:00')"
+        ))
+        conn.execute(sa.text("INSERT INTO groups (id, owner_id, shared_aes_key) VALUES ('g', 1, 'key')"))
+        # The same membership twice, as add_user_to_group races could leave it
+        conn.execute(sa.text("INSERT INTO group_users (id, user_id, group_name) VALUES (1, 2, 'g'), (2, 2, 'g')"))
+        conn.execute(sa.text(
+            "INSERT INTO group_messages (id, sender_id, group_name, hash, message, timestamp) "
+            "VALUES (1, 1, 'g', 'gh', 'gm', '2024-01-01 10:02:00')"
+        ))
+    yield config, engine
+    engine.dispose()
+
+
+def test_upgrade_head_keeps_existing_rows(baseline_db):
+    config, engine = baseline_db
+    command.upgrade(config, "head")
+
+    with engine.connect() as conn:
+        # 0002 creates the pair's conversation and assigns it to the existing messages
+        assert conn.execute(sa.text("SELECT id, user_low_id, user_high_id, created_at FROM conversations")).all() == [(1, 1, 2, "2024-01-01 10:00:00")]
+        assert conn.execute(sa.text("SELECT id, conversation_id, broadcast_id FROM p2p_messages ORDER BY id")).all() == [(1, 1, None), (2, 1, None)]
+        assert conn.execute(sa.text("SELECT id, key_epoch FROM group_messages")).all() == [(1, 0)]
+        assert conn.execute(sa.text("SELECT id FROM group_users")).all() == [(1,)]
+        # The schema the migrations build is the one the models declare
+        assert compare_metadata(MigrationContext.configure(conn), Base.metadata) == []
+
+    with sessionmaker(bind=engine)() as db:
+        assert mdls.backfill_conversation_ids(db) == 0
+        # Old P2P history is visible without running the backfill script
+        assert mdls.get_p2p_last_message_id(db, 1, 2) == 2
+        assert [msg.id for msg in mdls._load_p2p_messages(db, 1, 2, None, None)[0]] == [2, 1]
+        assert mdls.get_group_last_message_id(db, "g") == 1
+
+
+def test_upgrade_head_over_a_create_all_database(tmp_path):
+    """Deployments that predate Alembic got their tables from create_all and are stamped at the baseline."""
+    url = f"sqlite:///{tmp_path / 'create_all.db'}"
+    engine = sa.create_engine(url)
+    Base.metadata.create_all(engine)
+    config = _alembic_config(url)
+    command.stamp(config, "0001_baseline")
+
+    command.upgrade(config, "head")
+
+    with engine.connect() as conn:
+        assert compare_metadata(MigrationContext.configure(conn), Base.metadata) == []
+    engine.dispose()
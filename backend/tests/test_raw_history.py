@@ -0,0 +1,90 @@
+import base64
+import json
+
+import pytest
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.serialization import load_der_public_key
+
+import app.model.models as mdls
+
+
+@pytest.fixture
+def no_server_crypto(monkeypatch):
+    """Call after sending: from then on any decryption or verification fails the test."""
+    def fail(*args):
+        raise AssertionError("raw mode must not decrypt or verify")
+
+    def disable():
+        for name in ("descifrar_mensaje_grupal", "descifrar_mensaje_individual", "decrypt_bytes", "verify_signature_ecdsa"):
+            monkeypatch.setattr(mdls, name, fail)
+    return disable
+
+
+def test_group_raw_envelope_decrypts_client_side(chat_db, no_server_crypto):
+    users = mdls.get_users_by_emails(chat_db, ["alice@example.com", "bob@example.com"])
+    alice = users["alice@example.com"]
+    group = mdls.create_group(chat_db, "g", alice.id)
+    mdls.send_group_message(chat_db, alice, "g", mdls.MessagePayload(message="hola grupo", signed=True))
+    group_key = base64.b64decode(group.shared_aes_key)
+    no_server_crypto()
+
+    [raw] = mdls.get_group_messages_raw(chat_db, "g")
+
+    assert raw["alg"] == mdls.RAW_ALG_GROUP
+    assert (raw["sender"], raw["receiver"]) == ("alice@example.com", "g")
+    mdls.RawMessageResponse(**raw)
+    # What a WebCrypto client does: AES-GCM with the tag appended to the ciphertext
+    envelope = json.loads(raw["envelope"])
+    plaintext = AESGCM(group_key).decrypt(base64.b64decode(envelope["nonce"]), base64.b64decode(envelope["mensaje"]), None)
+    assert plaintext == b"hola grupo"
+    # ECDSA P-256 over SHA-256 of the stored envelope, raw r||s
+    signature = base64.b64decode(raw["signature"])
+    der = encode_dss_signature(int.from_bytes(signature[:32], "big"), int.from_bytes(signature[32:], "big"))
+    public_key = load_der_public_key(base64.b64decode(alice.public_ecc_key))
+    public_key.verify(der, raw["envelope"].encode(), ec.ECDSA(hashes.SHA256()))
+
+
+def test_p2p_raw_returns_stored_envelope(chat_db, no_server_crypto):
+    users = mdls.get_users_by_emails(chat_db, ["alice@example.com", "bob@example.com"])
+    alice, bob = users["alice@example.com"], users["bob@example.com"]
+    message = mdls.send_p2p_message(chat_db, alice, bob, mdls.MessagePayload(message="hola", signed=False))
+    no_server_crypto()
+
+    raw = mdls.get_p2p_messages_raw(chat_db, alice.id, bob.id)
+
+    assert raw[0].pop("timestamp") is not None
+    assert raw == [{
+        "id": message.id,
+        "sender": "alice@example.com",
+        "receiver": "bob@example.com",
+        "alg": mdls.RAW_ALG_P2P,
+        "envelope": message.message,
+        "signature": None,
+        "hash": message.hash,
+    }]
+    assert set(json.loads(raw[0]["envelope"])) == {"mensaje", "clave_aes", "iv"}
+
+
+def test_history_routes_document_both_shapes(chat_api):
+    schema = chat_api.client.get("/openapi.json").json()
+    for path in ("/group-messages/{group_name}", "/messages/{user_origen}/{user_destino}"):
+        response = schema["paths"][path]["get"]["responses"]["200"]["content"]["application/json"]["schema"]
+        models = {variant["items"]["$ref"].rsplit("/", 1)[-1] for variant in response["anyOf"]}
+        assert models == {"MessageResponse", "RawMessageResponse"}
+
+
+def test_raw_history_endpoints_return_envelopes(chat_api):
+    users = mdls.get_users_by_emails(chat_api.db, ["alice@example.com", "bob@example.com"])
+    alice, bob = users["alice@example.com"], users["bob@example.com"]
+    mdls.create_group(chat_api.db, "g", alice.id)
+    mdls.send_group_message(chat_api.db, alice, "g", mdls.MessagePayload(message="hola grupo", signed=True))
+    mdls.send_p2p_message(chat_api.db, alice, bob, mdls.MessagePayload(message="hola", signed=False))
+
+    for path, alg in (("/group-messages/g", mdls.RAW_ALG_GROUP), ("/messages/alice@example.com/bob@example.com", mdls.RAW_ALG_P2P)):
+        [raw] = chat_api.client.get(path, params={"raw": "true"}).json()
+        assert mdls.RawMessageResponse(**raw).alg == alg
+        [decrypted] = chat_api.client.get(path).json()
+        assert mdls.MessageResponse(**decrypted).message.startswith("hola")
@@ -0,0 +1,167 @@
+import asyncio
+
+import pytest
+import sqlalchemy
+from fastapi import Depends, FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app.auth.dependencies import get_current_user, get_current_user_async
+from app.auth.jwt import create_access_token
+from app.db import db as dbmod
+from app.middleware.read_your_writes import ReadYourWritesMiddleware
+
+
+@pytest.fixture
+def primary_and_replica(tmp_path, monkeypatch):
+    """Two SQLite files standing in for the primary and a replica, each holding one marker row."""
+    primary_url = f"sqlite:///{tmp_path / 'primary.db'}"
+    replica_url = f"sqlite:///{tmp_path / 'replica.db'}"
+    for url, marker in ((primary_url, "primary"), (replica_url, "replica")):
+        engine = sqlalchemy.create_engine(url)
+        with engine.begin() as conn:
+            conn.execute(sqlalchemy.text("CREATE TABLE origin (name TEXT)"))
+            conn.execute(sqlalchemy.text("INSERT INTO origin VALUES (:name)"), {"name": marker})
+        engine.dispose()
+
+    monkeypatch.setenv("DATABASE_URL", primary_url)
+    monkeypatch.setenv("DATABASE_REPLICA_URLS", replica_url)
+    for name in ("_engine", "_async_engine", "_replica_engines", "_async_replica_engines"):
+        monkeypatch.setattr(dbmod, name, None)
+    monkeypatch.setattr(dbmod, "recent_writes", dbmod.RecentWrites(window=60))
+    yield
+    asyncio.run(dbmod.dispose_engines())
+
+
+def _origin(engine):
+    with engine.connect() as conn:
+        return conn.execute(sqlalchemy.text("SELECT name FROM origin")).scalar()
+
+
+def test_reads_go_to_replica_until_user_writes(primary_and_replica):
+    assert _origin(dbmod.get_read_engine("alice@example.com")) == "replica"
+    assert _origin(dbmod.get_read_engine(None)) == "replica"
+
+    dbmod.recent_writes.mark("alice@example.com")
+    assert _origin(dbmod.get_read_engine("alice@example.com")) == "primary"
+    # Other users keep reading from the replica
+    assert _origin(dbmod.get_read_engine("bob@example.com")) == "replica"
+
+
+def test_recent_write_window_expires(primary_and_replica, monkeypatch):
+    monkeypatch.setattr(dbmod, "recent_writes", dbmod.RecentWrites(window=0))
+    dbmod.recent_writes.mark("alice@example.com")
+    assert not dbmod.recent_writes.is_recent("alice@example.com")
+    assert _origin(dbmod.get_read_engine("alice@example.com")) == "replica"
+
+
+def test_round_robin_across_replicas(primary_and_replica, monkeypatch, tmp_path):
+    replica_url = f"sqlite:///{tmp_path / 'replica.db'}"
+    monkeypatch.setenv("DATABASE_REPLICA_URLS", f"{replica_url},{replica_url}")
+    picked = {id(dbmod.get_read_engine()) for _ in range(4)}
+    assert picked == {id(engine) for engine in dbmod.get_replica_engines()}
+    assert len(picked) == 2
+
+
+def test_without_replicas_reads_use_primary(primary_and_replica, monkeypatch):
+    monkeypatch.setenv("DATABASE_REPLICA_URLS", "")
+    assert _origin(dbmod.get_read_engine()) == "primary"
+
+
+def test_read_dependencies_pin_authenticated_writer_to_primary(primary_and_replica):
+    app = FastAPI()
+
+    @app.get("/sync-origin")
+    def sync_origin(username=Depends(get_current_user), db=Depends(dbmod.get_read_db)):
+        return db.execute(sqlalchemy.text("SELECT name FROM origin")).scalar()
+
+    @app.get("/async-origin")
+    async def async_origin(username=Depends(get_current_user_async), db=Depends(dbmod.get_async_read_db)):
+        return (await db.execute(sqlalchemy.text("SELECT name FROM origin"))).scalar()
+
+    @app.get("/public-origin")
+    def public_origin(db=Depends(dbmod.get_read_db)):
+        return db.execute(sqlalchemy.text("SELECT name FROM origin")).scalar()
+
+    client = TestClient(app)
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'alice@example.com'})}"}
+    assert client.get("/sync-origin", headers=headers).json() == "replica"
+    assert client.get("/async-origin", headers=headers).json() == "replica"
+
+    dbmod.recent_writes.mark("alice@example.com")
+    assert client.get("/sync-origin", headers=headers).json() == "primary"
+    assert client.get("/async-origin", headers=headers).json() == "primary"
+    # Anonymous requests and other tokens are not pinned
+    assert client.get("/public-origin", headers=headers).json() == "replica"
+
+
+def test_read_dependency_reuses_the_authenticated_user(primary_and_replica, monkeypatch):
+    import app.auth.dependencies as deps
+
+    decoded = []
+    decode = deps.decode_token
+    monkeypatch.setattr(deps, "decode_token", lambda *args, **kwargs: decoded.append(1) or decode(*args, **kwargs))
+    app = FastAPI()
+
+    @app.get("/origin")
+    async def origin(username=Depends(get_current_user_async), db=Depends(dbmod.get_async_read_db)):
+        return (await db.execute(sqlalchemy.text("SELECT name FROM origin"))).scalar()
+
+    dbmod.recent_writes.mark("alice@example.com")
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'alice@example.com'})}"}
+    assert TestClient(app).get("/origin", headers=headers).json() == "primary"
+    assert len(decoded) == 1
+
+
+def test_write_marker_cookie_pins_reads_on_any_worker(primary_and_replica, monkeypatch):
+    app = FastAPI()
+    app.add_middleware(ReadYourWritesMiddleware)
+
+    @app.post("/write")
+    def write(request: Request, username=Depends(get_current_user)):
+        dbmod.recent_writes.mark(username, request)
+
+    @app.get("/origin")
+    async def origin(username=Depends(get_current_user_async), db=Depends(dbmod.get_async_read_db)):
+        return (await db.execute(sqlalchemy.text("SELECT name FROM origin"))).scalar()
+
+    client = TestClient(app)
+    alice = {"Authorization": f"Bearer {create_access_token({'sub': 'alice@example.com'})}"}
+    client.post("/write", headers=alice)
+    assert client.cookies.get(dbmod.READ_YOUR_WRITES_COOKIE)
+
+    # Another worker: nothing in its own registry, only the cookie the client sends back
+    monkeypatch.setattr(dbmod, "recent_writes", dbmod.RecentWrites(window=60))
+    assert client.get("/origin", headers=alice).json() == "primary"
+    # The marker is bound to the writer and cannot be forged or moved forward
+    bob = {"Authorization": f"Bearer {create_access_token({'sub': 'bob@example.com'})}"}
+    assert client.get("/origin", headers=bob).json() == "replica"
+    until, _, signature = client.cookies.get(dbmod.READ_YOUR_WRITES_COOKIE).partition(".")
+    client.cookies.set(dbmod.READ_YOUR_WRITES_COOKIE, f"{int(until) + 3600}.{signature}")
+    assert client.get("/origin", headers=alice).json() == "replica"
+
+
+def test_write_marker_expires_with_the_window(monkeypatch):
+    marker = dbmod.RecentWrites(window=5).marker("alice@example.com")
+    assert dbmod.recent_writes.is_marked("alice@example.com", marker)
+    assert not dbmod.recent_writes.is_marked("alice@example.com", None)
+    assert not dbmod.recent_writes.is_marked("alice@example.com", "garbage")
+    monkeypatch.setattr(dbmod.time, "time", lambda: int(marker.partition(".")[0]) + 1)
+    assert not dbmod.recent_writes.is_marked("alice@example.com", marker)
+
+
+def test_routes_authenticate_before_opening_a_read_session():
+    """The read session picks its engine from the user the auth dependency left on request.state."""
+    from fastapi.routing import APIRoute
+    from app.main import app
+
+    checked = 0
+    for route in app.routes:
+        if not isinstance(route, APIRoute):
+            continue
+        calls = [dependency.call for dependency in route.dependant.dependencies]
+        reads = [i for i, call in enumerate(calls) if call in (dbmod.get_read_db, dbmod.get_async_read_db)]
+        auth = [i for i, call in enumerate(calls) if call in (get_current_user, get_current_user_async)]
+        if reads and auth:
+            assert auth[0] < reads[0], route.path
+            checked += 1
+    assert checked
@@ -0,0 +1,119 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+import app.endpoints.chat as chat
+import app.model.models as mdls
+from app.auth.jwt import create_access_token
+from app.realtime.bus import InProcessBus, close_bus, group_channel, user_channel
+
+
+def test_publish_delivers_to_channel_subscribers_only():
+    bus = InProcessBus()
+
+    async def scenario():
+        sub_group = bus.subscribe([group_channel("g1")])
+        sub_user = bus.subscribe([user_channel(7)])
+        bus.publish({"channel": group_channel("g1"), "group": "g1", "message_id": 1})
+        event = await asyncio.wait_for(sub_group.get(), timeout=1)
+        assert event["message_id"] == 1
+        assert sub_user.queue.empty()
+        sub_group.close()
+        sub_user.close()
+
+    asyncio.run(scenario())
+
+
+def test_publish_from_worker_thread_reaches_event_loop():
+    """Sync endpoints publish from Starlette's threadpool."""
+    bus = InProcessBus()
+
+    async def scenario():
+        sub = bus.subscribe([user_channel(1)])
+        thread = threading.Thread(
+            target=bus.publish,
+            args=({"channel": user_channel(1), "sender_id": 2, "receiver_id": 1, "message_id": 5},),
+        )
+        thread.start()
+        event = await asyncio.wait_for(sub.get(), timeout=1)
+        thread.join()
+        assert event["sender_id"] == 2
+        sub.close()
+
+    asyncio.run(scenario())
+
+
+def test_close_detaches_subscription():
+    bus = InProcessBus()
+
+    async def scenario():
+        sub = bus.subscribe([group_channel("g1")])
+        sub.add(group_channel("g2"))
+        assert set(bus._subscribers) == {group_channel("g1"), group_channel("g2")}
+        sub.close()
+        assert bus._subscribers == {}
+        # Publicar sin suscriptores no falla
+        bus.publish({"channel": group_channel("g1"), "group": "g1", "message_id": 2})
+
+    asyncio.run(scenario())
+
+
+@pytest.fixture
+def socket_client(chat_db, monkeypatch):
+    """TestClient for the chat router whose /ws endpoint reads from chat_db's engine."""
+    monkeypatch.setattr(chat, "SessionLocal", sessionmaker(bind=chat_db.get_bind(), autoflush=False))
+    app = FastAPI()
+    app.include_router(chat.router)
+    yield TestClient(app)
+    close_bus()
+
+
+def _open_socket(client, email):
+    socket = client.websocket_connect(f"/ws?token={create_access_token({'sub': email})}")
+    ws = socket.__enter__()
+    # Once the error comes back the receive loop runs, so the subscription exists
+    ws.send_json({"subscribe": "no-such-group"})
+    assert ws.receive_json()["type"] == "error"
+    return socket, ws
+
+
+def test_socket_delivers_p2p_messages(chat_db, socket_client):
+    users = mdls.get_users_by_emails(chat_db, ["alice@example.com", "bob@example.com"])
+    socket, ws = _open_socket(socket_client, "bob@example.com")
+    try:
+        mdls.send_p2p_message(chat_db, users["alice@example.com"], users["bob@example.com"], mdls.MessagePayload(message="hola", signed=False))
+        event = ws.receive_json()
+    finally:
+        socket.__exit__(None, None, None)
+
+    assert event["type"] == "messages" and event["peer"] == "alice@example.com"
+    assert [m["message"] for m in event["messages"]] == ["hola"]
+
+
+def test_socket_survives_a_failed_fetch(chat_db, socket_client, monkeypatch):
+    users = mdls.get_users_by_emails(chat_db, ["alice@example.com", "bob@example.com"])
+    read = mdls.get_p2p_messages_by_user
+    calls = []
+
+    def flaky_read(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("database went away")
+        return read(*args, **kwargs)
+
+    monkeypatch.setattr(mdls, "get_p2p_messages_by_user", flaky_read)
+    alice, bob = users["alice@example.com"], users["bob@example.com"]
+    socket, ws = _open_socket(socket_client, "bob@example.com")
+    try:
+        mdls.send_p2p_message(chat_db, alice, bob, mdls.MessagePayload(message="uno", signed=False))
+        mdls.send_p2p_message(chat_db, alice, bob, mdls.MessagePayload(message="dos", signed=False))
+        event = ws.receive_json()
+    finally:
+        socket.__exit__(None, None, None)
+
+    # The message whose fetch failed is picked up with the next event
+    assert {m["message"] for m in event["messages"]} == {"uno", "dos"}
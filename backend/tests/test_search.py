@@ -0,0 +1,55 @@
+import pytest
+
+import app.model.models as mdls
+import app.model.search as search
+from app.model.search import PrefixIndex
+
+
+def _user(email):
+    return mdls.User(email=email, hashed_password="x", public_key="pk", private_key="sk", public_ecc_key="pk", private_ecc_key="sk")
+
+
+EMAILS = ["juan.perez@correo.com", "ana@correo.com", "perez@example.com", "Pedro@example.org", "100%_real@example.com"]
+
+
+@pytest.fixture
+def search_db(db_session, monkeypatch):
+    monkeypatch.setattr(search._index_cache, "refresh", 0)
+    db_session.add_all([_user(email) for email in EMAILS])
+    db_session.commit()
+    return db_session
+
+
+def test_prefix_index_ranks_full_prefix_before_inner_words():
+    index = PrefixIndex(EMAILS)
+    assert index.search("pe", 10) == ["Pedro@example.org", "perez@example.com", "juan.perez@correo.com"]
+    assert index.search("correo", 10) == ["ana@correo.com", "juan.perez@correo.com"]
+    assert index.search("pe", 1) == ["Pedro@example.org"]
+    assert index.search("zzz", 10) == []
+
+
+def test_user_search_skips_group_participants(search_db):
+    ids = {user.email: user.id for user in search_db.query(mdls.User)}
+    mdls.create_group(search_db, "perez-family", ids["perez@example.com"])
+    mdls.add_user_to_group(search_db, ids["juan.perez@correo.com"], "perez-family")
+
+    assert search.search_users(search_db, "perez") == ["perez@example.com", "juan.perez@correo.com"]
+    assert search.search_users(search_db, "pe", not_in_group="perez-family") == ["Pedro@example.org"]
+    assert search.search_groups(search_db, "family") == ["perez-family"]
+
+
+def test_index_is_rebuilt_when_the_directory_changes(search_db):
+    assert search.search_users(search_db, "zoe") == []
+    search_db.add(_user("zoe@example.com"))
+    search_db.commit()
+    assert search.search_users(search_db, "zoe") == ["zoe@example.com"]
+
+
+def test_sql_search_escapes_wildcards_and_ranks_prefixes(search_db):
+    # The Postgres path, run on SQLite with a strpos() stand-in
+    search_db.connection().connection.driver_connection.create_function("strpos", 2, lambda text, sub: text.find(sub) + 1)
+    query = search_db.query(mdls.User.email)
+
+    assert search._search_sql(search_db, query, mdls.User.email, "100%", 10) == ["100%_real@example.com"]
+    assert search._search_sql(search_db, query, mdls.User.email, "%", 10) == []
+    assert search._search_sql(search_db, query, mdls.User.email, "pere", 10) == ["perez@example.com", "juan.perez@correo.com"]
@@ -0,0 +1,119 @@
+import json
+import threading
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import app.model.models as mdls
+from app.db.db import Base
+from app.endpoints.chain import BLOCK_SIZE, BlockchainManager
+from conftest import make_chat_user
+
+
+def _send_p2p(db, sender_email, receiver_email, text):
+    # Same steps as POST /messages/{user_destino}
+    users = mdls.get_users_by_emails(db, [sender_email, receiver_email])
+    return mdls.send_p2p_message(
+        db, users[sender_email], users[receiver_email],
+        mdls.MessagePayload(message=text, signed=False),
+        before_commit=lambda session, m: BlockchainManager(session).add_message(True, m),
+    )
+
+
+def test_p2p_send_uses_one_transaction_and_fixed_round_trips(chat_db, round_trips):
+    _send_p2p(chat_db, "alice@example.com", "bob@example.com", "first")  # creates the conversation
+
+    trips = round_trips(chat_db)
+    msg = _send_p2p(chat_db, "alice@example.com", "bob@example.com", "second")
+    # users, conversation, message, head, summaries, chain entry, unassigned check
+    assert len(trips.statements) == 7, trips.statements
+    assert trips.commits == 1
+    # The returned message is usable without a refresh
+    assert msg.id and msg.conversation_id and msg.hash
+
+    trips.reset()
+    _send_p2p(chat_db, "bob@example.com", "alice@example.com", "third")
+    _send_p2p(chat_db, "alice@example.com", "bob@example.com", "fourth")
+    # The fourth chain entry closes a block inside the same transaction
+    assert trips.commits == 2
+    trips.close()
+
+    block = chat_db.query(mdls.Block).one()
+    assert [m.message_id for m in sorted(block.messages, key=lambda m: m.id)] == [1, 2, 3, 4]
+    assert BlockchainManager(chat_db).verify_blockchain()[0]
+
+
+def test_failed_chain_entry_rolls_back_message(chat_db):
+    users = mdls.get_users_by_emails(chat_db, ["alice@example.com", "bob@example.com"])
+
+    def broken_chain(session, msg):
+        raise RuntimeError("chain unavailable")
+
+    with pytest.raises(RuntimeError):
+        mdls.send_p2p_message(
+            chat_db, users["alice@example.com"], users["bob@example.com"],
+            mdls.MessagePayload(message="lost", signed=False), before_commit=broken_chain,
+        )
+    chat_db.rollback()
+    assert chat_db.query(mdls.PeerMessage).count() == 0
+    assert chat_db.query(mdls.ConversationHead).count() == 0
+
+
+def test_group_send_commits_once(chat_db, round_trips):
+    users = mdls.get_users_by_emails(chat_db, ["alice@example.com", "bob@example.com"])
+    group = mdls.create_group(chat_db, "team", users["alice@example.com"].id)
+    mdls.add_user_to_group(chat_db, users["bob@example.com"].id, group.id)
+
+    trips = round_trips(chat_db)
+    sender = mdls.get_users_by_emails(chat_db, ["bob@example.com"])["bob@example.com"]
+    msg = mdls.send_group_message(
+        chat_db, sender, "team", mdls.MessagePayload(message="hola", signed=True),
+        before_commit=lambda session, m: BlockchainManager(session).add_message(False, m),
+    )
+    assert trips.commits == 1
+    assert len(trips.statements) <= 8, trips.statements
+    trips.close()
+
+    entry = chat_db.query(mdls.BlockMessage).filter_by(is_p2p=False, message_id=msg.id).one()
+    assert entry.message_str == json.loads(msg.message)["mensaje"]
+
+
+def test_concurrent_sends_keep_one_valid_chain(tmp_path):
+    # File-backed so every sender gets its own connection and transaction
+    engine = create_engine(f"sqlite:///{tmp_path / 'chat.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    with factory() as db:
+        db.add_all([make_chat_user("alice@example.com"), make_chat_user("bob@example.com")])
+        db.commit()
+
+    senders, per_sender = 6, BLOCK_SIZE
+    barrier = threading.Barrier(senders)
+    errors = []
+
+    def send(n):
+        try:
+            with factory() as db:
+                barrier.wait()
+                for i in range(per_sender):
+                    _send_p2p(db, "alice@example.com", "bob@example.com", f"{n}-{i}")
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=send, args=(n,)) for n in range(senders)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with factory() as db:
+        assert db.query(mdls.PeerMessage).count() == senders * per_sender
+        assert db.query(mdls.BlockMessage).filter(mdls.BlockMessage.block_id == None).count() == 0
+        blocks = db.query(mdls.Block).order_by(mdls.Block.id).all()
+        assert len(blocks) == senders
+        # One linear chain: every block points at the one before it
+        assert [b.previous_hash for b in blocks] == ["0"] + [b.hash for b in blocks[:-1]]
+        assert BlockchainManager(db).verify_blockchain()[0]
+    engine.dispose()
@@ -0,0 +1,60 @@
+import pytest
+
+
+@pytest.fixture
+def people(chat_api):
+    """alice, bob and carol; alice owns group g and bob is a member."""
+    alice, bob = chat_api.chat.users()
+    carol = chat_api.chat.signup("carol@example.com")
+    chat_api.chat.group(alice, bob)
+    return alice, bob, carol
+
+
+def _by_conversation(response):
+    assert response.status_code == 200
+    return {c["conversation"]: c for c in response.json()["conversations"]}
+
+
+def test_sync_returns_every_changed_conversation(chat_api, people):
+    alice, bob, carol = people
+    chat = chat_api.chat
+    old = chat.send(bob, alice, "viejo")
+    new = chat.send(alice, bob, "nuevo")
+    from_carol = chat.send(carol, bob, "hola bob")
+    group_message = chat.send_group(alice, "hola grupo")
+    chat_api.user = "bob@example.com"
+
+    synced = _by_conversation(chat_api.client.post("/sync", json={"cursors": {"peer:alice@example.com": old.id}}))
+
+    assert set(synced) == {"peer:alice@example.com", "peer:carol@example.com", "group:g"}
+    assert [(m["id"], m["message"]) for m in synced["peer:alice@example.com"]["messages"]] == [(new.id, "nuevo")]
+    # Conversations missing from the cursors come back in full
+    assert synced["peer:carol@example.com"]["last_id"] == from_carol.id
+    assert [m["message"] for m in synced["group:g"]["messages"]] == ["hola grupo"]
+    assert synced["group:g"]["last_id"] == group_message.id
+
+
+def test_sync_without_conversations_is_empty(chat_api, people):
+    chat_api.user = "carol@example.com"
+    assert chat_api.client.post("/sync", json={}).json() == {"conversations": []}
+    # A peer with no conversation yet, or no user at all, has nothing to return
+    cursors = {"peer:alice@example.com": 0, "peer:nobody@example.com": 0, "group:missing": 0}
+    assert chat_api.client.post("/sync", json={"cursors": cursors}).json() == {"conversations": []}
+
+
+def test_sync_skips_conversations_at_or_past_their_cursor(chat_api, people):
+    alice, bob, carol = people
+    chat = chat_api.chat
+    last = chat.send(alice, bob, "uno")
+    group_message = chat.send_group(alice, "hola")
+    chat.send(carol, bob, "hola bob")
+    chat_api.user = "bob@example.com"
+
+    cursors = {"peer:alice@example.com": last.id, "group:g": group_message.id + 100, "peer:carol@example.com": 10 ** 9}
+    assert chat_api.client.post("/sync", json={"cursors": cursors}).json() == {"conversations": []}
+
+    newer = chat.send_group(alice, "otra")
+    cursors["group:g"] = group_message.id
+    synced = _by_conversation(chat_api.client.post("/sync", json={"cursors": cursors}))
+    assert list(synced) == ["group:g"]
+    assert [m["id"] for m in synced["group:g"]["messages"]] == [newer.id]
@@ -0,0 +1,196 @@
+import threading
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+import app.model.models as mdls
+from app.db.coalescer import WriteCoalescer
+from app.db.db import Base
+from app.endpoints.chain import BlockchainManager
+from conftest import make_chat_user
+
+
+@pytest.fixture
+def file_db(tmp_path):
+    """File-backed SQLite so the writer thread gets its own connection."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'chat.db'}")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine, autoflush=False)
+    with factory() as db:
+        db.add_all([make_chat_user("alice@example.com"), make_chat_user("bob@example.com")])
+        db.commit()
+    commits = []
+    event.listen(engine, "commit", lambda conn: commits.append(1))
+    yield factory, commits
+    engine.dispose()
+
+
+def _insert_block_message(n):
+    def write(session):
+        row = mdls.BlockMessage(is_p2p=True, message_id=n, message_str=str(n), message_hash=str(n))
+        session.add(row)
+        session.flush()
+        return row
+    return write
+
+
+def test_concurrent_writes_share_one_commit(file_db):
+    factory, commits = file_db
+    coalescer = WriteCoalescer(factory, max_batch=8, max_delay=1.0)
+    futures = []
+    threads = [threading.Thread(target=lambda n=n: futures.append(coalescer.submit(_insert_block_message(n)))) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    rows = [future.result(timeout=5) for future in futures]
+    coalescer.close()
+
+    assert len(commits) == 1
+    assert sorted(row.id for row in rows) == list(range(1, 9))
+    # Rows are detached but keep their loaded columns
+    assert {row.message_str for row in rows} == {str(n) for n in range(8)}
+
+
+def test_failed_write_does_not_abort_the_batch(file_db):
+    factory, commits = file_db
+    coalescer = WriteCoalescer(factory, max_batch=3, max_delay=1.0)
+
+    def broken(session):
+        session.add(mdls.BlockMessage(is_p2p=True, message_id=99, message_str="x", message_hash="x"))
+        session.flush()
+        raise ValueError("bad row")
+
+    first = coalescer.submit(_insert_block_message(1))
+    failed = coalescer.submit(broken)
+    last = coalescer.submit(_insert_block_message(2))
+
+    assert first.result(timeout=5).id and last.result(timeout=5).id
+    with pytest.raises(ValueError):
+        failed.result(timeout=5)
+    coalescer.close()
+
+    with factory() as db:
+        assert sorted(m.message_id for m in db.query(mdls.BlockMessage)) == [1, 2]
+    assert len(commits) == 1
+
+
+def test_close_flushes_pending_writes(file_db):
+    factory, _ = file_db
+    coalescer = WriteCoalescer(factory, max_batch=100, max_delay=10.0)
+    future = coalescer.submit(_insert_block_message(1))
+    coalescer.close()
+    assert future.result(timeout=0).id == 1
+    assert coalescer.submit(_insert_block_message(2)).exception(timeout=0) is not None
+
+
+def test_coalesced_p2p_send_resolves_with_assigned_id(file_db):
+    factory, _ = file_db
+    coalescer = WriteCoalescer(factory, max_batch=10, max_delay=0.01)
+    with factory() as db:
+        users = mdls.get_users_by_emails(db, ["alice@example.com", "bob@example.com"])
+        msg = mdls.send_p2p_message(
+            db, users["alice@example.com"], users["bob@example.com"],
+            mdls.MessagePayload(message="hola", signed=False),
+            before_commit=lambda session, m: BlockchainManager(session).add_message(True, m),
+            coalescer=coalescer,
+        )
+    coalescer.close()
+
+    assert msg.id and msg.conversation_id
+    with factory() as db:
+        assert db.query(mdls.PeerMessage).one().id == msg.id
+        assert db.query(mdls.BlockMessage).one().message_id == msg.id
+        head = db.get(mdls.ConversationHead, mdls.p2p_conversation_key(msg.sender_id, msg.receiver_id))
+        assert head.last_message_id == msg.id
+
+
+def test_close_fails_writes_the_writer_never_reached(file_db):
+    factory, _ = file_db
+    coalescer = WriteCoalescer(factory, max_batch=1, max_delay=0.0)
+    release = threading.Event()
+
+    def stuck(session):
+        release.wait(5)
+        return None
+
+    first = coalescer.submit(stuck)
+    queued = coalescer.submit(_insert_block_message(1))
+    coalescer.close(timeout=0.1)
+
+    with pytest.raises(RuntimeError):
+        queued.result(timeout=0)
+    release.set()
+    assert first.result(timeout=5) is None
+    coalescer._writer.join(5)
+    assert not coalescer._writer.is_alive()
+
+
+def test_submits_racing_close_all_resolve(file_db):
+    factory, _ = file_db
+    coalescer = WriteCoalescer(factory, max_batch=4, max_delay=0.001)
+    futures = []
+    start = threading.Barrier(9)
+
+    def submitter(n):
+        start.wait()
+        futures.append(coalescer.submit(_insert_block_message(n)))
+
+    threads = [threading.Thread(target=submitter, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    coalescer.close()
+    for thread in threads:
+        thread.join()
+
+    # Written or rejected, but never left pending
+    for future in futures:
+        future.exception(timeout=0.5)
+
+
+def test_coalesced_send_gives_up_after_result_timeout(file_db, monkeypatch):
+    factory, _ = file_db
+    published = []
+    monkeypatch.setattr(mdls, "publish_p2p_message", lambda sender_id, receiver_id, message_id: published.append(message_id))
+    coalescer = WriteCoalescer(factory, max_batch=1, max_delay=0.0, result_timeout=0.1)
+    release = threading.Event()
+    coalescer.submit(lambda session: release.wait(5))
+    with factory() as db:
+        users = mdls.get_users_by_emails(db, ["alice@example.com", "bob@example.com"])
+        with pytest.raises(mdls.PendingWrite) as pending:
+            mdls.send_p2p_message(
+                db, users["alice@example.com"], users["bob@example.com"],
+                mdls.MessagePayload(message="hola", signed=False), coalescer=coalescer,
+            )
+    assert published == []
+    release.set()
+    coalescer.close()
+
+    # The send was still queued: it commits once, and is published then
+    with factory() as db:
+        stored = db.query(mdls.PeerMessage).one()
+    assert stored.hash == pending.value.hash
+    assert published == [stored.id]
+
+
+def test_send_route_answers_202_while_the_batch_is_pending(chat_api, monkeypatch):
+    from sqlalchemy.orm import sessionmaker
+    from app.endpoints import chat
+
+    coalescer = WriteCoalescer(sessionmaker(bind=chat_api.db.get_bind()), max_batch=1, max_delay=0.0, result_timeout=0.1)
+    monkeypatch.setattr(chat, "get_write_coalescer", lambda: coalescer)
+    release = threading.Event()
+    coalescer.submit(lambda session: release.wait(5))
+
+    response = chat_api.client.post("/messages/bob@example.com", json={"message": "hola", "signed": False})
+    assert response.status_code == 202
+    assert response.json()["status"] == "pending"
+    release.set()
+    coalescer.close()
+
+    chat_api.user = "bob@example.com"
+    [message] = chat_api.client.get("/messages/alice@example.com/bob@example.com").json()
+    assert message["hash"] == response.json()["hash"]